@@ -0,0 +1,61 @@
+"""
+Request body size limit for selected paths.
+
+A request whose Content-Length is above the limit gets 413 before any of its
+body is read. Bodies without a length (chunked) are counted as they are
+received: past the limit the application sees a disconnect, and whatever it
+answers is replaced by the 413.
+"""
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+
+class BodyLimitMiddleware:
+    def __init__(self, app, max_bytes: int, path_prefix: str):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_prefix = path_prefix
+
+    def _too_large(self) -> JSONResponse:
+        return JSONResponse(
+            {"detail": f"Request body too large, the limit is {self.max_bytes // (1024 * 1024)} MB"}, status_code=413
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            return await self.app(scope, receive, send)
+        length = Headers(scope=scope).get("content-length")
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            return await self._too_large()(scope, receive, send)
+
+        received = 0
+        exceeded = False
+        async def limited_receive():
+            nonlocal received, exceeded
+            if exceeded:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        replaced = False
+        async def checked_send(message):
+            nonlocal replaced
+            if exceeded:
+                if not replaced and message["type"] == "http.response.start":
+                    replaced = True
+                    await self._too_large()(scope, receive, send)
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, checked_send)
+        except Exception:
+            # The application failed on the cut-off body
+            if not exceeded:
+                raise
+            if not replaced:
+                await self._too_large()(scope, receive, send)
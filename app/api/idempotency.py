@@ -0,0 +1,118 @@
+"""
+`Idempotency-Key` header support for write requests.
+
+POST/PUT/PATCH/DELETE requests under /api/ that carry the header are run at
+most once per key (scoped to method, path and the caller's Authorization
+header). A retry gets the first response back, marked with
+`Idempotent-Replayed: true`, instead of posting the order or payment again.
+See app.services.idempotency for storage and expiry.
+
+- same key, different body: 422
+- same key while the first request is still running: 409
+- responses with status 5xx, or that are not JSON/text, are not stored: the
+  key is released and a retry runs the request again
+
+Meant for JSON write endpoints, the request body is buffered to hash it:
+bodies above MAX_BODY_BYTES get 413, and multipart requests (uploads, CSV
+imports) pass through without idempotency.
+"""
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse, Response
+
+from app.services import idempotency
+
+HEADER = "idempotency-key"
+METHODS = ("POST", "PUT", "PATCH", "DELETE")
+MAX_KEY_LENGTH = 255
+MAX_BODY_BYTES = 1024 * 1024
+STORED_CONTENT_TYPES = ("application/json", "text/")
+
+class IdempotencyMiddleware:
+    def __init__(self, app, path_prefix: str = "/api/"):
+        self.app = app
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in METHODS or not scope["path"].startswith(self.path_prefix):
+            return await self.app(scope, receive, send)
+        headers = Headers(scope=scope)
+        key = headers.get(HEADER)
+        if not key or headers.get("content-type", "").startswith("multipart/"):
+            return await self.app(scope, receive, send)
+        if len(key) > MAX_KEY_LENGTH:
+            return await JSONResponse({"detail": "Idempotency-Key too long"}, status_code=400)(scope, receive, send)
+        too_large = JSONResponse(
+            {"detail": f"Request body too large for Idempotency-Key, the limit is {MAX_BODY_BYTES // 1024} KB"}, status_code=413
+        )
+        length = headers.get("content-length")
+        if length is not None and length.isdigit() and int(length) > MAX_BODY_BYTES:
+            return await too_large(scope, receive, send)
+
+        parts, size = [], 0
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                return # Client went away
+            part = message.get("body", b"")
+            size += len(part)
+            if size > MAX_BODY_BYTES:
+                return await too_large(scope, receive, send)
+            parts.append(part)
+            if not message.get("more_body"):
+                break
+        body = b"".join(parts)
+
+        record_key = idempotency.record_key(key, scope["method"], scope["path"], headers.get("authorization"))
+        try:
+            stored = await run_in_threadpool(idempotency.store.claim, record_key, idempotency.request_hash(body))
+        except idempotency.KeyMismatch:
+            return await JSONResponse(
+                {"detail": "Idempotency-Key was already used with a different request"}, status_code=422
+            )(scope, receive, send)
+        except idempotency.KeyInProgress:
+            return await JSONResponse(
+                {"detail": "A request with this Idempotency-Key is still being processed"}, status_code=409
+            )(scope, receive, send)
+
+        if stored is not None:
+            replay = Response(
+                content=stored.body,
+                status_code=stored.status_code,
+                media_type=stored.content_type,
+                headers={"Idempotent-Replayed": "true"}
+            )
+            return await replay(scope, receive, send)
+
+        body_sent = False
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        status_code, content_type, chunks = None, None, []
+        async def capture_send(message):
+            nonlocal status_code, content_type
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                content_type = Headers(raw=message.get("headers", [])).get("content-type")
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        except BaseException:
+            await run_in_threadpool(idempotency.store.release, record_key)
+            raise
+
+        storable = status_code is not None and status_code < 500 and (content_type or "").startswith(STORED_CONTENT_TYPES)
+        if storable:
+            response = idempotency.StoredResponse(
+                idempotency.request_hash(body), status_code, content_type, b"".join(chunks).decode("utf-8", "replace")
+            )
+            await run_in_threadpool(idempotency.store.complete, record_key, response)
+        else:
+            await run_in_threadpool(idempotency.store.release, record_key)
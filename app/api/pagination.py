@@ -0,0 +1,85 @@
+"""
+Keyset (cursor) pagination for list endpoints.
+
+Lists are ordered by (sort column DESC, id DESC). The cursor is an opaque
+token holding the sort value and id of the last row returned; the next page
+continues strictly after it, so deep pages cost the same as the first one
+(given an index on (sort column, id)) and rows inserted meanwhile do not shift
+pages.
+
+List endpoints keep returning a plain list when no `cursor` is passed. Passing
+`cursor` (empty for the first page) returns `PageData` with `next_cursor`,
+and `total` when `with_total=true`.
+"""
+from datetime import date, datetime
+from typing import Any, Tuple
+import base64
+import json
+
+from fastapi import HTTPException
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import Query, Session
+
+from app.schemas.response import PageData
+
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(sort_value: Any, row_id: str) -> str:
+    if isinstance(sort_value, (date, datetime)):
+        sort_value = sort_value.isoformat()
+    raw = json.dumps([sort_value, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sort_column) -> Tuple[Any, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, row_id = json.loads(raw)
+        python_type = sort_column.type.python_type
+        if sort_value is not None and python_type in (date, datetime):
+            sort_value = python_type.fromisoformat(sort_value)
+        return sort_value, str(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_page(
+    db: Session,
+    query,
+    sort_column,
+    id_column,
+    cursor: str,
+    limit: int,
+    with_total: bool = False
+) -> PageData:
+    """
+    One page of `query` (an ORM Query or a select() of one entity, or of
+    columns including the sort and id columns) after `cursor`. The query
+    must not be ordered or limited yet.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    total = None
+    if with_total:
+        if isinstance(query, Query):
+            total = query.order_by(None).count()
+        else:
+            total = db.scalar(select(func.count()).select_from(query.order_by(None).subquery()))
+
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor, sort_column)
+        query = query.filter(or_(
+            sort_column < sort_value,
+            and_(sort_column == sort_value, id_column < row_id)
+        ))
+    query = query.order_by(sort_column.desc(), id_column.desc()).limit(limit + 1)
+    if isinstance(query, Query):
+        rows = query.all()
+    else:
+        result = db.execute(query)
+        rows = result.scalars().all() if len(result.keys()) == 1 else result.all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+    return PageData(items=rows, total=total, next_cursor=next_cursor)
@@ -0,0 +1,64 @@
+"""
+Sparse fieldsets for list endpoints.
+
+`fields=id,order_no,amount` selects only those columns: the query returns
+plain row tuples (no ORM instances, no identity map, no lazy loads) and the
+rows are validated by a response model holding just the requested fields,
+derived once per field set from the endpoint's full response model. Field
+types, and so the JSON output of each field, are the same as without
+`fields`.
+
+The id and the list's sort column are always included, keyset pagination
+needs them for `next_cursor`.
+"""
+from functools import lru_cache
+from typing import List, Optional, Tuple, Type, Union
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+from pydantic import BaseModel, create_model
+from sqlalchemy import inspect
+from sqlalchemy.orm import Query
+
+from app.schemas.response import PageData, ResponseModel
+
+def parse_fields(fields: Optional[str], model, schema: Type[BaseModel], required: Tuple[str, ...]) -> Optional[Tuple[str, ...]]:
+    """Validated column names of a `fields` parameter, None when not given."""
+    if not fields:
+        return None
+    names = list(required)
+    for name in (part.strip() for part in fields.split(",")):
+        if name and name not in names:
+            names.append(name)
+    columns = {attr.key for attr in inspect(model).column_attrs}
+    unknown = [name for name in names if name not in schema.model_fields or name not in columns]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return tuple(names)
+
+def project(query, model, names: Tuple[str, ...]):
+    """Restrict an ORM Query or a select() of `model` to the given columns."""
+    columns = [getattr(model, name) for name in names]
+    if isinstance(query, Query):
+        return query.with_entities(*columns)
+    return query.with_only_columns(*columns)
+
+@lru_cache(maxsize=128)
+def _item_model(schema: Type[BaseModel], names: Tuple[str, ...]) -> Type[BaseModel]:
+    return create_model(
+        f"{schema.__name__}Fields",
+        **{name: (schema.model_fields[name].annotation, schema.model_fields[name]) for name in names}
+    )
+
+def projected_response(data: Union[PageData, List], schema: Type[BaseModel], names: Tuple[str, ...]) -> Response:
+    """The success envelope of projected rows (a list or a PageData of them)."""
+    item = _item_model(schema, names)
+    if isinstance(data, PageData):
+        envelope = ResponseModel[PageData[item]](data={
+            "items": [row._mapping for row in data.items],
+            "total": data.total,
+            "next_cursor": data.next_cursor,
+        })
+    else:
+        envelope = ResponseModel[List[item]](data=[row._mapping for row in data])
+    return Response(content=envelope.model_dump_json(), media_type="application/json")
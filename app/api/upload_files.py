@@ -0,0 +1,61 @@
+"""
+Static serving of /uploads.
+
+Like StaticFiles, plus the fallback of app.services.uploads.resolve: a flat
+URL from before the sharded layout (`/uploads/<name>`) is served from the
+file's shard (`/uploads/ab/cd/<name>`), so links stored before the migration
+keep working.
+
+`?size=N` (one of THUMBNAIL_SIZES) serves the file's preview from
+app.services.thumbnails instead. While a preview does not exist yet it is
+queued and the original is served.
+"""
+from typing import Optional
+from urllib.parse import parse_qs
+import os
+
+import anyio
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+from app.core.config import settings
+from app.services import thumbnails, uploads
+
+class UploadFiles(StaticFiles):
+    def lookup_path(self, path: str):
+        full_path, stat_result = super().lookup_path(path)
+        if stat_result is None and path and "/" not in path and os.sep not in path:
+            return super().lookup_path(uploads.shard_path(path))
+        return full_path, stat_result
+
+    def lookup_thumbnail(self, path: str, size: int):
+        """(path, stat) of the preview of a file, or None to serve the file itself."""
+        full_path, stat_result = self.lookup_path(path)
+        if stat_result is None or thumbnails.is_thumbnail(full_path):
+            return None # A preview is served as is, never previewed itself
+        thumbnail = thumbnails.path_for(full_path, size)
+        try:
+            return thumbnail, os.stat(thumbnail)
+        except FileNotFoundError:
+            thumbnails.submit(full_path)
+            return None
+
+    @staticmethod
+    def _requested_size(scope: Scope) -> Optional[int]:
+        values = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("size")
+        if not values or not values[0].isdigit():
+            return None
+        size = int(values[0])
+        return size if size in settings.THUMBNAIL_SIZES else None
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        size = self._requested_size(scope)
+        if size is not None and scope["method"] in ("GET", "HEAD"):
+            try:
+                found = await anyio.to_thread.run_sync(self.lookup_thumbnail, path, size)
+            except (OSError, ValueError):
+                found = None # Left to StaticFiles, which answers with the matching error
+            if found is not None:
+                return self.file_response(*found, scope)
+        return await super().get_response(path, scope)
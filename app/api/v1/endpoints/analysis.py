@@ -1,22 +1,20 @@
-from typing import Any, List
+from typing import Any, List, Optional
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func, extract, and_, or_
-from datetime import datetime, timedelta
+from sqlalchemy import func, and_, case
+from datetime import date, datetime, timedelta
 import calendar
 
 from app.api import deps
 from app.schemas import analysis as schemas
 from app.schemas.response import ResponseModel, success
 from app.models.order import Order
-from app.models.payment import PaymentRecord
 from app.models.client import Client, FollowUp
-# Try import Plugin Model
-try:
-    from app.modules.plugins.commercial_kit.models import LicenseRecord
-except ImportError:
-    LicenseRecord = None
-from app.models.cost import Cost
+from app.models.rollup import (
+    SalesDailyRollup, PaymentDailyRollup, CostDailyRollup, ClientDailyRollup, TrialDailyRollup
+)
+from app.db.dates import as_date, date_bucket, bucket_label, bucket_labels, day_range, shift_range
+from app.services import analysis_cache, columnar, ledger
 
 router = APIRouter()
 
@@ -24,17 +22,13 @@ def get_date_range_and_grouping(time_dimension: str, year: str, month_range: Lis
     """
     Determine the date range and grouping strategy (day or month).
     Returns: (start_date, end_date, group_by_mode, labels)
-    group_by_mode: 'day' or 'month'
+    group_by_mode: 'day' or 'month' (a unit of app.db.dates)
     labels: list of strings (e.g. ['2025-01-01', ...] or ['2025-01', ...])
     """
-    labels = []
-    
     if time_dimension == 'year':
         start_date = datetime.strptime(f"{year}-01-01", "%Y-%m-%d")
         end_date = datetime.strptime(f"{year}-12-31 23:59:59", "%Y-%m-%d %H:%M:%S")
         group_by_mode = 'month'
-        for i in range(1, 13):
-            labels.append(f"{year}-{i:02d}")
             
     else: # month
         if not month_range or len(month_range) != 2:
@@ -43,236 +37,146 @@ def get_date_range_and_grouping(time_dimension: str, year: str, month_range: Lis
             month_range = [now.strftime("%Y-%m"), now.strftime("%Y-%m")]
 
         start_str, end_str = month_range
+        start_y, start_m = map(int, start_str.split('-'))
+        end_y, end_m = map(int, end_str.split('-'))
+        _, last_day_end = calendar.monthrange(end_y, end_m)
+        start_date = datetime(start_y, start_m, 1)
+        end_date = datetime(end_y, end_m, last_day_end, 23, 59, 59)
         
-        if start_str == end_str:
-            # Same month -> Show days
-            y, m = map(int, start_str.split('-'))
-            _, last_day = calendar.monthrange(y, m)
-            start_date = datetime(y, m, 1)
-            end_date = datetime(y, m, last_day, 23, 59, 59)
-            group_by_mode = 'day'
-            
-            for d in range(1, last_day + 1):
-                labels.append(f"{y}-{m:02d}-{d:02d}")
-        else:
-            # Different months -> Show months
-            start_y, start_m = map(int, start_str.split('-'))
-            end_y, end_m = map(int, end_str.split('-'))
-            
-            start_date = datetime(start_y, start_m, 1)
-            _, last_day_end = calendar.monthrange(end_y, end_m)
-            end_date = datetime(end_y, end_m, last_day_end, 23, 59, 59)
-            group_by_mode = 'month'
-            
-            # Generate month labels
-            curr = start_date
-            while curr <= end_date:
-                labels.append(curr.strftime("%Y-%m"))
-                # Move to next month
-                if curr.month == 12:
-                    curr = datetime(curr.year + 1, 1, 1)
-                else:
-                    curr = datetime(curr.year, curr.month + 1, 1)
-
-    return start_date, end_date, group_by_mode, labels
+        # Same month -> Show days, different months -> Show months
+        group_by_mode = 'day' if start_str == end_str else 'month'
+
+    return start_date, end_date, group_by_mode, bucket_labels(start_date, end_date, group_by_mode)
 
 def get_prev_date_range(start_date: datetime, end_date: datetime, time_dimension: str):
     """
     Get previous period date range.
     If year: Same period last year.
-    If month: Previous month.
+    If month: Previous month (a month-end stays a month-end).
     """
     try:
-        if time_dimension == 'year':
-            prev_start = start_date.replace(year=start_date.year - 1)
-            try:
-                prev_end = end_date.replace(year=end_date.year - 1)
-            except ValueError:
-                # Handle leap year (Feb 29 -> Feb 28)
-                prev_end = end_date.replace(year=end_date.year - 1, day=28)
-            return prev_start, prev_end
-        else:
-            # Shift back by 1 month
-            # Calculate previous start date
-            year = start_date.year
-            month = start_date.month - 1
-            if month == 0:
-                month = 12
-                year -= 1
-            prev_start = start_date.replace(year=year, month=month)
-            
-            # Calculate previous end date
-            # Logic: If end_date is the last day of the month, prev_end should be the last day of the previous month.
-            # If end_date is not the last day (e.g. current partial month), try to keep the same day.
-            
-            end_year = end_date.year
-            end_month = end_date.month - 1
-            if end_month == 0:
-                end_month = 12
-                end_year -= 1
-                
-            # Check if original end_date was the last day of its month
-            _, original_last_day = calendar.monthrange(end_date.year, end_date.month)
-            is_last_day = (end_date.day == original_last_day)
-            
-            _, prev_last_day = calendar.monthrange(end_year, end_month)
-            
-            if is_last_day:
-                day = prev_last_day
-            else:
-                day = min(end_date.day, prev_last_day)
-                
-            prev_end = end_date.replace(year=end_year, month=end_month, day=day)
-            
-            return prev_start, prev_end
-
+        return shift_range(start_date, end_date, 'year' if time_dimension == 'year' else 'month', -1)
     except Exception:
         # Fallback
         return start_date, end_date
 
-def get_order_filters(order_type: str):
-    filters = []
-    if order_type and order_type != 'all':
-        if order_type == 'new':
-            filters.append(Order.order_type == 'NEW')
-        elif order_type == 'renew':
-            filters.append(Order.order_type == 'RENEW')
-        elif order_type == 'upsell':
-            filters.append(Order.order_type == 'UPSELL')
-        elif order_type == 'service':
-            filters.append(Order.order_type == 'SERVICE')
-        elif order_type == 'implementation':
-            filters.append(Order.order_type == 'IMPLEMENTATION')
-        elif order_type == 'renewal': # Backward compatibility
-            filters.append(Order.order_type.in_(['RENEW', 'UPSELL']))
-    return filters
+# Request order_type -> Order.order_type values
+ORDER_TYPE_FILTERS = {
+    'new': ['NEW'],
+    'renew': ['RENEW'],
+    'upsell': ['UPSELL'],
+    'service': ['SERVICE'],
+    'implementation': ['IMPLEMENTATION'],
+    'renewal': ['RENEW', 'UPSELL'], # Backward compatibility
+}
 
-@router.post("/summary", response_model=ResponseModel[schemas.AnalysisSummaryResponse])
-def get_summary(
-    request: schemas.AnalysisTrendRequest,
-    db: Session = Depends(deps.get_db)
-) -> Any:
+def get_order_types(order_type: str) -> Optional[List[str]]:
+    """Order types selected by the request, None for all."""
+    if not order_type or order_type == 'all':
+        return None
+    return ORDER_TYPE_FILTERS.get(order_type)
+
+def get_order_filters(order_type: str, column=None):
+    """Order type filters, applied to `Order.order_type` or a rollup column."""
+    if column is None:
+        column = Order.order_type
+    order_types = get_order_types(order_type)
+    if order_types is None:
+        return []
+    return [column.in_(order_types)]
+
+def get_bucket_edges(labels: List[str]) -> List[date]:
+    """First day of each bucket label ('YYYY-MM' or 'YYYY-MM-DD'), for the columnar engine."""
+    edges = []
+    for label in labels:
+        parts = [int(p) for p in label.split('-')]
+        edges.append(date(parts[0], parts[1], parts[2] if len(parts) > 2 else 1))
+    return edges
+
+def sum_in_range(field, day_column, start: datetime = None, end: datetime = None):
+    """SUM(CASE WHEN day in [start, end] THEN field ELSE 0 END) for conditional aggregation."""
+    conditions = day_range(day_column, start, end)
+    return func.coalesce(func.sum(case((and_(*conditions), field), else_=0)), 0)
+
+def build_summary(db: Session, request: schemas.AnalysisTrendRequest) -> schemas.AnalysisSummaryResponse:
     """
-    Get Summary Cards Data.
-    Trial Count: From LicenseRecord
-    Order Count: From Order (created_at)
-    Sales Amount: From Order (amount)
-    Collection Amount: From PaymentRecord (amount, type=1)
-    Pending Amount: Cumulative (Total Order Amount <= EndDate - Total Collection Amount <= EndDate)
+    Compute the summary cards with one conditional-aggregation pass per rollup
+    table: current and previous period figures come back together instead of
+    one scalar query each. Pending amounts are read from the receivables ledger.
     """
     start_date, end_date, _, _ = get_date_range_and_grouping(
         request.time_dimension, request.year, request.month_range
     )
     prev_start_date, prev_end_date = get_prev_date_range(start_date, end_date, request.time_dimension)
-    
-    # --- Helper Queries ---
-    def get_count(model, start, end):
-        q = db.query(func.count(model.id)).filter(
-            model.created_at >= start,
-            model.created_at <= end
-        )
-        return q.scalar() or 0
-
-    def get_sum(model, field, start, end, filters=[]):
-        q = db.query(func.sum(field)).filter(
-            model.created_at >= start,
-            model.created_at <= end,
-            *filters
-        )
-        return q.scalar() or 0.0
-    
-    def get_payment_sum(start, end):
-        q = db.query(func.sum(PaymentRecord.amount)).filter(
-            PaymentRecord.pay_time >= start,
-            PaymentRecord.pay_time <= end,
-            PaymentRecord.type == 1
-        )
-        return q.scalar() or 0.0
+    scan_start = min(start_date, prev_start_date)
+    scan_end = max(end_date, prev_end_date)
 
     # 1. Trial Count (LicenseRecord)
-    if LicenseRecord:
-        trial_count = get_count(LicenseRecord, start_date, end_date)
-        prev_trial_count = get_count(LicenseRecord, prev_start_date, prev_end_date)
-    else:
-        trial_count = 0
-        prev_trial_count = 0
-    trial_growth = trial_count - prev_trial_count # Value difference
-    
-    # 2. Order Count
-    # Filter by order_type if needed? Usually summary includes all unless specified.
-    # Request has order_type. Let's respect it.
-    order_filters = get_order_filters(request.order_type)
-            
-    order_count = get_count(Order, start_date, end_date) # Note: get_count helper doesn't take filters
-    # Refined get_count with filters
-    order_q = db.query(func.count(Order.id)).filter(
-        Order.created_at >= start_date,
-        Order.created_at <= end_date,
-        *order_filters
+    trial_count, prev_trial_count = db.query(
+        sum_in_range(TrialDailyRollup.trial_count, TrialDailyRollup.day, start_date, end_date),
+        sum_in_range(TrialDailyRollup.trial_count, TrialDailyRollup.day, prev_start_date, prev_end_date)
+    ).filter(
+        *day_range(TrialDailyRollup.day, scan_start, scan_end)
+    ).one()
+    
+    # 2. Orders: count and sales (Request has order_type. Let's respect it.)
+    order_count, prev_order_count, sales_amount, sales_compare_amount = db.query(
+        sum_in_range(SalesDailyRollup.order_count, SalesDailyRollup.day, start_date, end_date),
+        sum_in_range(SalesDailyRollup.order_count, SalesDailyRollup.day, prev_start_date, prev_end_date),
+        sum_in_range(SalesDailyRollup.amount, SalesDailyRollup.day, start_date, end_date),
+        sum_in_range(SalesDailyRollup.amount, SalesDailyRollup.day, prev_start_date, prev_end_date)
+    ).filter(
+        *day_range(SalesDailyRollup.day, scan_start, scan_end),
+        *get_order_filters(request.order_type, SalesDailyRollup.order_type)
+    ).one()
+    
+    # 3. Collections (PaymentRecord type=1, rolled up by the order's type)
+    collection_amount, prev_collection_amount = db.query(
+        sum_in_range(PaymentDailyRollup.amount, PaymentDailyRollup.day, start_date, end_date),
+        sum_in_range(PaymentDailyRollup.amount, PaymentDailyRollup.day, prev_start_date, prev_end_date)
+    ).filter(
+        *day_range(PaymentDailyRollup.day, scan_start, scan_end),
+        PaymentDailyRollup.type == 1,
+        *get_order_filters(request.order_type, PaymentDailyRollup.order_type)
+    ).one()
+
+    # 4. Pending Amount as of the end of both periods
+    pending_amount, prev_pending_amount = get_pending_amounts(db, request, end_date, prev_end_date)
+
+    return build_summary_response(
+        trial_count, prev_trial_count, order_count, prev_order_count,
+        sales_amount, sales_compare_amount, collection_amount, prev_collection_amount,
+        pending_amount, prev_pending_amount
     )
-    order_count = order_q.scalar() or 0
+
+def get_pending_amounts(db: Session, request: schemas.AnalysisTrendRequest, end_date: datetime, prev_end_date: datetime):
+    """
+    Cumulative (Total Order Amount <= EndDate - Total Collection Amount <= EndDate)
+    at both period ends, one ledger checkpoint lookup per order type each.
+    """
+    order_types = get_order_types(request.order_type)
+    pending_amount, _ = ledger.balances_as_of(db, end_date, order_types)
+    prev_pending_amount, _ = ledger.balances_as_of(db, prev_end_date, order_types)
+    return pending_amount, prev_pending_amount
+
+def build_summary_response(
+    trial_count, prev_trial_count, order_count, prev_order_count,
+    sales_amount, sales_compare_amount, collection_amount, prev_collection_amount,
+    pending_amount, prev_pending_amount
+) -> schemas.AnalysisSummaryResponse:
+    trial_count, prev_trial_count = int(trial_count), int(prev_trial_count)
+    trial_growth = trial_count - prev_trial_count # Value difference
     
-    prev_order_q = db.query(func.count(Order.id)).filter(
-        Order.created_at >= prev_start_date,
-        Order.created_at <= prev_end_date,
-        *order_filters
-    )
-    prev_order_count = prev_order_q.scalar() or 0
+    order_count, prev_order_count = int(order_count), int(prev_order_count)
     order_growth = order_count - prev_order_count
     
-    # 3. Sales Amount
-    sales_amount = get_sum(Order, Order.amount, start_date, end_date, order_filters)
-    sales_compare_amount = get_sum(Order, Order.amount, prev_start_date, prev_end_date, order_filters)
-    
-    # 4. Collection Amount (PaymentRecord)
-    # Payment doesn't have order_type directly. Need join if filtering.
-    coll_q = db.query(func.sum(PaymentRecord.amount)).join(Order).filter(
-        PaymentRecord.pay_time >= start_date,
-        PaymentRecord.pay_time <= end_date,
-        PaymentRecord.type == 1,
-        *order_filters
-    )
-    collection_amount = coll_q.scalar() or 0.0
-    
-    prev_coll_q = db.query(func.sum(PaymentRecord.amount)).join(Order).filter(
-        PaymentRecord.pay_time >= prev_start_date,
-        PaymentRecord.pay_time <= prev_end_date,
-        PaymentRecord.type == 1,
-        *order_filters
-    )
-    prev_collection_amount = prev_coll_q.scalar() or 0.0
     collection_growth = float(collection_amount) - float(prev_collection_amount)
 
-    # 5. Pending Amount (Cumulative Logic)
-    # Total Order Amount (created <= end_date) - Total Collection Amount (pay_time <= end_date)
-    # Filtered by order_type if requested
-    
-    # Total Sales up to End Date
-    cum_sales_q = db.query(func.sum(Order.amount)).filter(
-        Order.created_at <= end_date,
-        *order_filters
-    )
-    cum_sales = cum_sales_q.scalar() or 0.0
-    
-    # Total Collection up to End Date (for those orders? Or just total collection?)
-    # "All these orders' collection amounts"
-    # If filtered by order type, we need to join Order.
-    # If we filter Orders by creation date <= EndDate, we should sum payments FOR THOSE ORDERS.
-    # But usually, just "Total Payments <= EndDate" is easier and functionally close if we assume payments come after orders.
-    # However, strict interpretation: Payments linked to orders created <= EndDate.
-    # Let's stick to simple: Total Payments <= EndDate.
-    
-    cum_coll_q = db.query(func.sum(PaymentRecord.amount)).join(Order).filter(
-        PaymentRecord.pay_time <= end_date,
-        PaymentRecord.type == 1,
-        *order_filters
-    )
-    cum_coll = cum_coll_q.scalar() or 0.0
-    
-    pending_amount = float(cum_sales) - float(cum_coll)
-    pending_growth = 0.0 # Not really applicable or complex to calc previous pending
+    # Pending Amount (Cumulative Logic), growth against the previous period end
+    pending_amount = float(pending_amount)
+    pending_growth = pending_amount - float(prev_pending_amount)
     
-    return success(schemas.AnalysisSummaryResponse(
+    return schemas.AnalysisSummaryResponse(
         trial_count=trial_count,
         trial_growth=trial_growth,
         order_count=order_count,
@@ -283,78 +187,88 @@ def get_summary(
         collection_growth=collection_growth,
         pending_amount=pending_amount,
         pending_growth=pending_growth
-    ))
+    )
 
-@router.post("/trend", response_model=ResponseModel[schemas.AnalysisTrendResponse])
-def get_trend(
+@router.post("/summary", response_model=ResponseModel[schemas.AnalysisSummaryResponse])
+def get_summary(
     request: schemas.AnalysisTrendRequest,
     db: Session = Depends(deps.get_db)
 ) -> Any:
     """
-    Get Sales & Collection Trend data.
-    Sales: Order Amount (created_at, status != VOID/CANCELLED)
-    Collection: Payment Amount (pay_time, type=1)
-    Trial: LicenseRecord Count (created_at)
+    Get Summary Cards Data.
+    Trial Count: From LicenseRecord
+    Order Count: From Order (created_at)
+    Sales Amount: From Order (amount)
+    Collection Amount: From PaymentRecord (amount, type=1)
+    Pending Amount: Cumulative (Total Order Amount <= EndDate - Total Collection Amount <= EndDate),
+    read from the receivables ledger; growth is against the previous period's end
     """
+    return success(analysis_cache.cached(db, "summary", request, lambda: build_summary(db, request)))
+
+def build_trend(db: Session, request: schemas.AnalysisTrendRequest) -> schemas.AnalysisTrendResponse:
+    """Compute the sales / collection / trial trend series."""
     start_date, end_date, group_by_mode, labels = get_date_range_and_grouping(
         request.time_dimension, request.year, request.month_range
     )
     
     # Initialize data dictionary
     data_map = {label: {"sales": 0.0, "collection": 0.0, "trial": 0} for label in labels}
+
+    engine = columnar.get_engine(db)
+    if engine is not None:
+        edges = get_bucket_edges(labels)
+        order_types = get_order_types(request.order_type)
+        sales = engine.sales_by_bucket(start_date, end_date, edges, order_types, exclude_statuses=['VOID', 'CANCELLED'])
+        collection = engine.payments_by_bucket(start_date, end_date, edges, 1, order_types)
+        trials = engine.trials_by_bucket(start_date, end_date, edges)
+        for i, label in enumerate(labels):
+            data_map[label] = {"sales": float(sales[i]), "collection": float(collection[i]), "trial": int(trials[i])}
+        return build_trend_response(labels, data_map)
     
     # 1. Sales (Orders)
-    order_filters = get_order_filters(request.order_type)
-    orders_query = db.query(Order).filter(
-        Order.created_at >= start_date,
-        Order.created_at <= end_date,
-        Order.status.notin_(['VOID', 'CANCELLED']),
-        *order_filters
-    )
-
-    orders = orders_query.all()
+    sales_q = db.query(
+        date_bucket(SalesDailyRollup.day, group_by_mode).label('d'),
+        func.sum(SalesDailyRollup.amount)
+    ).filter(
+        *day_range(SalesDailyRollup.day, start_date, end_date),
+        SalesDailyRollup.status.notin_(['VOID', 'CANCELLED']),
+        *get_order_filters(request.order_type, SalesDailyRollup.order_type)
+    ).group_by('d')
     
-    for order in orders:
-        if not order.created_at: continue
-        key = order.created_at.strftime("%Y-%m" if group_by_mode == 'month' else "%Y-%m-%d")
-        if key in data_map:
-            data_map[key]["sales"] += float(order.amount or 0)
+    for date_str, amount in sales_q.all():
+        if date_str in data_map:
+            data_map[date_str]["sales"] = float(amount or 0)
 
     # 2. Collection (PaymentRecords)
-    payments_query = db.query(PaymentRecord).join(Order).filter(
-        PaymentRecord.pay_time >= start_date,
-        PaymentRecord.pay_time <= end_date,
-        PaymentRecord.type == 1, # Collection
-        *order_filters
-    )
-            
-    payments = payments_query.all()
+    payment_q = db.query(
+        date_bucket(PaymentDailyRollup.day, group_by_mode).label('d'),
+        func.sum(PaymentDailyRollup.amount)
+    ).filter(
+        *day_range(PaymentDailyRollup.day, start_date, end_date),
+        PaymentDailyRollup.type == 1, # Collection
+        *get_order_filters(request.order_type, PaymentDailyRollup.order_type)
+    ).group_by('d')
     
-    for payment in payments:
-        if not payment.pay_time: continue
-        key = payment.pay_time.strftime("%Y-%m" if group_by_mode == 'month' else "%Y-%m-%d")
-        if key in data_map:
-            data_map[key]["collection"] += float(payment.amount or 0)
+    for date_str, amount in payment_q.all():
+        if date_str in data_map:
+            data_map[date_str]["collection"] = float(amount or 0)
             
     # 3. Trial (LicenseRecord)
-    # Trials are count of LicenseRecords
-    if LicenseRecord:
-        trials_query = db.query(LicenseRecord).filter(
-            LicenseRecord.created_at >= start_date,
-            LicenseRecord.created_at <= end_date
-        )
-        # LicenseRecord has no order_type link, so we ignore order_type filter for trials
-        trials = trials_query.all()
-    else:
-        trials = []
+    # LicenseRecord has no order_type link, so we ignore order_type filter for trials
+    trial_q = db.query(
+        date_bucket(TrialDailyRollup.day, group_by_mode).label('d'),
+        func.sum(TrialDailyRollup.trial_count)
+    ).filter(
+        *day_range(TrialDailyRollup.day, start_date, end_date)
+    ).group_by('d')
     
-    for trial in trials:
-        if not trial.created_at: continue
-        key = trial.created_at.strftime("%Y-%m" if group_by_mode == 'month' else "%Y-%m-%d")
-        if key in data_map:
-            data_map[key]["trial"] += 1
-            
-    # Format response
+    for date_str, count in trial_q.all():
+        if date_str in data_map:
+            data_map[date_str]["trial"] = int(count or 0)
+
+    return build_trend_response(labels, data_map)
+
+def build_trend_response(labels: List[str], data_map: dict) -> schemas.AnalysisTrendResponse:
     series = []
     for label in labels:
         item = data_map[label]
@@ -365,19 +279,26 @@ def get_trend(
             trial_count=item["trial"]
         ))
         
-    return success(schemas.AnalysisTrendResponse(
+    return schemas.AnalysisTrendResponse(
         xAxis=labels,
         series=series
-    ))
+    )
 
-@router.post("/comparison", response_model=ResponseModel[schemas.AnalysisComparisonResponse])
-def get_comparison(
+@router.post("/trend", response_model=ResponseModel[schemas.AnalysisTrendResponse])
+def get_trend(
     request: schemas.AnalysisTrendRequest,
     db: Session = Depends(deps.get_db)
 ) -> Any:
     """
-    Get Customer Comparison (Enterprise vs Personal).
+    Get Sales & Collection Trend data.
+    Sales: Order Amount (created_at, status != VOID/CANCELLED)
+    Collection: Payment Amount (pay_time, type=1)
+    Trial: LicenseRecord Count (created_at)
     """
+    return success(analysis_cache.cached(db, "trend", request, lambda: build_trend(db, request)))
+
+def build_comparison(db: Session, request: schemas.AnalysisTrendRequest) -> schemas.AnalysisComparisonResponse:
+    """Compute enterprise vs personal sales and trials per bucket."""
     start_date, end_date, group_by_mode, labels = get_date_range_and_grouping(
         request.time_dimension, request.year, request.month_range
     )
@@ -386,46 +307,60 @@ def get_comparison(
         "ent_sales": 0.0, "per_sales": 0.0, 
         "ent_trial": 0, "per_trial": 0
     } for label in labels}
+
+    engine = columnar.get_engine(db)
+    if engine is not None:
+        edges = get_bucket_edges(labels)
+        ent_sales, per_sales = engine.sales_by_bucket(
+            start_date, end_date, edges, get_order_types(request.order_type),
+            exclude_statuses=['VOID', 'CANCELLED'], split_client_type=True
+        )
+        ent_trial, per_trial = engine.trials_by_bucket(start_date, end_date, edges, split_client_type=True)
+        for i, label in enumerate(labels):
+            data_map[label] = {
+                "ent_sales": float(ent_sales[i]), "per_sales": float(per_sales[i]),
+                "ent_trial": int(ent_trial[i]), "per_trial": int(per_trial[i])
+            }
+        return build_comparison_response(labels, data_map)
+    
+    # 1. Sales (rolled up with the client type, orders without a client are skipped)
+    # Enterprise (1) and Personal (0) are split with CASE, one row per bucket
+    is_enterprise = SalesDailyRollup.client_type == 1
+    sales_q = db.query(
+        date_bucket(SalesDailyRollup.day, group_by_mode).label('d'),
+        func.sum(case((is_enterprise, SalesDailyRollup.amount), else_=0)),
+        func.sum(case((is_enterprise, 0), else_=SalesDailyRollup.amount))
+    ).filter(
+        *day_range(SalesDailyRollup.day, start_date, end_date),
+        SalesDailyRollup.status.notin_(['VOID', 'CANCELLED']),
+        SalesDailyRollup.client_type.isnot(None),
+        *get_order_filters(request.order_type, SalesDailyRollup.order_type)
+    ).group_by('d')
     
-    # 1. Sales (Orders joined with Client)
-    order_filters = get_order_filters(request.order_type)
-    orders = db.query(Order).join(Client).filter(
-        Order.created_at >= start_date,
-        Order.created_at <= end_date,
-        Order.status.notin_(['VOID', 'CANCELLED']),
-        *order_filters
-    ).all()
-    
-    for order in orders:
-        if not order.created_at: continue
-        key = order.created_at.strftime("%Y-%m" if group_by_mode == 'month' else "%Y-%m-%d")
-        if key in data_map:
-            if order.client.type == 1: # Enterprise
-                data_map[key]["ent_sales"] += float(order.amount or 0)
-            else: # Personal (0)
-                data_map[key]["per_sales"] += float(order.amount or 0)
-                
-    # 2. Trials (LicenseRecords joined with Client)
-    # Join LicenseRecord with Client on name to get client type
-    if LicenseRecord:
-        trials = db.query(LicenseRecord, Client.type).join(
-            Client, LicenseRecord.customer_name == Client.name
-        ).filter(
-            LicenseRecord.created_at >= start_date,
-            LicenseRecord.created_at <= end_date
-        ).all()
-    else:
-        trials = []
-    
-    for trial, client_type in trials:
-        if not trial.created_at: continue
-        key = trial.created_at.strftime("%Y-%m" if group_by_mode == 'month' else "%Y-%m-%d")
-        if key in data_map:
-            if client_type == 1: # Enterprise
-                data_map[key]["ent_trial"] += 1
-            else: # Personal
-                data_map[key]["per_trial"] += 1
+    for date_str, ent_amount, per_amount in sales_q.all():
+        if date_str in data_map:
+            data_map[date_str]["ent_sales"] = float(ent_amount or 0)
+            data_map[date_str]["per_sales"] = float(per_amount or 0)
                 
+    # 2. Trials (client type matched by customer name when rolled up)
+    is_enterprise = TrialDailyRollup.client_type == 1
+    trial_q = db.query(
+        date_bucket(TrialDailyRollup.day, group_by_mode).label('d'),
+        func.sum(case((is_enterprise, TrialDailyRollup.trial_count), else_=0)),
+        func.sum(case((is_enterprise, 0), else_=TrialDailyRollup.trial_count))
+    ).filter(
+        *day_range(TrialDailyRollup.day, start_date, end_date),
+        TrialDailyRollup.client_type.isnot(None)
+    ).group_by('d')
+    
+    for date_str, ent_count, per_count in trial_q.all():
+        if date_str in data_map:
+            data_map[date_str]["ent_trial"] = int(ent_count or 0)
+            data_map[date_str]["per_trial"] = int(per_count or 0)
+
+    return build_comparison_response(labels, data_map)
+
+def build_comparison_response(labels: List[str], data_map: dict) -> schemas.AnalysisComparisonResponse:
     series = []
     for label in labels:
         item = data_map[label]
@@ -437,37 +372,62 @@ def get_comparison(
             personal_trial=item["per_trial"]
         ))
         
-    return success(schemas.AnalysisComparisonResponse(
+    return schemas.AnalysisComparisonResponse(
         xAxis=labels,
         series=series
-    ))
+    )
 
-@router.post("/distribution", response_model=ResponseModel[schemas.AnalysisDistributionResponse])
-def get_distribution(
+@router.post("/comparison", response_model=ResponseModel[schemas.AnalysisComparisonResponse])
+def get_comparison(
     request: schemas.AnalysisTrendRequest,
     db: Session = Depends(deps.get_db)
 ) -> Any:
     """
-    Get Order Distribution (Type & Status).
+    Get Customer Comparison (Enterprise vs Personal).
     """
+    return success(analysis_cache.cached(db, "comparison", request, lambda: build_comparison(db, request)))
+
+def build_distribution(db: Session, request: schemas.AnalysisTrendRequest) -> schemas.AnalysisDistributionResponse:
+    """Compute order amount by type and order count by status."""
     start_date, end_date, _, _ = get_date_range_and_grouping(
         request.time_dimension, request.year, request.month_range
     )
     
     # 1. Order Type Distribution (Sum of Amount)
     # Types: NEW, RENEW, UPSELL
-    order_filters = get_order_filters(request.order_type)
+    order_filters = get_order_filters(request.order_type, SalesDailyRollup.order_type)
+    engine = columnar.get_engine(db)
     
-    type_query = db.query(
-        Order.order_type, 
-        func.sum(Order.amount)
-    ).filter(
-        Order.created_at >= start_date,
-        Order.created_at <= end_date,
-        Order.status.notin_(['VOID', 'CANCELLED']),
-        *order_filters
-    ).group_by(Order.order_type).all()
+    if engine is not None:
+        type_query = engine.sales_by_type(
+            start_date, end_date, get_order_types(request.order_type), exclude_statuses=['VOID', 'CANCELLED']
+        ).items()
+    else:
+        type_query = db.query(
+            SalesDailyRollup.order_type, 
+            func.sum(SalesDailyRollup.amount)
+        ).filter(
+            *day_range(SalesDailyRollup.day, start_date, end_date),
+            SalesDailyRollup.status.notin_(['VOID', 'CANCELLED']),
+            *order_filters
+        ).group_by(SalesDailyRollup.order_type).all()
     
+    # 2. Order Status Distribution (Count of Orders)
+    if engine is not None:
+        status_query = engine.orders_by_status(start_date, end_date, get_order_types(request.order_type)).items()
+    else:
+        status_query = db.query(
+            SalesDailyRollup.status,
+            func.sum(SalesDailyRollup.order_count)
+        ).filter(
+            *day_range(SalesDailyRollup.day, start_date, end_date),
+            *order_filters
+        ).group_by(SalesDailyRollup.status).all()
+        
+    return build_distribution_response(type_query, status_query)
+
+def build_distribution_response(type_query, status_query) -> schemas.AnalysisDistributionResponse:
+    """Map (order_type, amount) and (status, count) rows to labelled items."""
     type_map = {
         "NEW": "新购",
         "RENEW": "续费",
@@ -483,16 +443,6 @@ def get_distribution(
                 name=type_map[type_code],
                 value=float(amount or 0)
             ))
-            
-    # 2. Order Status Distribution (Count of Orders)
-    status_query = db.query(
-        Order.status,
-        func.count(Order.id)
-    ).filter(
-        Order.created_at >= start_date,
-        Order.created_at <= end_date,
-        *order_filters
-    ).group_by(Order.status).all()
     
     status_map = {
         "PAID": "已成交",
@@ -513,19 +463,23 @@ def get_distribution(
             value=int(count or 0)
         ))
         
-    return success(schemas.AnalysisDistributionResponse(
+    return schemas.AnalysisDistributionResponse(
         order_type=type_data,
         order_status=status_data
-    ))
+    )
 
-@router.get("/activities", response_model=ResponseModel[schemas.AnalysisActivitiesResponse])
-def get_activities(
+@router.post("/distribution", response_model=ResponseModel[schemas.AnalysisDistributionResponse])
+def get_distribution(
+    request: schemas.AnalysisTrendRequest,
     db: Session = Depends(deps.get_db)
 ) -> Any:
     """
-    Get latest follow-up activities.
-    Rule: Latest 1 per client, total 20.
+    Get Order Distribution (Type & Status).
     """
+    return success(analysis_cache.cached(db, "distribution", request, lambda: build_distribution(db, request)))
+
+def build_activities(db: Session) -> schemas.AnalysisActivitiesResponse:
+    """Latest follow-up per client, newest 20."""
     # Subquery: Max created_at per client
     subq = db.query(
         FollowUp.client_id,
@@ -559,27 +513,31 @@ def get_activities(
             method=followup.method
         ))
         
-    return success(schemas.AnalysisActivitiesResponse(activities=activities))
+    return schemas.AnalysisActivitiesResponse(activities=activities)
 
-@router.post("/new-customers", response_model=ResponseModel[schemas.AnalysisNewCustomersResponse])
-def get_new_customers(
-    request: schemas.AnalysisTrendRequest,
+@router.get("/activities", response_model=ResponseModel[schemas.AnalysisActivitiesResponse])
+def get_activities(
     db: Session = Depends(deps.get_db)
 ) -> Any:
     """
-    Get New Customer Count for the last 6 months.
+    Get latest follow-up activities.
+    Rule: Latest 1 per client, total 20.
     """
+    return success(analysis_cache.cached(db, "activities", None, lambda: build_activities(db)))
+
+def build_new_customers(db: Session, request: schemas.AnalysisTrendRequest) -> schemas.AnalysisNewCustomersResponse:
+    """Compute new customer counts for the 6 months ending at the selected period."""
     end_date_ref = None
     
     if request.time_dimension == 'year':
-        # Find max created_at in that year
+        # Find the last day with new clients in that year
         year_int = int(request.year)
-        max_date = db.query(func.max(Client.created_at)).filter(
-            extract('year', Client.created_at) == year_int
+        max_date = db.query(func.max(ClientDailyRollup.day)).filter(
+            *day_range(ClientDailyRollup.day, datetime(year_int, 1, 1), datetime(year_int, 12, 31))
         ).scalar()
         
         if max_date:
-            end_date_ref = max_date
+            end_date_ref = as_date(max_date)
         else:
             # No data in that year? Fallback to now if current year, or Dec 31
             now = datetime.now()
@@ -619,19 +577,19 @@ def get_new_customers(
     _, last_day_end = calendar.monthrange(end_y, end_m)
     end_date = datetime(end_y, end_m, last_day_end, 23, 59, 59)
     
-    # Query Clients
-    clients = db.query(Client.created_at).filter(
-        Client.created_at >= start_date,
-        Client.created_at <= end_date
-    ).all()
+    # Query Client rollups
+    client_q = db.query(
+        date_bucket(ClientDailyRollup.day, 'month').label('d'),
+        func.sum(ClientDailyRollup.new_count)
+    ).filter(
+        *day_range(ClientDailyRollup.day, start_date, end_date)
+    ).group_by('d')
     
     data_map = {label: 0 for label in labels}
     
-    for client in clients:
-        if client.created_at:
-            key = client.created_at.strftime("%Y-%m")
-            if key in data_map:
-                data_map[key] += 1
+    for date_str, count in client_q.all():
+        if date_str in data_map:
+            data_map[date_str] = int(count or 0)
                 
     series = [data_map[label] for label in labels]
     
@@ -640,20 +598,23 @@ def get_new_customers(
     # Existing mock used "7月". Let's try to match user preference for "Month" if same year, else "Year-Month"?
     # For API consistency, let's return YYYY-MM. Frontend can format.
     
-    return success(schemas.AnalysisNewCustomersResponse(
+    return schemas.AnalysisNewCustomersResponse(
         xAxis=labels,
         series=series
-    ))
+    )
 
-@router.post("/workbench", response_model=ResponseModel[schemas.WorkbenchResponse])
-def get_workbench_data(
+@router.post("/new-customers", response_model=ResponseModel[schemas.AnalysisNewCustomersResponse])
+def get_new_customers(
     request: schemas.AnalysisTrendRequest,
     db: Session = Depends(deps.get_db)
 ) -> Any:
     """
-    Get Workbench Dashboard Data.
-    Includes Summary Cards, Trend Chart, and Expense Pie Chart.
+    Get New Customer Count for the last 6 months.
     """
+    return success(analysis_cache.cached(db, "new-customers", request, lambda: build_new_customers(db, request)))
+
+def build_workbench(db: Session, request: schemas.AnalysisTrendRequest) -> schemas.WorkbenchResponse:
+    """Compute workbench summary cards, income/expense trend and expense pie."""
     # 1. Date Range
     start_date, end_date, group_mode, labels = get_date_range_and_grouping(
         request.time_dimension, request.year, request.month_range
@@ -664,46 +625,48 @@ def get_workbench_data(
     calc_growth = (request.time_dimension == 'year')
     prev_start_date, prev_end_date = get_prev_date_range(start_date, end_date, request.time_dimension)
     
+    engine = columnar.get_engine(db)
+    edges = get_bucket_edges(labels)
+
     # --- Helper Functions ---
     def get_net_income(start, end):
-        # Income: PaymentRecord type=1 (Collection)
-        income_q = db.query(func.sum(PaymentRecord.amount)).filter(
-            PaymentRecord.pay_time >= start,
-            PaymentRecord.pay_time <= end,
-            PaymentRecord.type == 1
-        )
-        income_val = float(income_q.scalar() or 0.0)
-        
-        # Refund: PaymentRecord type=2 (Refund)
-        refund_q = db.query(func.sum(PaymentRecord.amount)).filter(
-            PaymentRecord.pay_time >= start,
-            PaymentRecord.pay_time <= end,
-            PaymentRecord.type == 2
-        )
-        refund_val = float(refund_q.scalar() or 0.0)
-        
-        return income_val - refund_val
+        # Income: type=1 (Collection) minus type=2 (Refund)
+        if engine is not None:
+            total = engine.payments_by_bucket(start, end, [start.date()], 1) - engine.payments_by_bucket(start, end, [start.date()], 2)
+            return float(total[0])
+        rows = db.query(
+            PaymentDailyRollup.type,
+            func.sum(PaymentDailyRollup.amount)
+        ).filter(
+            *day_range(PaymentDailyRollup.day, start, end)
+        ).group_by(PaymentDailyRollup.type).all()
+        totals = {pay_type: float(amount or 0.0) for pay_type, amount in rows}
+        return totals.get(1, 0.0) - totals.get(2, 0.0)
 
     def get_expense(start, end):
-        q = db.query(func.sum(Cost.amount)).filter(
-            Cost.pay_time >= start,
-            Cost.pay_time <= end
+        if engine is not None:
+            return float(engine.costs_by_bucket(start, end, [start.date()])[0])
+        q = db.query(func.sum(CostDailyRollup.amount)).filter(
+            *day_range(CostDailyRollup.day, start, end)
         )
         return float(q.scalar() or 0.0)
         
     def get_new_customers_count(start, end):
-        q = db.query(func.count(Client.id)).filter(
-            Client.created_at >= start,
-            Client.created_at <= end
+        if engine is not None:
+            return engine.new_clients(start, end)
+        q = db.query(func.sum(ClientDailyRollup.new_count)).filter(
+            *day_range(ClientDailyRollup.day, start, end)
         )
         return int(q.scalar() or 0)
         
     def get_deal_customers_count(start, end):
         # Unique customers from PAID orders in range (based on pay_time)
+        # Distinct counts cannot be rolled up, read from orders directly
+        if engine is not None:
+            return engine.deal_clients(start, end)
         q = db.query(func.count(func.distinct(Order.client_id))).filter(
             Order.status == 'PAID',
-            Order.pay_time >= start,
-            Order.pay_time <= end
+            *day_range(Order.pay_time, start, end)
         )
         return int(q.scalar() or 0)
         
@@ -737,69 +700,40 @@ def get_workbench_data(
     
     # --- Trend Data ---
     trend_map = {label: {"income": 0.0, "expense": 0.0} for label in labels}
-    date_format = "%Y-%m" if group_mode == 'month' else "%Y-%m-%d"
-    
-    # Detect database type
-    is_sqlite = "sqlite" in str(db.get_bind().url)
     
-    # Income Trend (From PaymentRecord)
-    # Collections
-    if is_sqlite:
-        date_func = func.strftime(date_format, PaymentRecord.pay_time)
+    if engine is not None:
+        income_trend = engine.payments_by_bucket(start_date, end_date, edges, 1) - engine.payments_by_bucket(start_date, end_date, edges, 2)
+        expense_trend = engine.costs_by_bucket(start_date, end_date, edges)
+        for i, label in enumerate(labels):
+            trend_map[label] = {"income": float(income_trend[i]), "expense": float(expense_trend[i])}
     else:
-        # MySQL DATE_FORMAT mapping
-        mysql_format = date_format.replace('%Y', '%Y').replace('%m', '%m').replace('%d', '%d')
-        date_func = func.date_format(PaymentRecord.pay_time, mysql_format)
-
-    income_trend_q = db.query(
-        date_func.label('d'),
-        func.sum(PaymentRecord.amount)
-    ).filter(
-        PaymentRecord.pay_time >= start_date,
-        PaymentRecord.pay_time <= end_date,
-        PaymentRecord.type == 1
-    ).group_by('d')
-    
-    for date_str, amt in income_trend_q.all():
-        if date_str in trend_map:
-            trend_map[date_str]["income"] += float(amt or 0)
-            
-    # Refunds (Subtract from Income)
-    if is_sqlite:
-        date_func_refund = func.strftime(date_format, PaymentRecord.pay_time)
-    else:
-        date_func_refund = func.date_format(PaymentRecord.pay_time, mysql_format)
-
-    refund_trend_q = db.query(
-        date_func_refund.label('d'),
-        func.sum(PaymentRecord.amount)
-    ).filter(
-        PaymentRecord.pay_time >= start_date,
-        PaymentRecord.pay_time <= end_date,
-        PaymentRecord.type == 2
-    ).group_by('d')
-    
-    for date_str, amt in refund_trend_q.all():
-        if date_str in trend_map:
-            trend_map[date_str]["income"] -= float(amt or 0)
-            
-    # Expense Trend
-    if is_sqlite:
-        date_func_expense = func.strftime(date_format, Cost.pay_time)
-    else:
-        date_func_expense = func.date_format(Cost.pay_time, mysql_format)
-
-    expense_trend_q = db.query(
-        date_func_expense.label('d'),
-        func.sum(Cost.amount)
-    ).filter(
-        Cost.pay_time >= start_date,
-        Cost.pay_time <= end_date
-    ).group_by('d')
-    
-    for date_str, amt in expense_trend_q.all():
-        if date_str in trend_map:
-            trend_map[date_str]["expense"] = float(amt or 0)
+        # Income Trend (Collections minus Refunds)
+        income_trend_q = db.query(
+            date_bucket(PaymentDailyRollup.day, group_mode).label('d'),
+            func.sum(case(
+                (PaymentDailyRollup.type == 1, PaymentDailyRollup.amount),
+                (PaymentDailyRollup.type == 2, -PaymentDailyRollup.amount),
+                else_=0
+            ))
+        ).filter(
+            *day_range(PaymentDailyRollup.day, start_date, end_date)
+        ).group_by('d')
+        
+        for date_str, amt in income_trend_q.all():
+            if date_str in trend_map:
+                trend_map[date_str]["income"] = float(amt or 0)
+                
+        # Expense Trend
+        expense_trend_q = db.query(
+            date_bucket(CostDailyRollup.day, group_mode).label('d'),
+            func.sum(CostDailyRollup.amount)
+        ).filter(
+            *day_range(CostDailyRollup.day, start_date, end_date)
+        ).group_by('d')
+        
+        for date_str, amt in expense_trend_q.all():
+            if date_str in trend_map:
+                trend_map[date_str]["expense"] = float(amt or 0)
             
     # Build Series
     t_income = []
@@ -820,13 +754,15 @@ def get_workbench_data(
         t_margin.append(round(marg, 1))
         
     # --- Expense Pie ---
-    pie_q = db.query(
-        Cost.category,
-        func.sum(Cost.amount)
-    ).filter(
-        Cost.pay_time >= start_date,
-        Cost.pay_time <= end_date
-    ).group_by(Cost.category)
+    if engine is not None:
+        pie_rows = engine.costs_by_category(start_date, end_date).items()
+    else:
+        pie_rows = db.query(
+            CostDailyRollup.category,
+            func.sum(CostDailyRollup.amount)
+        ).filter(
+            *day_range(CostDailyRollup.day, start_date, end_date)
+        ).group_by(CostDailyRollup.category).all()
     
     # Category Mapping
     category_map = {
@@ -841,12 +777,12 @@ def get_workbench_data(
     }
 
     pie_data = []
-    for cat, amt in pie_q.all():
+    for cat, amt in pie_rows:
         # Use mapped name if available, otherwise use original code
         name = category_map.get(cat, cat)
         pie_data.append(schemas.DistributionItem(name=name, value=float(amt or 0)))
         
-    return success(schemas.WorkbenchResponse(
+    return schemas.WorkbenchResponse(
         summary=schemas.WorkbenchSummary(
             total_income=round(income, 2),
             income_growth=round(income_growth, 1),
@@ -865,4 +801,169 @@ def get_workbench_data(
         trend_profit=t_profit,
         trend_margin=t_margin,
         expense_pie=pie_data
-    ))
+    )
+
+@router.post("/workbench", response_model=ResponseModel[schemas.WorkbenchResponse])
+def get_workbench_data(
+    request: schemas.AnalysisTrendRequest,
+    db: Session = Depends(deps.get_db)
+) -> Any:
+    """
+    Get Workbench Dashboard Data.
+    Includes Summary Cards, Trend Chart, and Expense Pie Chart.
+    """
+    return success(analysis_cache.cached(db, "workbench", request, lambda: build_workbench(db, request)))
+
+def build_dashboard(db: Session, request: schemas.AnalysisTrendRequest) -> schemas.AnalysisDashboardResponse:
+    """
+    Compute the summary, trend, comparison, distribution and new-customer
+    panels together. Each rollup table is scanned once, grouped by day, for
+    the union of the current and previous periods, and every panel is folded
+    from those rows. Pending amounts come from the receivables ledger.
+    """
+    engine = columnar.get_engine(db)
+    if engine is not None:
+        # Columns are already in memory, there is no scan to share
+        return schemas.AnalysisDashboardResponse(
+            summary=build_summary(db, request),
+            trend=build_trend(db, request),
+            comparison=build_comparison(db, request),
+            distribution=build_distribution(db, request),
+            new_customers=build_new_customers(db, request)
+        )
+
+    start_date, end_date, group_by_mode, labels = get_date_range_and_grouping(
+        request.time_dimension, request.year, request.month_range
+    )
+    prev_start_date, prev_end_date = get_prev_date_range(start_date, end_date, request.time_dimension)
+    scan_start = min(start_date, prev_start_date)
+    scan_end = max(end_date, prev_end_date)
+    current = (start_date.date(), end_date.date())
+    previous = (prev_start_date.date(), prev_end_date.date())
+
+    def in_period(day, period):
+        return period[0] <= day <= period[1]
+
+    totals = {
+        "trial": 0, "prev_trial": 0, "orders": 0, "prev_orders": 0,
+        "sales": 0, "prev_sales": 0, "collection": 0, "prev_collection": 0
+    }
+    trend_map = {label: {"sales": 0, "collection": 0, "trial": 0} for label in labels}
+    comparison_map = {label: {"ent_sales": 0, "per_sales": 0, "ent_trial": 0, "per_trial": 0} for label in labels}
+    type_amounts = {}
+    status_counts = {}
+
+    # 1. Sales rollup: summary counts/amounts, trend, comparison and distribution
+    sales_q = db.query(
+        SalesDailyRollup.day,
+        SalesDailyRollup.order_type,
+        SalesDailyRollup.status,
+        SalesDailyRollup.client_type,
+        func.sum(SalesDailyRollup.order_count),
+        func.sum(SalesDailyRollup.amount)
+    ).filter(
+        *day_range(SalesDailyRollup.day, scan_start, scan_end),
+        *get_order_filters(request.order_type, SalesDailyRollup.order_type)
+    ).group_by(SalesDailyRollup.day, SalesDailyRollup.order_type, SalesDailyRollup.status, SalesDailyRollup.client_type)
+
+    for day, order_type, status, client_type, count, amount in sales_q.all():
+        day = as_date(day)
+        count, amount = int(count or 0), amount or 0
+        if in_period(day, previous):
+            totals["prev_orders"] += count
+            totals["prev_sales"] += amount
+        if not in_period(day, current):
+            continue
+        totals["orders"] += count
+        totals["sales"] += amount
+        status_counts[status] = status_counts.get(status, 0) + count
+        if status in ('VOID', 'CANCELLED'):
+            continue
+        type_amounts[order_type] = type_amounts.get(order_type, 0) + amount
+        label = bucket_label(day, group_by_mode)
+        if label in trend_map:
+            trend_map[label]["sales"] += amount
+            if client_type is not None:
+                comparison_map[label]["ent_sales" if client_type == 1 else "per_sales"] += amount
+
+    # 2. Payment rollup: collections for the summary and the trend
+    payment_q = db.query(
+        PaymentDailyRollup.day,
+        func.sum(PaymentDailyRollup.amount)
+    ).filter(
+        *day_range(PaymentDailyRollup.day, scan_start, scan_end),
+        PaymentDailyRollup.type == 1,
+        *get_order_filters(request.order_type, PaymentDailyRollup.order_type)
+    ).group_by(PaymentDailyRollup.day)
+
+    for day, amount in payment_q.all():
+        day = as_date(day)
+        amount = amount or 0
+        if in_period(day, previous):
+            totals["prev_collection"] += amount
+        if in_period(day, current):
+            totals["collection"] += amount
+            label = bucket_label(day, group_by_mode)
+            if label in trend_map:
+                trend_map[label]["collection"] += amount
+
+    # 3. Trial rollup: summary, trend and comparison (no order_type link)
+    trial_q = db.query(
+        TrialDailyRollup.day,
+        TrialDailyRollup.client_type,
+        func.sum(TrialDailyRollup.trial_count)
+    ).filter(
+        *day_range(TrialDailyRollup.day, scan_start, scan_end)
+    ).group_by(TrialDailyRollup.day, TrialDailyRollup.client_type)
+
+    for day, client_type, count in trial_q.all():
+        day = as_date(day)
+        count = int(count or 0)
+        if in_period(day, previous):
+            totals["prev_trial"] += count
+        if in_period(day, current):
+            totals["trial"] += count
+            label = bucket_label(day, group_by_mode)
+            if label in trend_map:
+                trend_map[label]["trial"] += count
+                if client_type is not None:
+                    comparison_map[label]["ent_trial" if client_type == 1 else "per_trial"] += count
+
+    for item in trend_map.values():
+        item["sales"], item["collection"] = float(item["sales"]), float(item["collection"])
+    for item in comparison_map.values():
+        item["ent_sales"], item["per_sales"] = float(item["ent_sales"]), float(item["per_sales"])
+
+    return schemas.AnalysisDashboardResponse(
+        summary=build_summary_response(
+            totals["trial"], totals["prev_trial"], totals["orders"], totals["prev_orders"],
+            totals["sales"], totals["prev_sales"], totals["collection"], totals["prev_collection"],
+            *get_pending_amounts(db, request, end_date, prev_end_date)
+        ),
+        trend=build_trend_response(labels, trend_map),
+        comparison=build_comparison_response(labels, comparison_map),
+        distribution=build_distribution_response(
+            sorted(type_amounts.items(), key=lambda item: item[0] or ""),
+            sorted(status_counts.items(), key=lambda item: item[0] or "")
+        ),
+        # Its own six-month window, the only reader of the client rollup
+        new_customers=build_new_customers(db, request)
+    )
+
+@router.post("/dashboard", response_model=ResponseModel[schemas.AnalysisDashboardResponse])
+def get_dashboard(
+    request: schemas.AnalysisTrendRequest,
+    db: Session = Depends(deps.get_db)
+) -> Any:
+    """
+    Get all analysis page panels in one request.
+    Same payloads as /summary, /trend, /comparison, /distribution and /new-customers.
+    """
+    return success(analysis_cache.cached(db, "dashboard", request, lambda: build_dashboard(db, request)))
+
+@router.get("/cache-stats", response_model=ResponseModel[schemas.AnalysisCacheStats])
+def get_cache_stats() -> Any:
+    """
+    Hit/miss metrics of this worker's analysis result cache.
+    """
+    return success(schemas.AnalysisCacheStats(**analysis_cache.cache.stats()))
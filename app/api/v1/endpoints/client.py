@@ -1,20 +1,21 @@
-from typing import Any, List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from typing import Any, List, Optional, Union
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Form
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
 from app.api import deps
+from app.api.pagination import keyset_page
+from app.api.projection import parse_fields, project, projected_response
 from app.models.client import Client, FollowUp
-# Try import Plugin Model
-try:
-    from app.modules.plugins.commercial_kit.models import LicenseRecord
-except ImportError:
-    LicenseRecord = None
 from app.models.user import User
-from app.schemas.client import ClientCreate, ClientUpdate, ClientResponse, ClientDetailResponse, FollowUpCreate, FollowUpResponse
-from app.schemas.response import ResponseModel, success
+from app.schemas.client import ClientCreate, ClientUpdate, ClientResponse, ClientDetailResponse, FollowUpCreate, FollowUpResponse, ClientImportResult
+from app.schemas.response import ResponseModel, PageData, success
+from app.services import rollup, analysis_cache, columnar, search, client_identity, client_import, client_stats
+from app.services.csv_import import csv_rows
+import codecs
 
 router = APIRouter()
 
-@router.get("/list", response_model=ResponseModel[List[ClientResponse]])
+@router.get("/list", response_model=ResponseModel[Union[PageData[ClientResponse], List[ClientResponse]]])
 def read_clients(
     db: Session = Depends(deps.get_db),
     current_user: User = Depends(deps.get_current_user),
@@ -22,7 +23,10 @@ def read_clients(
     limit: int = 100,
     name: Optional[str] = None,
     phone: Optional[str] = None,
-    status: Optional[int] = None
+    status: Optional[int] = None,
+    cursor: Optional[str] = Query(None, description="Keyset pagination cursor, empty for the first page"),
+    with_total: bool = False,
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. id,name,phone,status")
 ) -> Any:
     query = db.query(Client)
     
@@ -31,14 +35,24 @@ def read_clients(
         query = query.filter(Client.creator_id == current_user.id)
         
     if name:
-        query = query.filter(Client.name.ilike(f"%{name}%"))
+        query = query.filter(search.contains(db, "client.name", name))
     if phone:
-        query = query.filter(Client.phone.ilike(f"%{phone}%"))
+        query = query.filter(search.contains(db, "client.phone", phone))
     if status is not None:
         query = query.filter(Client.status == status)
+
+    names = parse_fields(fields, Client, ClientResponse, ("id", "created_at"))
+    if names:
+        query = project(query, Client, names)
+    else:
+        # Stats come with the page, one joined row per client
+        query = query.options(joinedload(Client.stats))
     
+    if cursor is not None:
+        page = keyset_page(db, query, Client.created_at, Client.id, cursor, limit, with_total)
+        return projected_response(page, ClientResponse, names) if names else success(page)
     clients = query.order_by(Client.created_at.desc()).offset(skip).limit(limit).all()
-    return success(clients)
+    return projected_response(clients, ClientResponse, names) if names else success(clients)
 
 @router.post("/", response_model=ResponseModel[ClientResponse])
 def create_client(
@@ -47,31 +61,56 @@ def create_client(
     current_user: User = Depends(deps.get_current_user),
     client_in: ClientCreate
 ) -> Any:
-    # Check if client exists (optional, e.g. by phone or name)
-    if client_in.type == 1: # Enterprise
-        existing = db.query(Client).filter(Client.name == client_in.name, Client.type == 1).first()
-        if existing:
-             raise HTTPException(status_code=400, detail="Enterprise name already exists")
-    
-    # Simple duplicate check for phone/wechat if provided
-    if client_in.phone:
-         existing_phone = db.query(Client).filter(Client.phone == client_in.phone).first()
-         if existing_phone:
-             raise HTTPException(status_code=400, detail="Phone number already exists")
-    
-    if client_in.wechat:
-         existing_wechat = db.query(Client).filter(Client.wechat == client_in.wechat).first()
-         if existing_wechat:
-             raise HTTPException(status_code=400, detail="Wechat ID already exists")
+    # Duplicate check: enterprise name, phone and wechat in one lookup of the normalized identity keys
+    keys = client_identity.identity_keys(client_in.type, client_in.name, client_in.phone, client_in.wechat)
+    taken = client_identity.conflicts(db, keys)
+    if taken:
+        raise HTTPException(status_code=400, detail=client_identity.CONFLICT_MESSAGES[taken[0]])
 
     client_data = client_in.dict()
     client_data["creator_id"] = current_user.id
     client = Client(**client_data)
     db.add(client)
+    db.flush()
+    try:
+        client_identity.add(db, client.id, keys)
+    except IntegrityError:
+        # Created concurrently by another request
+        db.rollback()
+        taken = client_identity.conflicts(db, keys) or [client_identity.KINDS[0]]
+        raise HTTPException(status_code=400, detail=client_identity.CONFLICT_MESSAGES[taken[0]])
+    rollup.refresh(db, clients=[client.created_at], trials=rollup.client_trial_days(db, [client.name]))
+    search.refresh(db, clients=[client.id])
+    client_stats.refresh(db, [client.id])
+    version = analysis_cache.bump(db)
     db.commit()
+    columnar.apply_changes(db, version, clients=[client.id])
     db.refresh(client)
     return success(client)
 
+@router.post("/import", response_model=ResponseModel[ClientImportResult])
+def import_clients(
+    file: UploadFile = File(...),
+    encoding: str = Form("utf-8-sig", description="File encoding, e.g. gbk for Excel exports"),
+    db: Session = Depends(deps.get_db),
+    current_user: User = Depends(deps.get_current_user)
+) -> Any:
+    """
+    Import clients from a CSV spreadsheet (客户名称, optional 客户类型, 客户状态,
+    来源, 等级, 联系人, 职位, 手机号, 微信号, 邮箱, 备注). Rows duplicating an
+    existing client or an earlier row are skipped and reported.
+    """
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        raise HTTPException(status_code=400, detail=f"Unknown encoding: {encoding}")
+    try:
+        rows = client_import.csv_client_rows(csv_rows(file.file, encoding))
+        return success(client_import.import_clients(db, rows, current_user.id))
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.put("/{id}", response_model=ResponseModel[ClientResponse])
 def update_client(
     *,
@@ -88,12 +127,41 @@ def update_client(
     if current_user.role == "STAFF" and client.creator_id != current_user.id:
          raise HTTPException(status_code=403, detail="Not authorized to update this client")
     
+    old_type, old_name, old_phone, old_wechat = client.type, client.name, client.phone, client.wechat
     update_data = client_in.dict(exclude_unset=True)
     for field, value in update_data.items():
         setattr(client, field, value)
+
+    # Only changed values are checked, clients duplicated before the identity keys existed stay editable
+    old_keys = set(client_identity.identity_keys(old_type, old_name, old_phone, old_wechat))
+    keys = client_identity.identity_keys(client.type, client.name, client.phone, client.wechat)
+    new_keys = [key for key in keys if key not in old_keys]
+    taken = client_identity.conflicts(db, new_keys, client.id)
+    if taken:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=client_identity.CONFLICT_MESSAGES[taken[0]])
     
     db.add(client)
+    db.flush()
+    if set(keys) != old_keys:
+        client_identity.refresh(db, [client.id])
+    # Sales and trials are rolled up by client type
+    if client.type != old_type or client.name != old_name:
+        rollup.refresh(
+            db,
+            clients=[client.created_at],
+            sales=rollup.client_order_days(db, client.id) if client.type != old_type else [],
+            trials=rollup.client_trial_days(db, [old_name, client.name])
+        )
+    if client.name != old_name or client.phone != old_phone:
+        search.refresh(db, clients=[client.id])
+    # License counts are matched by name
+    if client.name != old_name:
+        client_stats.refresh(db, [client.id])
+    # Activities show the client name and type
+    version = analysis_cache.bump(db)
     db.commit()
+    columnar.apply_changes(db, version, clients=[id])
     db.refresh(client)
     return success(client)
 
@@ -104,7 +172,7 @@ def read_client(
     current_user: User = Depends(deps.get_current_user),
     id: str
 ) -> Any:
-    client = db.query(Client).filter(Client.id == id).first()
+    client = db.query(Client).options(joinedload(Client.stats)).filter(Client.id == id).first()
     if not client:
         raise HTTPException(status_code=404, detail="Client not found")
         
@@ -115,15 +183,10 @@ def read_client(
     # 1. Flatten extra_info
     extra = client.extra_info or {}
     
-    # 2. Get Statistics
-    # License Count (by customer_name matching client.name for now)
-    license_count = 0
-    if LicenseRecord:
-        license_count = db.query(LicenseRecord).filter(LicenseRecord.customer_name == client.name).count()
-    
-    # Last Active (Latest FollowUp created_at)
-    last_followup = db.query(FollowUp).filter(FollowUp.client_id == id).order_by(FollowUp.created_at.desc()).first()
-    last_active = last_followup.created_at if last_followup else client.updated_at
+    # 2. Statistics, precomputed by app.services.client_stats
+    # (licenses matched by customer_name == client.name, last active = latest follow-up)
+    stats = client_stats.as_dict(client.stats)
+    last_active = stats["last_followup_at"] or client.updated_at
     
     # Construct response
     client_dict = {
@@ -156,8 +219,13 @@ def read_client(
         "reg_address": extra.get("reg_address"),
         
         # Stats
-        "license_count": license_count,
-        "last_active": last_active
+        "stats": stats,
+        "license_count": stats["license_count"],
+        "last_active": last_active,
+        "order_count": stats["order_count"],
+        "sales_amount": stats["sales_amount"],
+        "collected_amount": stats["collected_amount"],
+        "outstanding_amount": stats["outstanding_amount"]
     }
     
     return success(ClientDetailResponse(**client_dict))
@@ -171,19 +239,39 @@ def delete_client(
     client = db.query(Client).filter(Client.id == id).first()
     if not client:
         raise HTTPException(status_code=404, detail="Client not found")
+    order_days = rollup.client_order_days(db, client.id)
+    order_ids = [order.id for order in client.orders]
     db.delete(client)
+    db.flush()
+    rollup.refresh(
+        db,
+        clients=[client.created_at],
+        sales=order_days,
+        trials=rollup.client_trial_days(db, [client.name])
+    )
+    search.refresh(db, orders=order_ids, clients=[id])
+    client_identity.refresh(db, [id])
+    client_stats.refresh(db, [id])
+    version = analysis_cache.bump(db)
     db.commit()
+    columnar.apply_changes(db, version, orders=order_ids, clients=[id])
     return success({"ok": True})
 
 # --- FollowUp ---
 
-@router.get("/{id}/followups", response_model=ResponseModel[List[FollowUpResponse]])
+@router.get("/{id}/followups", response_model=ResponseModel[Union[PageData[FollowUpResponse], List[FollowUpResponse]]])
 def read_followups(
     *,
     db: Session = Depends(deps.get_db),
-    id: str
+    id: str,
+    limit: int = Query(100, description="Page size of cursor pages, without `cursor` every follow-up is returned"),
+    cursor: Optional[str] = Query(None, description="Keyset pagination cursor, empty for the first page"),
+    with_total: bool = False
 ) -> Any:
-    followups = db.query(FollowUp).filter(FollowUp.client_id == id).order_by(FollowUp.created_at.desc()).all()
+    query = db.query(FollowUp).filter(FollowUp.client_id == id)
+    if cursor is not None:
+        return success(keyset_page(db, query, FollowUp.created_at, FollowUp.id, cursor, limit, with_total))
+    followups = query.order_by(FollowUp.created_at.desc()).all()
     return success(followups)
 
 @router.post("/followup", response_model=ResponseModel[FollowUpResponse])
@@ -194,6 +282,11 @@ def create_followup(
 ) -> Any:
     followup = FollowUp(**followup_in.dict())
     db.add(followup)
+    db.flush()
+    client_stats.refresh(db, [followup.client_id])
+    version = analysis_cache.bump(db)
     db.commit()
+    # Nothing to patch, only keeps the engine on the current version
+    columnar.apply_changes(db, version)
     db.refresh(followup)
     return success(followup)
@@ -1,19 +1,30 @@
-from typing import Any, List, Optional, Dict
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, select, func, extract
-from sqlalchemy import text
+from typing import Any, List, Optional, Dict, Union
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session, select, func
+from sqlalchemy import and_, case, text
 from app.api import deps
+from app.api.pagination import keyset_page
+from app.api.projection import parse_fields, project, projected_response
+from app.db.dates import day_range
+from app.db.session import SessionLocal
 from app.models.cost import Cost
 from app.models.order import Order
 from app.models.user import User
-from app.schemas.cost import CostCreate, CostRead, CostStats, CategoryStat, CostUpdate
-from app.schemas.response import ResponseModel, success
+from app.schemas.cost import CostCreate, CostRead, CostStats, CategoryStat, CostUpdate, CostImportResult
+from app.schemas.response import ResponseModel, PageData, success
+from app.services import rollup, analysis_cache, columnar, cost_import, uploads
+from app.services.csv_import import csv_rows
+import calendar
+import codecs
+import json
 import uuid
 from datetime import date, datetime
+from decimal import Decimal
 
 router = APIRouter()
 
-@router.get("/list", response_model=ResponseModel[List[CostRead]])
+@router.get("/list", response_model=ResponseModel[Union[PageData[CostRead], List[CostRead]]])
 def read_costs(
     db: Session = Depends(deps.get_db),
     current_user: User = Depends(deps.get_current_user),
@@ -22,9 +33,14 @@ def read_costs(
     category: Optional[str] = None,
     pay_time_start: Optional[date] = None,
     pay_time_end: Optional[date] = None,
+    cursor: Optional[str] = Query(None, description="Keyset pagination cursor, empty for the first page"),
+    with_total: bool = False,
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. id,title,amount,category")
 ) -> Any:
     """
     Retrieve costs.
+    With `cursor`, returns a PageData page ordered by (pay_time, id) instead of a list.
+    With `fields`, only those columns are selected and returned.
     """
     query = select(Cost)
     
@@ -38,8 +54,17 @@ def read_costs(
         query = query.where(Cost.pay_time >= pay_time_start)
     if pay_time_end:
         query = query.where(Cost.pay_time <= pay_time_end)
+
+    names = parse_fields(fields, Cost, CostRead, ("id", "pay_time"))
+    if names:
+        query = project(query, Cost, names)
     
+    if cursor is not None:
+        page = keyset_page(db, query, Cost.pay_time, Cost.id, cursor, limit, with_total)
+        return projected_response(page, CostRead, names) if names else success(page)
     query = query.order_by(Cost.pay_time.desc()).offset(skip).limit(limit)
+    if names:
+        return projected_response(db.execute(query).all(), CostRead, names)
     costs = db.execute(query).scalars().all()
     return success(costs)
 
@@ -57,10 +82,82 @@ def create_cost(
     cost_data["creator_id"] = current_user.id
     cost = Cost(**cost_data)
     db.add(cost)
+    db.flush()
+    rollup.refresh(db, costs=[cost.pay_time])
+    version = analysis_cache.bump(db)
     db.commit()
+    columnar.apply_changes(db, version, costs=[cost.id])
     db.refresh(cost)
     return success(cost)
 
+@router.post("/import", response_model=ResponseModel[CostImportResult])
+def import_costs(
+    file: Optional[UploadFile] = File(None),
+    invoice_url: Optional[str] = Form(None, description="Import a statement already uploaded as an attachment (/uploads/...)"),
+    pay_account: str = Form("ALIPAY", description="ALIPAY / WECHAT / BANK, part of the duplicate check"),
+    default_category: str = Form("OTHER", description="Category of lines no rule matches"),
+    encoding: str = Form("utf-8-sig", description="File encoding, e.g. gbk for Excel exports"),
+    stream: bool = Form(False, description="Stream NDJSON progress events while importing"),
+    db: Session = Depends(deps.get_db),
+    current_user: User = Depends(deps.get_current_user)
+) -> Any:
+    """
+    Import costs from an Alipay / WeChat bill or a cloud / AI API vendor CSV
+    export, uploaded as `file` or referenced by `invoice_url` (the imported
+    costs then link to that statement). Income, transfers and zero lines are
+    ignored, lines imported before are counted as duplicates; categories come
+    from the `cost_import_rules` config and built-in vendor keywords.
+    With `stream`, the response is NDJSON progress events like the order import.
+    """
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        raise HTTPException(status_code=400, detail=f"Unknown encoding: {encoding}")
+    if invoice_url:
+        path = uploads.local_path(invoice_url)
+        if path is None:
+            raise HTTPException(status_code=404, detail="Statement file not found")
+        source = open(path, "rb")
+    elif file is not None:
+        source = file.file
+    else:
+        raise HTTPException(status_code=400, detail="Upload a file or give an invoice_url")
+
+    lines = cost_import.parse_bill(csv_rows(source, encoding))
+    options = dict(
+        pay_account=pay_account,
+        default_category=default_category,
+        creator_id=current_user.id,
+        invoice_url=invoice_url
+    )
+
+    if not stream:
+        try:
+            return success(cost_import.import_costs(db, lines, **options))
+        except ValueError as e:
+            db.rollback()
+            raise HTTPException(status_code=400, detail=str(e))
+        finally:
+            source.close()
+
+    def events():
+        # The request session is closed once the endpoint returns, use our own
+        import_db = SessionLocal()
+        try:
+            result = None
+            for result in cost_import.iter_import(import_db, lines, **options):
+                progress = {k: result[k] for k in ("processed", "created", "duplicates", "ignored", "failed")}
+                yield json.dumps({"event": "progress", **progress}) + "\n"
+            yield json.dumps({"event": "done", **result}, default=str) + "\n"
+        except ValueError as e:
+            import_db.rollback()
+            yield json.dumps({"event": "error", "detail": str(e)}) + "\n"
+        finally:
+            import_db.close()
+            source.close()
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
 @router.put("/{id}", response_model=ResponseModel[CostRead])
 def update_cost(
     *,
@@ -80,12 +177,17 @@ def update_cost(
     if current_user.role == "STAFF" and cost.creator_id != current_user.id:
          raise HTTPException(status_code=403, detail="Not authorized to update this cost")
          
+    old_pay_time = cost.pay_time
     update_data = cost_in.dict(exclude_unset=True)
     for field in update_data:
         setattr(cost, field, update_data[field])
         
     db.add(cost)
+    db.flush()
+    rollup.refresh(db, costs=[old_pay_time, cost.pay_time])
+    version = analysis_cache.bump(db)
     db.commit()
+    columnar.apply_changes(db, version, costs=[id])
     db.refresh(cost)
     return success(cost)
 
@@ -108,9 +210,77 @@ def delete_cost(
          raise HTTPException(status_code=403, detail="Not authorized to delete this cost")
          
     db.delete(cost)
+    db.flush()
+    rollup.refresh(db, costs=[cost.pay_time])
+    version = analysis_cache.bump(db)
     db.commit()
+    columnar.apply_changes(db, version, costs=[id])
     return success({"ok": True})
 
+def _month_bounds(year: int, month: int):
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+def cost_stats_query(year: int, month: int, creator_id: Optional[str] = None):
+    """
+    Per-category sums of the month, the month before, the year and the year
+    before in one scan: a single sargable pay_time range, split with CASE.
+    """
+    month_start, month_end = _month_bounds(year, month)
+    last_month_start, last_month_end = _month_bounds(year - 1, 12) if month == 1 else _month_bounds(year, month - 1)
+
+    def total(start, end):
+        return func.sum(case((and_(*day_range(Cost.pay_time, start, end)), Cost.amount), else_=0))
+
+    in_year = and_(*day_range(Cost.pay_time, date(year, 1, 1), date(year, 12, 31)))
+    query = select(
+        Cost.category,
+        total(month_start, month_end).label("month"),
+        total(last_month_start, last_month_end).label("month_last"),
+        total(date(year, 1, 1), date(year, 12, 31)).label("year"),
+        total(date(year - 1, 1, 1), date(year - 1, 12, 31)).label("year_last"),
+        func.sum(case((in_year, 1), else_=0)).label("year_count")
+    ).where(*day_range(Cost.pay_time, date(year - 1, 1, 1), date(year, 12, 31)))
+    if creator_id is not None:
+        query = query.where(Cost.creator_id == creator_id)
+    return query.group_by(Cost.category)
+
+def _growth(current: float, last: float) -> float:
+    if last > 0:
+        return (current - last) / last * 100
+    return 100.0 if current > 0 else 0.0
+
+def _total(rows, name: str) -> float:
+    # Add up exactly, like SUM() over all categories would
+    return float(sum(Decimal(str(getattr(row, name) or 0)) for row in rows))
+
+def build_cost_stats(db: Session, year: int, month: int, creator_id: Optional[str] = None) -> CostStats:
+    rows = db.execute(cost_stats_query(year, month, creator_id)).all()
+    month_cost = _total(rows, "month")
+    month_cost_last = _total(rows, "month_last")
+    year_cost = _total(rows, "year")
+    year_cost_last = _total(rows, "year_last")
+
+    # Category Breakdown (Yearly): categories with costs this year, largest first
+    breakdown = sorted(((row.category, float(row.year or 0)) for row in rows if row.year_count), key=lambda item: (-item[1], item[0]))
+    category_breakdown = [
+        CategoryStat(
+            name=category,
+            amount=amount,
+            percent=round(amount / year_cost * 100, 1) if year_cost > 0 else 0.0
+        )
+        for category, amount in breakdown
+    ]
+
+    return CostStats(
+        month_cost=month_cost,
+        month_cost_last=month_cost_last,
+        month_growth=round(_growth(month_cost, month_cost_last), 1),
+        year_cost=year_cost,
+        year_cost_last=year_cost_last,
+        year_growth=round(_growth(year_cost, year_cost_last), 1),
+        category_breakdown=category_breakdown
+    )
+
 @router.get("/stats", response_model=ResponseModel[CostStats])
 def get_cost_stats(
     db: Session = Depends(deps.get_db),
@@ -119,95 +289,14 @@ def get_cost_stats(
 ) -> Any:
     """
     Get aggregated cost stats (Monthly, Yearly, Breakdown).
+    Cached per (year, data scope) with the analysis results; cost writes invalidate it.
     """
     now = datetime.now()
     current_year = int(year) if year else now.year
-    current_month = now.month
-    
-    def apply_filters(query):
-        # RBAC: Staff can only see their own costs
-        if current_user.role == "STAFF":
-            return query.where(Cost.creator_id == current_user.id)
-        return query
-
-    # --- 1. Monthly Stats ---
-    # Current Month
-    month_cost_query = select(func.sum(Cost.amount)).where(
-        extract('year', Cost.pay_time) == current_year,
-        extract('month', Cost.pay_time) == current_month
-    )
-    month_cost_query = apply_filters(month_cost_query)
-    month_cost = float(db.scalar(month_cost_query) or 0.0)
-    
-    # Last Month
-    last_month_year = current_year
-    last_month = current_month - 1
-    if last_month == 0:
-        last_month = 12
-        last_month_year -= 1
-        
-    month_cost_last_query = select(func.sum(Cost.amount)).where(
-        extract('year', Cost.pay_time) == last_month_year,
-        extract('month', Cost.pay_time) == last_month
-    )
-    month_cost_last_query = apply_filters(month_cost_last_query)
-    month_cost_last = float(db.scalar(month_cost_last_query) or 0.0)
-    
-    month_growth = 0.0
-    if month_cost_last > 0:
-        month_growth = ((month_cost - month_cost_last) / month_cost_last) * 100
-    elif month_cost > 0:
-        month_growth = 100.0
-    
-    # --- 2. Yearly Stats ---
-    # Current Year
-    year_cost_query = select(func.sum(Cost.amount)).where(
-        extract('year', Cost.pay_time) == current_year
-    )
-    year_cost_query = apply_filters(year_cost_query)
-    year_cost = float(db.scalar(year_cost_query) or 0.0)
-    
-    # Last Year
-    last_year = current_year - 1
-    year_cost_last_query = select(func.sum(Cost.amount)).where(
-        extract('year', Cost.pay_time) == last_year
-    )
-    year_cost_last_query = apply_filters(year_cost_last_query)
-    year_cost_last = float(db.scalar(year_cost_last_query) or 0.0)
-    
-    year_growth = 0.0
-    if year_cost_last > 0:
-        year_growth = ((year_cost - year_cost_last) / year_cost_last) * 100
-    elif year_cost > 0:
-        year_growth = 100.0
-        
-    # --- 3. Category Breakdown (Yearly) ---
-    breakdown_query = select(Cost.category, func.sum(Cost.amount)).where(
-        extract('year', Cost.pay_time) == current_year
-    )
-    breakdown_query = apply_filters(breakdown_query)
-    breakdown_query = breakdown_query.group_by(Cost.category).order_by(func.sum(Cost.amount).desc())
-    
-    breakdown_results = db.execute(breakdown_query).all()
-    
-    category_breakdown = []
-    total_breakdown_amount = sum([float(amount or 0.0) for _, amount in breakdown_results])
-    
-    for category, amount in breakdown_results:
-        amount_float = float(amount or 0.0)
-        percent = (amount_float / total_breakdown_amount * 100) if total_breakdown_amount > 0 else 0.0
-        category_breakdown.append(CategoryStat(
-            name=category,
-            amount=amount_float,
-            percent=round(percent, 1)
-        ))
-        
-    return success(CostStats(
-        month_cost=float(month_cost),
-        month_cost_last=float(month_cost_last),
-        month_growth=round(month_growth, 1),
-        year_cost=float(year_cost),
-        year_cost_last=float(year_cost_last),
-        year_growth=round(year_growth, 1),
-        category_breakdown=category_breakdown
+    # RBAC: Staff can only see their own costs
+    creator_id = current_user.id if current_user.role == "STAFF" else None
+
+    key = {"year": current_year, "month": now.month, "creator_id": creator_id}
+    return success(analysis_cache.cached(
+        db, "cost-stats", key, lambda: build_cost_stats(db, current_year, now.month, creator_id)
     ))
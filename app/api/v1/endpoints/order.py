@@ -1,25 +1,31 @@
-from typing import Any, List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Any, List, Optional, Union
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import func, extract
 from app.api import deps
+from app.api.pagination import keyset_page
+from app.api.projection import parse_fields, project, projected_response
+from app.db.session import SessionLocal
 from app.models.order import Order
 from app.models.client import Client
 from app.models.payment import PaymentRecord
 from app.models.user import User
 from app.schemas import order as schemas
 from app.schemas import payment as payment_schemas
-from app.schemas.response import ResponseModel, success
+from app.schemas.response import ResponseModel, PageData, success
+from app.services import rollup, ledger, analysis_cache, columnar, search, order_balance, statement_import, order_import, client_stats
+from app.services.order_no import next_order_no
+from app.services.csv_import import csv_rows
+import codecs
 import datetime
-import random
+import json
 
 router = APIRouter()
 
 def generate_order_no():
-    """生成格式: ORD-20251224-1022-8848"""
-    now_str = datetime.datetime.now().strftime("%Y%m%d-%H%M")
-    random_str = str(random.randint(1000, 9999))
-    return f"ORD-{now_str}-{random_str}"
+    """生成格式: ORD-20251224-1022-0001 (分钟内递增，由 sys_sequence 分段分配)"""
+    return next_order_no()
 
 @router.post("", response_model=ResponseModel[schemas.OrderResponse])
 def create_order(
@@ -35,14 +41,9 @@ def create_order(
     if not client:
         raise HTTPException(status_code=404, detail="Client not found")
 
-    order_no = generate_order_no()
-    # Ensure uniqueness
-    while db.query(Order).filter(Order.order_no == order_no).first():
-        order_no = generate_order_no()
-
     db_order = Order(
         **order_in.model_dump(),
-        order_no=order_no,
+        order_no=generate_order_no(),
         client_name=client.name,
         creator_id=current_user.id,
         status="PENDING", # Default status
@@ -50,11 +51,77 @@ def create_order(
         total_paid=0.00
     )
     db.add(db_order)
+    db.flush()
+    rollup.refresh(db, sales=[db_order.created_at])
+    search.refresh(db, orders=[db_order.id])
+    client_stats.refresh(db, [db_order.client_id])
+    version = analysis_cache.bump(db)
     db.commit()
+    columnar.apply_changes(db, version, orders=[db_order.id])
     db.refresh(db_order)
     return success(db_order)
 
-@router.get("", response_model=ResponseModel[List[schemas.OrderResponse]])
+@router.post("/bulk", response_model=ResponseModel[schemas.OrderImportResult])
+def create_orders_bulk(
+    bulk_in: schemas.OrderBulkCreate,
+    db: Session = Depends(deps.get_db),
+    current_user: User = Depends(deps.get_current_user)
+) -> Any:
+    """
+    Create many orders at once. Clients are given by id or (unique) name.
+    Invalid items are skipped and reported; `items` maps each created order
+    to its 1-based position in the request.
+    """
+    rows = ((i, item.model_dump()) for i, item in enumerate(bulk_in.items, start=1))
+    return success(order_import.import_orders(db, rows, current_user.id, keep_items=True))
+
+@router.post("/import", response_model=ResponseModel[schemas.OrderImportResult])
+def import_orders(
+    file: UploadFile = File(...),
+    encoding: str = Form("utf-8-sig", description="File encoding, e.g. gbk for Excel exports"),
+    stream: bool = Form(False, description="Stream NDJSON progress events while importing"),
+    db: Session = Depends(deps.get_db),
+    current_user: User = Depends(deps.get_current_user)
+) -> Any:
+    """
+    Import orders from a CSV spreadsheet (客户/客户名称 or client_id, 产品信息,
+    金额, optional 订单类型, 合同号, 备注, 下单时间).
+    With `stream`, the response is NDJSON: a {"event": "progress", ...} line
+    after every written chunk, then {"event": "done", ...} with the result.
+    """
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        raise HTTPException(status_code=400, detail=f"Unknown encoding: {encoding}")
+    rows = order_import.csv_order_rows(csv_rows(file.file, encoding))
+    creator_id = current_user.id
+
+    if not stream:
+        try:
+            return success(order_import.import_orders(db, rows, creator_id))
+        except ValueError as e:
+            db.rollback()
+            raise HTTPException(status_code=400, detail=str(e))
+
+    def events():
+        # The request session is closed once the endpoint returns, use our own
+        import_db = SessionLocal()
+        try:
+            result = None
+            for result in order_import.iter_import(import_db, rows, creator_id):
+                progress = {k: result[k] for k in ("processed", "created", "failed")}
+                yield json.dumps({"event": "progress", **progress}) + "\n"
+            yield json.dumps({"event": "done", **result}, default=str) + "\n"
+        except ValueError as e:
+            import_db.rollback()
+            yield json.dumps({"event": "error", "detail": str(e)}) + "\n"
+        finally:
+            import_db.close()
+            file.file.close()
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@router.get("", response_model=ResponseModel[Union[PageData[schemas.OrderResponse], List[schemas.OrderResponse]]])
 def read_orders(
     db: Session = Depends(deps.get_db),
     current_user: User = Depends(deps.get_current_user),
@@ -63,10 +130,15 @@ def read_orders(
     status: Optional[str] = None,
     client_name: Optional[str] = None,
     order_no: Optional[str] = None,
-    pay_method: Optional[str] = None
+    pay_method: Optional[str] = None,
+    cursor: Optional[str] = Query(None, description="Keyset pagination cursor, empty for the first page"),
+    with_total: bool = False,
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. id,order_no,amount,status")
 ) -> Any:
     """
     Retrieve orders.
+    With `cursor`, returns a PageData page ordered by (created_at, id) instead of a list.
+    With `fields`, only those columns are selected and returned.
     """
     query = db.query(Order)
     
@@ -77,14 +149,21 @@ def read_orders(
     if status:
         query = query.filter(Order.status == status)
     if client_name:
-        query = query.filter(Order.client_name.ilike(f"%{client_name}%"))
+        query = query.filter(search.contains(db, "order.client_name", client_name))
     if order_no:
-        query = query.filter(Order.order_no.ilike(f"%{order_no}%"))
+        query = query.filter(search.contains(db, "order.order_no", order_no))
     if pay_method:
         query = query.filter(Order.pay_method == pay_method)
+
+    names = parse_fields(fields, Order, schemas.OrderResponse, ("id", "created_at"))
+    if names:
+        query = project(query, Order, names)
         
+    if cursor is not None:
+        page = keyset_page(db, query, Order.created_at, Order.id, cursor, limit, with_total)
+        return projected_response(page, schemas.OrderResponse, names) if names else success(page)
     orders = query.order_by(Order.created_at.desc()).offset(skip).limit(limit).all()
-    return success(orders)
+    return projected_response(orders, schemas.OrderResponse, names) if names else success(orders)
 
 @router.get("/stats", response_model=ResponseModel[schemas.OrderStats])
 def get_stats(
@@ -109,11 +188,8 @@ def get_stats(
     
     monthly_revenue = monthly_collection - monthly_refund
     
-    # 2. Pending Amount (Total uncollected amount for non-void orders)
-    pending_amount = db.query(func.sum(Order.amount - Order.total_paid)).filter(
-        Order.status != "VOID",
-        Order.status != "REFUNDED"
-    ).scalar() or 0
+    # 2. Pending Amount (Total uncollected amount for non-void orders, from the receivables ledger)
+    pending_amount = ledger.current_open_balance(db)
     
     # 3. Monthly Count (Orders created in this month)
     monthly_count = db.query(func.count(Order.id)).filter(
@@ -126,49 +202,31 @@ def get_stats(
         "monthly_count": monthly_count
     })
 
-def calculate_order_status(order: Order, db: Session):
+# Payment Records API
+@router.post("/payments/import", response_model=ResponseModel[payment_schemas.StatementImportResult])
+def import_payment_statement(
+    file: UploadFile = File(...),
+    pay_method: str = Form("BANK", description="WECHAT, ALIPAY, BANK"),
+    encoding: str = Form("utf-8-sig", description="File encoding, e.g. gbk for bank exports"),
+    db: Session = Depends(deps.get_db),
+    current_user: User = Depends(deps.get_current_user)
+) -> Any:
     """
-    Calculate and update order status based on payment records.
-    Status Logic:
-    - PENDING: Net Paid == 0
-    - PARTIAL: 0 < Net Paid < Total Price
-    - PAID: Net Paid >= Total Price
-    - REFUND_PART: Has refunds AND 0 < Net Paid < Total Price
-    - REFUNDED: Has refunds AND Net Paid == 0
+    Import a bank / WeChat / Alipay statement (CSV) as collections and refunds.
+    Lines are matched to orders by external transaction number or order number
+    and posted in batches; the response reports the outcome of every line.
     """
-    # 1. Get all payment records
-    records = db.query(PaymentRecord).filter(PaymentRecord.order_id == order.id).all()
-    
-    total_collection = sum(r.amount for r in records if r.type == 1)
-    total_refund = sum(r.amount for r in records if r.type == 2)
-    net_paid = total_collection - total_refund
-    has_refund = any(r.type == 2 for r in records)
-    
-    order.total_paid = net_paid
-    order.actual_amount = net_paid # Sync legacy field
-    
-    # 2. Determine status
-    if net_paid >= order.amount:
-        order.status = "PAID"
-        if not order.pay_time:
-            order.pay_time = datetime.datetime.now()
-    elif net_paid > 0:
-        if has_refund:
-            order.status = "REFUND_PART"
-        else:
-            order.status = "PARTIAL"
-    else:
-        # Net paid == 0 (or less, though shouldn't happen if validation is correct)
-        if has_refund:
-             order.status = "REFUNDED"
-        else:
-             order.status = "PENDING"
-             order.pay_time = None # Reset pay time
-
-    db.add(order)
-    db.flush()
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        raise HTTPException(status_code=400, detail=f"Unknown encoding: {encoding}")
+    try:
+        result = statement_import.import_statement(db, csv_rows(file.file, encoding), pay_method, current_user.id)
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    return success(result)
 
-# Payment Records API
 @router.post("/{id}/payments", response_model=ResponseModel[payment_schemas.PaymentRecordResponse])
 def create_payment_record(
     id: str,
@@ -193,10 +251,16 @@ def create_payment_record(
     db.add(payment)
     db.flush() # Get ID
     
-    # Recalculate order status
-    calculate_order_status(order, db)
+    # Apply to the order counters; the refund check is repeated atomically against concurrent payments
+    if not order_balance.apply_payment(db, order, payment.type, payment.amount):
+        db.rollback()
+        raise HTTPException(status_code=400, detail="退款金额不能大于已收金额")
+    rollup.refresh(db, sales=[order.created_at], payments=[payment.pay_time])
+    client_stats.refresh(db, [order.client_id])
+    version = analysis_cache.bump(db)
     
     db.commit()
+    columnar.apply_changes(db, version, orders=[id], payments=[payment.id])
     db.refresh(payment)
     return success(payment)
 
@@ -220,13 +284,18 @@ def delete_payment_record(
     if not payment:
         raise HTTPException(status_code=404, detail="Payment record not found")
         
+    pay_time = payment.pay_time
     db.delete(payment)
     db.flush()
     
     order = db.query(Order).filter(Order.id == id).first()
-    calculate_order_status(order, db)
+    order_balance.apply_payment(db, order, payment.type, payment.amount, sign=-1)
+    rollup.refresh(db, sales=[order.created_at], payments=[pay_time])
+    client_stats.refresh(db, [order.client_id])
+    version = analysis_cache.bump(db)
     
     db.commit()
+    columnar.apply_changes(db, version, orders=[id], payments=[payment_id])
     db.refresh(order)
     return success(order)
 
@@ -248,7 +317,12 @@ def void_order(
         
     order.status = "VOID"
     db.add(order)
+    db.flush()
+    rollup.refresh(db, sales=[order.created_at])
+    client_stats.refresh(db, [order.client_id])
+    version = analysis_cache.bump(db)
     db.commit()
+    columnar.apply_changes(db, version, orders=[id])
     db.refresh(order)
     return success(order)
 
@@ -276,11 +350,19 @@ def update_order(
         raise HTTPException(status_code=404, detail="Order not found")
     
     update_data = order_in.model_dump(exclude_unset=True)
+    type_changed = "order_type" in update_data and update_data["order_type"] != order.order_type
     for field, value in update_data.items():
         setattr(order, field, value)
     
     db.add(order)
+    db.flush()
+    # Payments are rolled up by their order's type
+    payment_days = rollup.order_payment_days(db, order.id) if type_changed else []
+    rollup.refresh(db, sales=[order.created_at], payments=payment_days)
+    client_stats.refresh(db, [order.client_id])
+    version = analysis_cache.bump(db)
     db.commit()
+    columnar.apply_changes(db, version, orders=[id])
     db.refresh(order)
     return success(order)
 
@@ -303,7 +385,12 @@ def update_order_status(
         order.external_transaction_no = external_transaction_no
         
     db.add(order)
+    db.flush()
+    rollup.refresh(db, sales=[order.created_at])
+    client_stats.refresh(db, [order.client_id])
+    version = analysis_cache.bump(db)
     db.commit()
+    columnar.apply_changes(db, version, orders=[id])
     db.refresh(order)
     return success(order)
 
@@ -1,93 +1,142 @@
 from typing import Any
-from fastapi import APIRouter, UploadFile, File, HTTPException
-import shutil
-import os
-import uuid
+from fastapi import APIRouter, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
 import logging
 from app.schemas.response import ResponseModel, success
-from app.core.config import settings
+from app.services import thumbnails, uploads
+
+try:
+    import python_multipart as multipart
+    from python_multipart.multipart import parse_options_header
+except ModuleNotFoundError: # python-multipart < 0.0.13
+    import multipart
+    from multipart.multipart import parse_options_header
 
 router = APIRouter()
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
-# Ensure upload directory exists
-os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+FILE_FIELD = b"file"
+
+# The body is parsed as it streams in (see upload_file), describe the form for the docs
+UPLOAD_FORM = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["file"],
+            "properties": {"file": {"type": "string", "format": "binary"}},
+        }}},
+    }
+}
+
+class _PartEvents:
+    """python-multipart callbacks collecting the events of one written chunk."""
+
+    def __init__(self):
+        self.events = []
+        self._field = b""
+        self._value = b""
+        self._headers = {}
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self._part_begin,
+            "on_header_field": self._header_field,
+            "on_header_value": self._header_value,
+            "on_header_end": self._header_end,
+            "on_headers_finished": self._headers_finished,
+            "on_part_data": self._part_data,
+            "on_part_end": self._part_end,
+        }
+
+    def _part_begin(self):
+        self._headers = {}
+
+    def _header_field(self, data, start, end):
+        self._field += data[start:end]
+
+    def _header_value(self, data, start, end):
+        self._value += data[start:end]
+
+    def _header_end(self):
+        self._headers[self._field.lower()] = self._value
+        self._field, self._value = b"", b""
 
-@router.post("", response_model=ResponseModel[dict])
-async def upload_file(
-    file: UploadFile = File(...)
-) -> Any:
+    def _headers_finished(self):
+        self.events.append(("headers", self._headers))
+
+    def _part_data(self, data, start, end):
+        self.events.append(("data", data[start:end]))
+
+    def _part_end(self):
+        self.events.append(("end", None))
+
+async def _receive_file(request: Request):
     """
-    Upload a file and return the URL.
+    Stream the `file` part of a multipart body into an UploadWriter, one
+    thread hop per received chunk. Returns (original name, StoredFile).
     """
-    logger.info(f"--- Upload Request Start ---")
-    logger.info(f"File name: {file.filename}, Size: {file.size if hasattr(file, 'size') else 'unknown'}")
-    
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+
+    parts = _PartEvents()
+    parser = multipart.MultipartParser(params[b"boundary"], parts.callbacks())
+    writer, filename, in_file = None, None, False
     try:
-        if not file:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            data = []
+            for kind, value in parts.events:
+                if kind == "headers":
+                    _, options = parse_options_header(value.get(b"content-disposition", b""))
+                    if writer is None and options.get(b"name") == FILE_FIELD and b"filename" in options:
+                        filename = options[b"filename"].decode("utf-8", "replace")
+                        # Type checked from the part headers, before any of the content is read
+                        ext = uploads.extension(filename, value.get(b"content-type", b"").decode("latin-1"))
+                        writer = await run_in_threadpool(uploads.UploadWriter, ext)
+                        in_file = True
+                elif kind == "data" and in_file:
+                    data.append(value)
+                elif kind == "end":
+                    in_file = False
+            parts.events.clear()
+            if data:
+                await run_in_threadpool(writer.write, b"".join(data))
+        parser.finalize()
+        if writer is None:
             raise HTTPException(status_code=400, detail="No file uploaded")
-
-        # Generate unique filename
-        ext = os.path.splitext(file.filename)[1].lower()
-        if not ext:
-            # Fallback for files without extension
-            mime_map = {
-                'image/jpeg': '.jpg',
-                'image/png': '.png',
-                'image/gif': '.gif',
-                'application/pdf': '.pdf'
-            }
-            ext = mime_map.get(file.content_type, '.bin')
-            
-        filename = f"{uuid.uuid4()}{ext}"
-        
-        # Ensure upload directory exists
-        upload_dir = os.path.abspath(settings.UPLOAD_DIR)
-        if not os.path.exists(upload_dir):
-            try:
-                os.makedirs(upload_dir, exist_ok=True)
-                logger.info(f"Created upload directory: {upload_dir}")
-            except Exception as e:
-                logger.error(f"Failed to create upload directory {upload_dir}: {str(e)}")
-                raise HTTPException(status_code=500, detail=f"Failed to create upload directory: {str(e)}")
-        
-        # Check if directory is writable
-        if not os.access(upload_dir, os.W_OK):
-            logger.error(f"Upload directory is not writable: {upload_dir}")
-            raise HTTPException(status_code=500, detail="Upload directory is not writable")
-            
-        file_path = os.path.join(upload_dir, filename)
-        logger.info(f"Target path: {file_path}")
-        
-        # Save file with error checking
-        try:
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-        except IOError as e:
-            logger.error(f"Failed to write file to disk: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Disk write error: {str(e)}")
-            
-        logger.info(f"File saved successfully: {filename}")
-        
-        # Check if file actually exists after saving
-        if not os.path.exists(file_path):
-            logger.error(f"File saved but not found on disk: {file_path}")
-            raise HTTPException(status_code=500, detail="File verify failed after save")
-
-        # Relative URL for frontend
-        url = f"/uploads/{filename}"
-        
-        return success({
-            "name": file.filename,
-            "url": url,
-            "type": ext.replace('.', '')
-        })
-    except HTTPException:
+        stored = await run_in_threadpool(writer.finish)
+    except uploads.UploadRejected as e:
+        if writer is not None:
+            await run_in_threadpool(writer.abort)
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except BaseException:
+        if writer is not None:
+            await run_in_threadpool(writer.abort)
         raise
-    except Exception as e:
-        logger.error(f"Upload process failed: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Upload error: {str(e)}")
-    finally:
-        logger.info(f"--- Upload Request End ---")
+    return filename, stored
+
+@router.post("", response_model=ResponseModel[dict], openapi_extra=UPLOAD_FORM)
+async def upload_file(request: Request) -> Any:
+    """
+    Upload a file (multipart field `file`) and return the URL.
+    The body is streamed to disk while hashing, never held in memory; the
+    type is checked from the part headers and the size as it arrives
+    (UPLOAD_ALLOWED_EXTENSIONS, UPLOAD_MAX_BYTES). Identical content is
+    stored once and gets the same URL. Images and PDFs get previews at
+    `url?size=N` (THUMBNAIL_SIZES) shortly after.
+    """
+    name, stored = await _receive_file(request)
+    logger.info(f"Upload {name}: {stored.size} bytes -> {stored.name}{'' if stored.created else ' (already stored)'}")
+    # Previews render in the thumbnail processes, the response does not wait for them
+    await run_in_threadpool(thumbnails.submit, uploads.resolve(uploads.shard_path(stored.name)))
+
+    return success({
+        "name": name,
+        "url": stored.url,
+        "type": stored.ext.replace('.', ''),
+        "size": stored.size
+    })
@@ -28,6 +28,30 @@ class Settings(BaseSettings):
     # Uploads
     # Default to a local 'uploads' directory relative to the app
     UPLOAD_DIR: str = os.path.join(BASE_DIR, "uploads")
+    # Largest accepted upload, and the accepted file extensions
+    UPLOAD_MAX_BYTES: int = 20 * 1024 * 1024
+    UPLOAD_ALLOWED_EXTENSIONS: List[str] = [
+        ".jpg", ".jpeg", ".png", ".gif", ".webp", ".pdf", ".csv", ".txt", ".xls", ".xlsx", ".doc", ".docx"
+    ]
+    # Preview sizes (longest edge in pixels, served as /uploads/...?size=N) and
+    # the processes rendering them; needs Pillow, and PyMuPDF for PDF previews
+    THUMBNAIL_SIZES: List[int] = [200, 800]
+    THUMBNAIL_WORKERS: int = 2
+
+    # Analysis result cache (per worker, invalidated through sys_data_version)
+    ANALYSIS_CACHE_ENABLED: bool = True
+    ANALYSIS_CACHE_MAX_ENTRIES: int = 256
+    ANALYSIS_CACHE_MAX_BYTES: int = 8 * 1024 * 1024
+
+    # Analysis engine: "sql" (rollup tables) or "numpy" (in-memory columns, needs NumPy installed)
+    ANALYTICS_ENGINE: str = "sql"
+
+    # Order numbers leased per worker from sys_sequence in one round trip
+    ORDER_NO_BLOCK_SIZE: int = 20
+
+    # Idempotency-Key replays: how long a key is remembered, and the per-worker LRU in front of sys_idempotency_key
+    IDEMPOTENCY_TTL_HOURS: int = 24
+    IDEMPOTENCY_CACHE_SIZE: int = 1024
     
     @model_validator(mode='after')
     def assemble_db_connection(self) -> 'Settings':
@@ -0,0 +1,198 @@
+"""
+Dialect-aware date helpers for aggregation queries.
+
+- `date_bucket(column, unit)` renders a date/datetime column as its bucket
+  label and compiles per backend (SQLite strftime, MySQL DATE_FORMAT,
+  PostgreSQL date_trunc + to_char), so GROUP BY runs in the database.
+- `bucket_labels(start, end, unit)` generates the same labels in Python, to
+  pre-fill series with empty buckets.
+- `day_range(column, start, end)` builds sargable inclusive day-range
+  predicates for DATE and DATETIME columns alike.
+- `shift_range(start, end, unit, periods)` moves a range by whole periods for
+  period-over-period comparisons (month ends stay month ends).
+- `day_spans(days)` groups scattered days into a few ranges for refreshes.
+- `as_date(value)` normalizes date values returned by any backend.
+
+Labels: day 'YYYY-MM-DD', week 'YYYY-MM-DD' of its Monday, month 'YYYY-MM',
+quarter 'YYYY-Qn', year 'YYYY'.
+"""
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, List, Optional, Tuple
+import calendar
+
+from sqlalchemy import Date, DateTime, Integer, String, cast, literal
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql import func
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.sql.visitors import InternalTraversal
+
+UNITS = ("day", "week", "month", "quarter", "year")
+
+class date_bucket(FunctionElement):
+    """Bucket label of a date/datetime column, e.g. date_bucket(Order.created_at, 'month')."""
+    type = String()
+    name = "date_bucket"
+    inherit_cache = True
+    # The unit changes the rendered SQL, so it must be part of the statement cache key
+    _traverse_internals = FunctionElement._traverse_internals + [("unit", InternalTraversal.dp_string)]
+
+    def __init__(self, column, unit: str):
+        if unit not in UNITS:
+            raise ValueError(f"Unknown date bucket unit: {unit}")
+        self.unit = unit
+        super().__init__(column)
+
+    @property
+    def column(self):
+        return list(self.clauses)[0]
+
+def _compile(compiler, expr, **kw):
+    return compiler.process(expr, **kw)
+
+@compiles(date_bucket, "sqlite")
+def _date_bucket_sqlite(element, compiler, **kw):
+    column = element.column
+    formats = {"day": "%Y-%m-%d", "month": "%Y-%m", "year": "%Y"}
+    if element.unit in formats:
+        return _compile(compiler, func.strftime(formats[element.unit], column), **kw)
+    if element.unit == "week":
+        # Back to Monday: %w is 0 for Sunday
+        weekday = (cast(func.strftime("%w", column), Integer) + 6) % 7
+        return _compile(compiler, func.date(column, literal("-").concat(cast(weekday, String)).concat(" days")), **kw)
+    quarter = (cast(func.strftime("%m", column), Integer) + 2) // 3
+    return _compile(compiler, func.strftime("%Y-Q", column).concat(cast(quarter, String)), **kw)
+
+@compiles(date_bucket, "mysql")
+@compiles(date_bucket, "mariadb")
+def _date_bucket_mysql(element, compiler, **kw):
+    column = element.column
+    formats = {"day": "%Y-%m-%d", "month": "%Y-%m", "year": "%Y"}
+    if element.unit in formats:
+        return _compile(compiler, func.date_format(column, formats[element.unit]), **kw)
+    if element.unit == "week":
+        # WEEKDAY() is 0 for Monday
+        monday = func.subdate(func.date(column), func.weekday(column))
+        return _compile(compiler, func.date_format(monday, "%Y-%m-%d"), **kw)
+    return _compile(compiler, func.concat(func.year(column), "-Q", func.quarter(column)), **kw)
+
+@compiles(date_bucket, "postgresql")
+def _date_bucket_postgresql(element, compiler, **kw):
+    formats = {
+        "day": "YYYY-MM-DD", "week": "YYYY-MM-DD", "month": "YYYY-MM",
+        "quarter": 'YYYY-"Q"Q', "year": "YYYY"
+    }
+    truncated = func.date_trunc(element.unit, element.column)
+    return _compile(compiler, func.to_char(truncated, formats[element.unit]), **kw)
+
+@compiles(date_bucket)
+def _date_bucket_default(element, compiler, **kw):
+    raise NotImplementedError(f"date_bucket is not supported on {compiler.dialect.name}")
+
+# --- Python side ---
+
+def as_date(value) -> Optional[date]:
+    """Normalize datetime/date/'YYYY-MM-DD' (SQLite date()) values to a date."""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+def bucket_start(value, unit: str) -> date:
+    """First day of the bucket containing `value`."""
+    if isinstance(value, datetime):
+        value = value.date()
+    if unit == "day":
+        return value
+    if unit == "week":
+        return value - timedelta(days=value.weekday())
+    if unit == "month":
+        return value.replace(day=1)
+    if unit == "quarter":
+        return value.replace(month=(value.month - 1) // 3 * 3 + 1, day=1)
+    if unit == "year":
+        return value.replace(month=1, day=1)
+    raise ValueError(f"Unknown date bucket unit: {unit}")
+
+def bucket_label(value, unit: str) -> str:
+    """Python counterpart of `date_bucket` for one date."""
+    start = bucket_start(value, unit)
+    if unit in ("day", "week"):
+        return start.strftime("%Y-%m-%d")
+    if unit == "month":
+        return start.strftime("%Y-%m")
+    if unit == "quarter":
+        return f"{start.year}-Q{(start.month - 1) // 3 + 1}"
+    return str(start.year)
+
+def bucket_labels(start, end, unit: str) -> List[str]:
+    """Labels of every bucket overlapping [start, end], in order."""
+    if isinstance(end, datetime):
+        end = end.date()
+    labels = []
+    curr = bucket_start(start, unit)
+    while curr <= end:
+        labels.append(bucket_label(curr, unit))
+        curr = shift_date(curr, unit, 1)
+    return labels
+
+def shift_date(value, unit: str, periods: int):
+    """Move a date/datetime by whole periods, clamping the day to the target month."""
+    if unit == "day":
+        return value + timedelta(days=periods)
+    if unit == "week":
+        return value + timedelta(weeks=periods)
+    months = {"month": 1, "quarter": 3, "year": 12}[unit] * periods
+    index = value.year * 12 + value.month - 1 + months
+    year, month = divmod(index, 12)
+    _, last_day = calendar.monthrange(year, month + 1)
+    return value.replace(year=year, month=month + 1, day=min(value.day, last_day))
+
+def shift_range(start, end, unit: str, periods: int = -1) -> Tuple:
+    """
+    Shift [start, end] by whole periods. When `end` is the last day of its
+    month it stays the last day of the target month (Mar 31 -> Feb 28/29).
+    """
+    prev_start = shift_date(start, unit, periods)
+    prev_end = shift_date(end, unit, periods)
+    if unit in ("month", "quarter", "year"):
+        _, last_day = calendar.monthrange(end.year, end.month)
+        if end.day == last_day:
+            _, prev_last_day = calendar.monthrange(prev_end.year, prev_end.month)
+            prev_end = prev_end.replace(day=prev_last_day)
+    return prev_start, prev_end
+
+def day_spans(days: Iterable[date], max_gap: int = 7) -> List[Tuple[date, date]]:
+    """
+    Group days into (first, last) spans, split where consecutive days are more
+    than `max_gap` days apart, so refreshing scattered days reads a few
+    ranges instead of one query per day or one huge range.
+    """
+    spans = []
+    for day in sorted(set(days)):
+        if spans and (day - spans[-1][1]).days <= max_gap:
+            spans[-1][1] = day
+        else:
+            spans.append([day, day])
+    return [(first, last) for first, last in spans]
+
+def day_range(column, start: Optional[date] = None, end: Optional[date] = None) -> list:
+    """
+    Inclusive day-range predicates on `column`. DATE columns compare with
+    dates; DATETIME columns use [start 00:00, day after end 00:00) so the
+    column stays indexable and no backend has to cast it.
+    """
+    is_datetime = isinstance(column.type, DateTime) or not isinstance(column.type, Date)
+    filters = []
+    if start is not None:
+        start = start.date() if isinstance(start, datetime) else start
+        filters.append(column >= (datetime.combine(start, time.min) if is_datetime else start))
+    if end is not None:
+        end = end.date() if isinstance(end, datetime) else end
+        if is_datetime:
+            filters.append(column < datetime.combine(end + timedelta(days=1), time.min))
+        else:
+            filters.append(column <= end)
+    return filters
@@ -0,0 +1,69 @@
+"""
+In-place schema upgrades for existing databases.
+
+`create_all` only creates missing tables. `upgrade_schema()` runs after it and
+adds the columns and indexes that models gained since a table was created.
+Added columns must be nullable or carry a server_default, so existing rows
+get a value. Integer columns that became strings in the model (user ids are
+UUIDs) are converted in place, existing values kept as text.
+"""
+from typing import List
+import logging
+
+from sqlalchemy import Integer, String, inspect, text
+from sqlalchemy.schema import CreateColumn
+
+logger = logging.getLogger(__name__)
+
+def _to_string_ddl(bind, preparer, table, column) -> str:
+    """ALTER converting an integer column to the model's string type, None when not needed."""
+    table_name = preparer.format_table(table)
+    name = preparer.format_column(column)
+    column_type = column.type.compile(dialect=bind.dialect)
+    if bind.dialect.name == "mysql":
+        return f"ALTER TABLE {table_name} MODIFY COLUMN {name} {column_type} NULL"
+    if bind.dialect.name == "postgresql":
+        return f"ALTER TABLE {table_name} ALTER COLUMN {name} TYPE {column_type} USING {name}::{column_type}"
+    return None # SQLite does not enforce column types
+
+
+def upgrade_schema(bind, metadata) -> List[str]:
+    """Add missing columns and indexes. Returns the added columns as 'table.column'."""
+    inspector = inspect(bind)
+    preparer = bind.dialect.identifier_preparer
+    added = []
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"]: column["type"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                if isinstance(column.type, String) and isinstance(existing[column.name], Integer):
+                    ddl = _to_string_ddl(bind, preparer, table, column)
+                    if ddl is None:
+                        continue
+                    try:
+                        with bind.begin() as conn:
+                            conn.execute(text(ddl))
+                        logger.info(f"Converted {table.name}.{column.name} to {column.type}")
+                    except Exception as e:
+                        logger.error(f"Failed to convert {table.name}.{column.name}: {e}")
+                continue
+            if not column.nullable and column.server_default is None:
+                logger.error(f"Cannot add {table.name}.{column.name}: NOT NULL without server_default")
+                continue
+            ddl = CreateColumn(column).compile(dialect=bind.dialect)
+            try:
+                with bind.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}"))
+                added.append(f"{table.name}.{column.name}")
+                logger.info(f"Added column {table.name}.{column.name}")
+            except Exception as e:
+                logger.error(f"Failed to add column {table.name}.{column.name}: {e}")
+
+        for index in table.indexes:
+            try:
+                index.create(bind=bind, checkfirst=True)
+            except Exception as e:
+                logger.error(f"Failed to create index {index.name}: {e}")
+    return added
@@ -3,10 +3,15 @@ from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
 
 connect_args = {}
+engine_args = {}
 if settings.SQLALCHEMY_DATABASE_URI.startswith("sqlite"):
     connect_args["check_same_thread"] = False
+elif settings.SQLALCHEMY_DATABASE_URI.startswith("mysql"):
+    # Like PostgreSQL's default: reads after analysis_cache.lock() see the
+    # writes committed while waiting for it, not the transaction's first snapshot
+    engine_args["isolation_level"] = "READ COMMITTED"
 
 engine = create_engine(
-    settings.SQLALCHEMY_DATABASE_URI, connect_args=connect_args
+    settings.SQLALCHEMY_DATABASE_URI, connect_args=connect_args, **engine_args
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
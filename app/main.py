@@ -4,11 +4,19 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, JSONResponse
 from app.core.config import settings
 from app.api.v1.api import api_router
+from app.api.idempotency import IdempotencyMiddleware
+from app.api.body_limit import BodyLimitMiddleware
+from app.api.upload_files import UploadFiles
 from app.db.base import Base
-from app.db.session import engine
+from app.db.session import engine, SessionLocal
+from app.db.schema import upgrade_schema
+from app.services import rollup, ledger, analysis_cache, columnar, search, order_balance, client_identity, client_stats, uploads, thumbnails
 import os
 import logging
 
+# Multipart boundaries and part headers around the file itself
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -22,6 +30,34 @@ except ImportError:
 
 # Create tables
 Base.metadata.create_all(bind=engine)
+# create_all skips tables that already exist, add columns and indexes introduced since
+upgrade_schema(engine, Base.metadata)
+
+# Prepare derived data: cache version counter, analysis rollups, receivables ledger, search index, client identity keys, payment counters and client stats on first start after an upgrade
+def init_derived_data():
+    db = SessionLocal()
+    try:
+        # First and on its own: the refund guard and status derivation depend on the counters
+        order_balance.ensure_counters(db)
+    except Exception as e:
+        logger.error(f"Failed to fill order payment counters: {e}")
+        db.rollback()
+    try:
+        analysis_cache.ensure_scope(db)
+        rollup.ensure_built(db)
+        ledger.ensure_built(db)
+        search.ensure_built(db)
+        client_identity.ensure_built(db)
+        # After the counters: collected/outstanding are summed from total_paid
+        client_stats.ensure_built(db)
+        columnar.init_engine(db)
+    except Exception as e:
+        logger.error(f"Failed to prepare derived data: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+init_derived_data()
 
 def get_application() -> FastAPI:
     application = FastAPI(
@@ -43,6 +79,16 @@ def get_application() -> FastAPI:
         allow_headers=["*"],
     )
 
+    # Idempotency-Key replays for write requests (retried order / payment posts run once)
+    application.add_middleware(IdempotencyMiddleware)
+
+    # Oversized uploads are refused before their body is read (added last: runs before the idempotency buffering)
+    application.add_middleware(
+        BodyLimitMiddleware,
+        max_bytes=settings.UPLOAD_MAX_BYTES + UPLOAD_FORM_OVERHEAD,
+        path_prefix="/api/v1/upload"
+    )
+
     # Middleware to log all requests
     @application.middleware("http")
     async def log_requests(request: Request, call_next):
@@ -78,18 +124,12 @@ def get_application() -> FastAPI:
             logger.info(f"Created upload directory: {upload_dir}")
         except Exception as e:
             logger.error(f"Failed to create upload directory {upload_dir}: {e}")
-    
-    # Debug: List contents of upload directory
-    try:
-        files = os.listdir(upload_dir)
-        logger.info(f"Upload directory {upload_dir} contains {len(files)} files")
-        if len(files) > 0:
-            logger.info(f"Sample files: {files[:5]}")
-    except Exception as e:
-        logger.error(f"Cannot list upload directory: {e}")
 
     logger.info(f"Mounting /uploads to {upload_dir}")
-    application.mount("/uploads", StaticFiles(directory=upload_dir, check_dir=False), name="uploads")
+    # Serves the sharded layout, and flat URLs stored before it
+    application.mount("/uploads", UploadFiles(directory=upload_dir, check_dir=False), name="uploads")
+    if thumbnails.Image is None:
+        logger.warning("Pillow is not installed, receipt previews (/uploads/...?size=N) serve the original files")
 
     # API routes
     application.include_router(api_router, prefix="/api/v1")
@@ -134,9 +174,8 @@ def get_application() -> FastAPI:
             
             # Special handling for uploads path if not caught by mount
             if full_path.startswith("uploads/"):
-                relative_file = full_path.replace("uploads/", "", 1)
-                file_path = os.path.join(upload_dir, relative_file)
-                if os.path.isfile(file_path):
+                file_path = uploads.resolve(full_path.replace("uploads/", "", 1))
+                if file_path:
                     return FileResponse(file_path)
 
             # Check if it's a direct file request (like favicon.svg, robots.txt)
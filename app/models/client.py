@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, DateTime, Text, JSON, ForeignKey
+from sqlalchemy import Column, String, Integer, DateTime, Text, JSON, ForeignKey, Index, Numeric
 from sqlalchemy.orm import relationship
 from app.db.base_class import Base
 import uuid
@@ -30,6 +30,17 @@ class Client(Base):
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
     follow_ups = relationship("FollowUp", back_populates="client", cascade="all, delete-orphan")
+    # Precomputed figures, see app.services.client_stats (no row yet: all zero)
+    stats = relationship(
+        "ClientStats", uselist=False, viewonly=True,
+        primaryjoin="Client.id == foreign(ClientStats.client_id)"
+    )
+
+    __table_args__ = (
+        Index("ix_client_created_id", "created_at", "id"), # Keyset pagination
+        Index("ix_client_status_created", "status", "created_at", "id"), # List by status
+        Index("ix_client_creator_created", "creator_id", "created_at", "id"), # Staff's own clients
+    )
 
 class FollowUp(Base):
     __tablename__ = "sys_client_followup" # As per doc
@@ -44,3 +55,28 @@ class FollowUp(Base):
     created_at = Column(DateTime, default=datetime.now)
     
     client = relationship("Client", back_populates="follow_ups")
+
+    __table_args__ = (
+        Index("ix_followup_client_created_id", "client_id", "created_at", "id"), # Keyset pagination
+    )
+
+class ClientIdentity(Base):
+    __tablename__ = "sys_client_identity"
+
+    # Normalized identity keys of clients, at most one client per key (see app.services.client_identity)
+    kind = Column(String(20), primary_key=True) # enterprise_name, phone, wechat
+    value = Column(String(100), primary_key=True)
+    client_id = Column(String(36), nullable=False, index=True)
+
+class ClientStats(Base):
+    __tablename__ = "sys_client_stats"
+
+    # Per-client figures kept current by the write paths (see app.services.client_stats)
+    client_id = Column(String(36), primary_key=True)
+    order_count = Column(Integer, default=0, nullable=False) # Orders not VOID/CANCELLED
+    sales_amount = Column(Numeric(12, 2), default=0, nullable=False) # Amount of those orders
+    collected_amount = Column(Numeric(12, 2), default=0, nullable=False) # Net paid over all orders
+    outstanding_amount = Column(Numeric(12, 2), default=0, nullable=False) # Unpaid amount of open orders
+    license_count = Column(Integer, default=0, nullable=False)
+    last_followup_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
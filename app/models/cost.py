@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Text, Numeric, DateTime, ForeignKey, Date
+from sqlalchemy import Column, String, Integer, Text, Numeric, DateTime, ForeignKey, Date, Index
 from app.db.base_class import Base
 import uuid
 from datetime import datetime
@@ -26,6 +26,12 @@ class Cost(Base):
     # --- 审计与凭证 ---
     invoice_url = Column(String(500), nullable=True, doc="发票/回单截图 URL")
     remark = Column(Text, nullable=True, doc="详细备注")
+    import_hash = Column(String(64), nullable=True, unique=True, index=True, doc="账单导入行的内容哈希，重复导入去重")
     
     creator_id = Column(String(36), ForeignKey("sys_user.id"), nullable=True)
     created_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        Index("ix_cost_pay_time_id", "pay_time", "id"), # Keyset pagination
+        Index("ix_cost_creator_pay_time", "creator_id", "pay_time", "id"), # Staff's own costs
+    )
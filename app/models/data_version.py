@@ -0,0 +1,11 @@
+from sqlalchemy import Column, String, Integer, DateTime
+from app.db.base_class import Base
+from datetime import datetime
+
+class DataVersion(Base):
+    __tablename__ = "sys_data_version"
+
+    # One counter per cached data set, e.g. "analysis"
+    scope = Column(String(50), primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
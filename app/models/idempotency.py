@@ -0,0 +1,14 @@
+from sqlalchemy import Column, String, Integer, DateTime, Text
+from app.db.base_class import Base
+from datetime import datetime
+
+class IdempotencyRecord(Base):
+    __tablename__ = "sys_idempotency_key"
+
+    # sha256 of (Idempotency-Key header, method, path, caller), see app.services.idempotency
+    key = Column(String(64), primary_key=True)
+    request_hash = Column(String(64), nullable=False) # sha256 of the request body
+    status_code = Column(Integer, nullable=True) # None while the first request is running
+    content_type = Column(String(100), nullable=True)
+    response_body = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.now, nullable=False, index=True)
@@ -0,0 +1,29 @@
+from sqlalchemy import Column, String, Integer, Date, Numeric, Index
+from app.db.base_class import Base
+
+# Running receivables ledger owned by app.services.ledger.
+# One checkpoint row per (day, order_type) with activity; the "*" order_type
+# holds the totals over all types. Balances are cumulative through `day`, so
+# the balance as of any date is the latest checkpoint on or before it.
+
+ALL_ORDER_TYPES = "*"
+
+class ReceivableLedger(Base):
+    __tablename__ = "sys_receivable_ledger"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    day = Column(Date, nullable=False)
+    order_type = Column(String(20), nullable=False) # Order.order_type or ALL_ORDER_TYPES
+
+    # Activity of the day
+    sales_amount = Column(Numeric(14, 2), default=0.00, nullable=False) # Orders created (all statuses)
+    collected_amount = Column(Numeric(14, 2), default=0.00, nullable=False) # Collections (type=1) received
+    open_amount = Column(Numeric(14, 2), default=0.00, nullable=False) # amount - total_paid of open orders created
+
+    # Cumulative through the day
+    balance = Column(Numeric(14, 2), default=0.00, nullable=False) # sales - collections
+    open_balance = Column(Numeric(14, 2), default=0.00, nullable=False) # Outstanding on non-void orders
+
+    __table_args__ = (
+        Index("ix_receivable_ledger_type_day", "order_type", "day", unique=True),
+    )
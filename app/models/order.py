@@ -1,6 +1,7 @@
-from sqlalchemy import Column, String, Integer, DateTime, Text, Boolean, Numeric, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, Integer, DateTime, Text, Boolean, Numeric, ForeignKey, Index, select
+from sqlalchemy.orm import relationship, column_property
 from app.db.base_class import Base
+from app.models.client import Client
 import uuid
 from datetime import datetime
 
@@ -24,7 +25,7 @@ class Order(Base):
     order_type = Column(String(20), default="NEW", nullable=False) # NEW, RENEW, UPSELL, SERVICE, IMPLEMENTATION
     pay_method = Column(String(20), default="BANK", nullable=False) # WECHAT, ALIPAY, BANK, CASH
     pay_time = Column(DateTime, nullable=True)
-    external_transaction_no = Column(String(100), nullable=True) # External Transaction ID
+    external_transaction_no = Column(String(100), nullable=True, index=True) # External Transaction ID
     
     contract_no = Column(String(50), nullable=True)
     is_invoiced = Column(Boolean, default=False)
@@ -38,11 +39,23 @@ class Order(Base):
     # New fields for V2
     attachments = Column(Text, default="[]") # JSON string: [{"name": "x", "url": "x", "type": "x"}]
     total_paid = Column(Numeric(10, 2), default=0.00)
+    # Payment counters maintained by app.services.order_balance
+    total_refunded = Column(Numeric(10, 2), default=0.00, server_default="0", nullable=False)
+    refund_count = Column(Integer, default=0, server_default="0", nullable=False)
 
     # Relationships
     client = relationship("Client", backref="orders")
     payment_records = relationship("PaymentRecord", back_populates="order", cascade="all, delete-orphan")
 
-    @property
-    def client_type(self):
-        return self.client.type if self.client else None
+    __table_args__ = (
+        Index("ix_order_created_id", "created_at", "id"), # Keyset pagination
+        Index("ix_order_status_created", "status", "created_at", "id"), # List by status
+        Index("ix_order_creator_created", "creator_id", "created_at", "id"), # Staff's own orders
+        Index("ix_order_type_created", "order_type", "created_at"), # Sales by order type
+        Index("ix_order_status_pay_time", "status", "pay_time"), # Deal clients by pay time
+    )
+
+    # Loaded in the order's own SELECT, so serializing a page of orders does not load each client
+    client_type = column_property(
+        select(Client.type).where(Client.id == client_id).correlate_except(Client).scalar_subquery()
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, DateTime, Numeric, ForeignKey, Text
+from sqlalchemy import Column, String, Integer, DateTime, Numeric, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from app.db.base_class import Base
 import uuid
@@ -17,11 +17,16 @@ class PaymentRecord(Base):
     amount = Column(Numeric(10, 2), nullable=False)
     type = Column(Integer, default=1, nullable=False) # 1: Collection (收款), 2: Refund (退款)
     pay_method = Column(String(20), nullable=False) # WECHAT, ALIPAY, BANK
-    transaction_id = Column(String(100), nullable=True) # External Transaction No
+    transaction_id = Column(String(100), nullable=True, index=True) # External Transaction No
     pay_time = Column(DateTime, default=datetime.now)
     
     remark = Column(Text, nullable=True)
-    creator_id = Column(Integer, default=1)
+    creator_id = Column(String(36), nullable=True) # sys_user.id, "1" on records from before it was tracked
     
     # Relationships
     order = relationship("Order", back_populates="payment_records")
+
+    __table_args__ = (
+        Index("ix_payment_type_pay_time", "type", "pay_time"), # Collections / refunds by pay time
+        Index("ix_payment_order_pay_time", "order_id", "pay_time"), # An order's payments, newest first
+    )
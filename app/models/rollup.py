@@ -0,0 +1,77 @@
+from sqlalchemy import Column, String, Integer, Date, Numeric, Index
+from app.db.base_class import Base
+
+# Per-day aggregates used by the analysis endpoints.
+# Rows are owned by app.services.rollup: every write path refreshes the days it
+# touched, and `scripts/rebuild.py rollups` rebuilds everything from scratch.
+
+class SalesDailyRollup(Base):
+    __tablename__ = "sys_rollup_sales_daily"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    day = Column(Date, nullable=False) # Order.created_at
+    order_type = Column(String(20), nullable=False)
+    status = Column(String(20), nullable=False)
+    client_type = Column(Integer, nullable=True) # 0: Individual, 1: Enterprise, NULL: client missing
+
+    order_count = Column(Integer, default=0, nullable=False)
+    amount = Column(Numeric(14, 2), default=0.00, nullable=False)
+
+    __table_args__ = (
+        Index("ix_rollup_sales_day", "day"),
+    )
+
+class PaymentDailyRollup(Base):
+    __tablename__ = "sys_rollup_payment_daily"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    day = Column(Date, nullable=False) # PaymentRecord.pay_time
+    order_type = Column(String(20), nullable=False)
+    type = Column(Integer, nullable=False) # 1: Collection, 2: Refund
+
+    record_count = Column(Integer, default=0, nullable=False)
+    amount = Column(Numeric(14, 2), default=0.00, nullable=False)
+
+    __table_args__ = (
+        Index("ix_rollup_payment_day", "day"),
+    )
+
+class CostDailyRollup(Base):
+    __tablename__ = "sys_rollup_cost_daily"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    day = Column(Date, nullable=False) # Cost.pay_time
+    category = Column(String(50), nullable=False)
+
+    record_count = Column(Integer, default=0, nullable=False)
+    amount = Column(Numeric(14, 2), default=0.00, nullable=False)
+
+    __table_args__ = (
+        Index("ix_rollup_cost_day", "day"),
+    )
+
+class ClientDailyRollup(Base):
+    __tablename__ = "sys_rollup_client_daily"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    day = Column(Date, nullable=False) # Client.created_at
+    client_type = Column(Integer, nullable=False)
+
+    new_count = Column(Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        Index("ix_rollup_client_day", "day"),
+    )
+
+class TrialDailyRollup(Base):
+    __tablename__ = "sys_rollup_trial_daily"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    day = Column(Date, nullable=False) # LicenseRecord.created_at
+    client_type = Column(Integer, nullable=True) # Matched by customer_name, NULL if no client
+
+    trial_count = Column(Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        Index("ix_rollup_trial_day", "day"),
+    )
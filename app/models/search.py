@@ -0,0 +1,19 @@
+from sqlalchemy import Column, String, Index, PrimaryKeyConstraint
+from app.db.base_class import Base
+
+# N-gram postings owned by app.services.search.
+# For every indexed field value, each position contributes its 1, 2 and 3
+# character grams (lowercased), so substring searches become equality lookups
+# on (field, gram) and work for Chinese names without a word tokenizer.
+
+class SearchGram(Base):
+    __tablename__ = "sys_search_gram"
+
+    field = Column(String(30), nullable=False) # e.g. "order.client_name", see app.services.search.FIELDS
+    gram = Column(String(3), nullable=False)
+    ref_id = Column(String(36), nullable=False) # Order.id / Client.id
+
+    __table_args__ = (
+        PrimaryKeyConstraint("field", "gram", "ref_id"),
+        Index("ix_search_gram_ref", "ref_id", "field"),
+    )
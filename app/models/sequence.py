@@ -0,0 +1,11 @@
+from sqlalchemy import Column, String, Integer, DateTime
+from app.db.base_class import Base
+from datetime import datetime
+
+class SequenceCounter(Base):
+    __tablename__ = "sys_sequence"
+
+    # One counter per sequence key, e.g. "order_no:20251224-1022" (see app.services.order_no)
+    name = Column(String(50), primary_key=True)
+    next_value = Column(Integer, nullable=False) # First value not leased yet
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
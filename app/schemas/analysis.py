@@ -89,3 +89,23 @@ class WorkbenchResponse(BaseModel):
     trend_profit: List[float]
     trend_margin: List[float]
     expense_pie: List[DistributionItem]
+
+class AnalysisDashboardResponse(BaseModel):
+    summary: AnalysisSummaryResponse
+    trend: AnalysisTrendResponse
+    comparison: AnalysisComparisonResponse
+    distribution: AnalysisDistributionResponse
+    new_customers: AnalysisNewCustomersResponse
+
+class AnalysisCacheStats(BaseModel):
+    enabled: bool
+    version: int
+    entries: int
+    bytes: int
+    max_entries: int
+    max_bytes: int
+    hits: int
+    misses: int
+    hit_rate: float # Percent
+    evictions: int
+    invalidations: int
@@ -1,6 +1,7 @@
 from typing import List, Optional, Any
 from pydantic import BaseModel
 from datetime import datetime
+from decimal import Decimal
 
 # Shared properties
 class ClientBase(BaseModel):
@@ -49,9 +50,21 @@ class ClientInDBBase(ClientBase):
     class Config:
         from_attributes = True
 
+# Precomputed figures (app.services.client_stats)
+class ClientStatsResponse(BaseModel):
+    order_count: int = 0
+    sales_amount: Decimal = Decimal("0.00")
+    collected_amount: Decimal = Decimal("0.00")
+    outstanding_amount: Decimal = Decimal("0.00")
+    license_count: int = 0
+    last_followup_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
 # Properties to return to client
 class ClientResponse(ClientInDBBase):
-    pass
+    stats: Optional[ClientStatsResponse] = None
 
 class ClientDetailResponse(ClientResponse):
     # Flattened Extra Fields
@@ -67,6 +80,10 @@ class ClientDetailResponse(ClientResponse):
     # Statistics
     license_count: int = 0
     last_active: Optional[datetime] = None
+    order_count: int = 0
+    sales_amount: Decimal = Decimal("0.00")
+    collected_amount: Decimal = Decimal("0.00")
+    outstanding_amount: Decimal = Decimal("0.00")
 
 # --- FollowUp ---
 
@@ -86,3 +103,15 @@ class FollowUpResponse(FollowUpBase):
 
     class Config:
         from_attributes = True
+
+# --- Import ---
+
+class ClientImportError(BaseModel):
+    line: int
+    message: str
+
+class ClientImportResult(BaseModel):
+    processed: int
+    created: int
+    failed: int
+    errors: List[ClientImportError]
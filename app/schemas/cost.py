@@ -33,6 +33,18 @@ class CostRead(CostBase):
     class Config:
         from_attributes = True
 
+class CostImportError(BaseModel):
+    line: int
+    message: str
+
+class CostImportResult(BaseModel):
+    processed: int
+    created: int
+    duplicates: int # Already imported, by content hash
+    ignored: int # Income, transfers and summary lines
+    failed: int
+    errors: List[CostImportError]
+
 class CategoryStat(BaseModel):
     name: str
     amount: float
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
 from decimal import Decimal
@@ -30,6 +30,21 @@ class OrderCreate(BaseModel):
     remark: Optional[str] = None
     attachments: Optional[str] = "[]"
 
+# Properties to receive on bulk creation; the client is given by id or by name
+class OrderImportItem(BaseModel):
+    client_id: Optional[str] = None
+    client_name: Optional[str] = None
+    order_type: str = "NEW"
+    product_info: str
+    amount: Decimal
+    contract_no: Optional[str] = None
+    remark: Optional[str] = None
+    attachments: Optional[str] = "[]"
+    created_at: Optional[datetime] = None # Defaults to now, set when migrating history
+
+class OrderBulkCreate(BaseModel):
+    items: List[OrderImportItem]
+
 # Properties to receive on item update
 class OrderUpdate(BaseModel):
     product_info: Optional[str] = None
@@ -66,3 +81,19 @@ class OrderStats(BaseModel):
     monthly_revenue: Decimal
     pending_amount: Decimal
     monthly_count: int
+
+class OrderImportError(BaseModel):
+    line: int # CSV line, or 1-based item position for bulk creation
+    message: str
+
+class OrderImportCreated(BaseModel):
+    line: int
+    id: str
+    order_no: str
+
+class OrderImportResult(BaseModel):
+    processed: int
+    created: int
+    failed: int
+    errors: List[OrderImportError]
+    items: Optional[List[OrderImportCreated]] = None # Bulk creation only
@@ -1,5 +1,5 @@
-from typing import Optional
-from pydantic import BaseModel
+from typing import List, Optional
+from pydantic import BaseModel, field_validator
 from datetime import datetime
 from decimal import Decimal
 
@@ -20,7 +20,13 @@ class PaymentRecordInDBBase(PaymentRecordBase):
     id: str
     order_id: str
     pay_time: datetime
-    creator_id: int
+    creator_id: Optional[str] = None
+
+    @field_validator("creator_id", mode="before")
+    @classmethod
+    def _legacy_creator_id(cls, value):
+        # Integer on records from before creators were user ids
+        return str(value) if isinstance(value, int) else value
 
     class Config:
         from_attributes = True
@@ -28,3 +34,23 @@ class PaymentRecordInDBBase(PaymentRecordBase):
 # Properties to return to client
 class PaymentRecordResponse(PaymentRecordInDBBase):
     pass
+
+# Statement import report
+class StatementLineResult(BaseModel):
+    line: int
+    status: str # matched, duplicate, unmatched, rejected, invalid
+    amount: Optional[Decimal] = None
+    type: int = 1
+    transaction_id: Optional[str] = None
+    order_no: Optional[str] = None
+    payment_id: Optional[str] = None
+    message: Optional[str] = None
+
+class StatementImportResult(BaseModel):
+    total: int
+    matched: int
+    duplicate: int
+    unmatched: int
+    rejected: int
+    invalid: int
+    lines: List[StatementLineResult]
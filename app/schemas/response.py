@@ -5,7 +5,8 @@ T = TypeVar('T')
 
 class PageData(BaseModel, Generic[T]):
     items: List[T]
-    total: int
+    total: Optional[int] = None # Only filled when requested
+    next_cursor: Optional[str] = None # None on the last page
 
 class ResponseModel(BaseModel, Generic[T]):
     code: str = "0000"
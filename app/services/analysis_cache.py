@@ -0,0 +1,175 @@
+"""
+Result cache for the analysis endpoints.
+
+Entries live in a per-worker LRU bounded by entry count and serialized size.
+Freshness comes from the `sys_data_version` counter: write endpoints call
+`bump()` inside their transaction, and every lookup reads the current version
+(one primary-key query) before trusting an entry. A write handled by any
+uvicorn worker therefore invalidates the caches of all workers.
+"""
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Callable, Dict, Optional, Union
+import json
+import threading
+
+from pydantic import BaseModel
+from sqlalchemy import select, update, insert
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+from app.models.data_version import DataVersion
+
+ANALYSIS_SCOPE = "analysis"
+
+# --- Data version counter ---
+
+def bump(conn, scope: str = ANALYSIS_SCOPE) -> int:
+    """
+    Increment the data version of `scope` and return the new version. Call
+    before committing a write so the new version becomes visible together
+    with the data. The counter row stays locked by the UPDATE until commit,
+    so the returned value belongs to this write.
+    `conn` may be a Session or a Connection (used from mapper events).
+    """
+    table = DataVersion.__table__
+    result = conn.execute(
+        update(table).where(table.c.scope == scope).values(version=table.c.version + 1)
+    )
+    if result.rowcount == 0:
+        conn.execute(insert(table).values(scope=scope, version=1))
+        return 1
+    return current_version(conn, scope)
+
+def lock(conn, scope: str = ANALYSIS_SCOPE) -> None:
+    """
+    Lock the version row of `scope` until the transaction ends. Writes that
+    re-aggregate derived tables from their sources (rollups, ledger) take it
+    before reading, so a concurrent write cannot commit between their read
+    and their rewrite. Every write locks the row in `bump()` anyway, this only
+    takes the lock earlier. No-op on SQLite, which serializes writers itself.
+    """
+    table = DataVersion.__table__
+    conn.execute(select(table.c.version).where(table.c.scope == scope).with_for_update())
+
+def current_version(conn, scope: str = ANALYSIS_SCOPE) -> int:
+    table = DataVersion.__table__
+    return conn.execute(select(table.c.version).where(table.c.scope == scope)).scalar() or 0
+
+def ensure_scope(db, scope: str = ANALYSIS_SCOPE) -> None:
+    """Create the counter row up front so concurrent first bumps do not race on insert."""
+    if db.get(DataVersion, scope) is None:
+        try:
+            db.add(DataVersion(scope=scope, version=0))
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+
+# --- LRU ---
+
+class ResultCache:
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict() # key -> (value, size)
+        self._bytes = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _sync_version(self, version: int) -> None:
+        # Every entry belongs to the last version seen; a newer one makes them all stale
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+
+    def get(self, key: str, version: int) -> Optional[Any]:
+        with self._lock:
+            self._sync_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, version: int, value: Any, size: int) -> None:
+        with self._lock:
+            # The data moved on while this value was computed
+            if self._version is not None and version < self._version:
+                return
+            self._sync_version(version)
+            if size > self.max_bytes:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": settings.ANALYSIS_CACHE_ENABLED,
+                "version": self._version or 0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups * 100, 1) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+cache = ResultCache(settings.ANALYSIS_CACHE_MAX_ENTRIES, settings.ANALYSIS_CACHE_MAX_BYTES)
+
+def make_key(endpoint: str, request: Union[BaseModel, dict, None] = None) -> str:
+    """
+    Cache key from the endpoint and the normalized request (a model or plain
+    parameters). month_range is dropped for the year dimension (it is ignored
+    there), and today's date is included because missing ranges default to
+    the current month. order_type is kept as sent: its filter is
+    case-sensitive ("NEW" is not "new" but all types).
+    """
+    params = {}
+    if isinstance(request, dict):
+        params = dict(request)
+    elif request is not None:
+        params = request.model_dump()
+        if params.get("time_dimension") == "year":
+            params.pop("month_range", None)
+    return json.dumps([endpoint, date.today().isoformat(), params], sort_keys=True, default=str)
+
+def cached(db, endpoint: str, request: Union[BaseModel, dict, None], compute: Callable[[], BaseModel]) -> BaseModel:
+    """Return the cached result for (endpoint, request) or compute and store it."""
+    if not settings.ANALYSIS_CACHE_ENABLED:
+        return compute()
+
+    version = current_version(db)
+    key = make_key(endpoint, request)
+    value = cache.get(key, version)
+    if value is not None:
+        return value
+
+    value = compute()
+    cache.put(key, version, value, len(value.model_dump_json()))
+    return value
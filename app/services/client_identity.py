@@ -0,0 +1,164 @@
+"""
+Client identity keys for duplicate detection.
+
+Each client's identifying values are stored normalized in
+`sys_client_identity`, whose primary key (kind, value) allows one client per
+key:
+
+- enterprise_name: enterprise clients' names, NFKC-folded, lowercased, with
+  spaces and punctuation removed ("阿里巴巴（中国）" == "阿里巴巴 (中国)")
+- phone: digits only, without a +86 / 0086 country prefix
+- wechat: lowercased WeChat ID
+
+Checking a new or edited client is one primary-key lookup for all its keys
+(`conflicts()`), whatever the table size. Write paths call `refresh()` with
+the client ids they inserted, edited or deleted, before committing.
+Duplicates that already existed before this table are kept: the oldest
+client owns the key and the others are left without it.
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+import re
+import unicodedata
+
+from sqlalchemy import and_, delete, insert, or_, select
+from sqlalchemy.orm import Session
+
+from app.models.client import Client, ClientIdentity
+
+logger = logging.getLogger(__name__)
+
+ENTERPRISE_NAME, PHONE, WECHAT = "enterprise_name", "phone", "wechat"
+KINDS = (ENTERPRISE_NAME, PHONE, WECHAT) # Reporting order of conflicts
+MAX_VALUE_LENGTH = 100
+REBUILD_CHUNK_SIZE = 1000
+
+CONFLICT_MESSAGES = {
+    ENTERPRISE_NAME: "Enterprise name already exists",
+    PHONE: "Phone number already exists",
+    WECHAT: "Wechat ID already exists",
+}
+
+def _fold(value) -> str:
+    return unicodedata.normalize("NFKC", str(value)).strip().lower()
+
+def normalize_phone(value) -> Optional[str]:
+    digits = re.sub(r"\D", "", _fold(value)) if value else ""
+    if len(digits) == 15 and digits.startswith("0086"):
+        digits = digits[4:]
+    elif len(digits) == 13 and digits.startswith("86"):
+        digits = digits[2:]
+    return digits or None
+
+def normalize_wechat(value) -> Optional[str]:
+    return _fold(value) or None if value else None
+
+def normalize_enterprise_name(value) -> Optional[str]:
+    return re.sub(r"[\W_]+", "", _fold(value)) or None if value else None
+
+def identity_keys(client_type, name, phone, wechat) -> List[Tuple[str, str]]:
+    """(kind, value) keys of one client's values."""
+    keys = []
+    for kind, value in (
+        (ENTERPRISE_NAME, normalize_enterprise_name(name) if client_type == 1 else None),
+        (PHONE, normalize_phone(phone)),
+        (WECHAT, normalize_wechat(wechat)),
+    ):
+        if value:
+            keys.append((kind, value[:MAX_VALUE_LENGTH]))
+    return keys
+
+def owners(conn, keys: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], str]:
+    """{(kind, value): client_id} of the keys already taken, in one query."""
+    values_by_kind = defaultdict(set)
+    for kind, value in keys:
+        values_by_kind[kind].add(value)
+    if not values_by_kind:
+        return {}
+    table = ClientIdentity.__table__
+    rows = conn.execute(select(table.c.kind, table.c.value, table.c.client_id).where(
+        or_(*[and_(table.c.kind == kind, table.c.value.in_(values)) for kind, values in values_by_kind.items()])
+    ))
+    return {(kind, value): client_id for kind, value, client_id in rows}
+
+def conflicts(conn, keys: Iterable[Tuple[str, str]], client_id: Optional[str] = None) -> List[str]:
+    """Kinds among `keys` owned by another client than `client_id`, in KINDS order."""
+    taken = {kind for (kind, _), owner in owners(conn, keys).items() if owner != client_id}
+    return [kind for kind in KINDS if kind in taken]
+
+def _keys_of_rows(rows) -> List[dict]:
+    return [
+        {"kind": kind, "value": value, "client_id": row.id}
+        for row in rows
+        for kind, value in identity_keys(row.type, row.name, row.phone, row.wechat)
+    ]
+
+def _insert_free(conn, entries: List[dict]) -> int:
+    """Insert the entries whose key is not taken yet (first entry wins). Returns the inserted count."""
+    taken = owners(conn, [(e["kind"], e["value"]) for e in entries])
+    rows = []
+    for entry in entries:
+        key = (entry["kind"], entry["value"])
+        if key not in taken:
+            taken[key] = entry["client_id"]
+            rows.append(entry)
+    if rows:
+        conn.execute(insert(ClientIdentity.__table__), rows)
+    return len(rows)
+
+def add(conn, client_id: str, keys: Iterable[Tuple[str, str]]) -> None:
+    """Insert a new client's keys. Raises IntegrityError when one was taken meanwhile."""
+    rows = [{"kind": kind, "value": value, "client_id": client_id} for kind, value in keys]
+    if rows:
+        conn.execute(insert(ClientIdentity.__table__), rows)
+
+def _select_rows():
+    return select(Client.id, Client.type, Client.name, Client.phone, Client.wechat)
+
+def refresh(conn, client_ids: Iterable[str]) -> None:
+    """
+    Re-derive the keys of the given client ids from their current rows (ids
+    that no longer exist are dropped). `conn` may be a Session or a Connection.
+    """
+    ids = [i for i in set(client_ids) if i]
+    if not ids:
+        return
+    table = ClientIdentity.__table__
+    conn.execute(delete(table).where(table.c.client_id.in_(ids)))
+    rows = conn.execute(_select_rows().where(Client.id.in_(ids)).order_by(Client.created_at)).all()
+    _insert_free(conn, _keys_of_rows(rows))
+
+def rebuild(db: Session) -> Tuple[int, int]:
+    """Re-derive every client's keys, oldest clients first, and commit. Returns (keys, duplicates skipped)."""
+    db.execute(delete(ClientIdentity.__table__))
+    total = skipped = 0
+    last = None
+    while True:
+        stmt = _select_rows().add_columns(Client.created_at).order_by(Client.created_at, Client.id).limit(REBUILD_CHUNK_SIZE)
+        if last is not None:
+            stmt = stmt.where(or_(
+                Client.created_at > last[0],
+                and_(Client.created_at == last[0], Client.id > last[1])
+            ))
+        rows = db.execute(stmt).all()
+        if not rows:
+            break
+        entries = _keys_of_rows(rows)
+        inserted = _insert_free(db, entries)
+        total += inserted
+        skipped += len(entries) - inserted
+        last = (rows[-1].created_at, rows[-1].id)
+    db.commit()
+    if skipped:
+        logger.warning(f"Client identity keys: {skipped} keys shared by several clients, kept by the oldest")
+    logger.info(f"Client identity keys rebuilt: {total} keys")
+    return total, skipped
+
+def ensure_built(db: Session) -> None:
+    """Build the keys on the first start after upgrading an existing database."""
+    if db.query(ClientIdentity.client_id).first() is not None:
+        return
+    if db.query(Client.id).first() is not None:
+        logger.info("Building client identity keys")
+        rebuild(db)
@@ -0,0 +1,170 @@
+"""
+Bulk client import from a spreadsheet.
+
+Rows are validated as they stream in and written in chunks of CHUNK_SIZE,
+one transaction per chunk. Duplicates are detected with the normalized
+identity keys (app.services.client_identity): one lookup per chunk for all
+its keys against existing clients, plus the keys seen earlier in the same
+file. Duplicate and invalid rows are skipped and reported with their line
+number.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import logging
+import uuid
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.models.client import Client, ClientIdentity
+from app.services import analysis_cache, client_identity, client_stats, columnar, rollup, search
+from app.services.csv_import import data_rows
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+
+# Spreadsheet column -> accepted header names (compared lowercased, spaces removed)
+COLUMN_ALIASES = {
+    "name": ("name", "客户名称", "客户名", "名称", "公司名称", "姓名"),
+    "type": ("type", "客户类型", "类型"),
+    "status": ("status", "客户状态", "状态"),
+    "source": ("source", "来源", "客户来源"),
+    "level": ("level", "等级", "客户等级"),
+    "contact_person": ("contact_person", "联系人"),
+    "position": ("position", "职位"),
+    "phone": ("phone", "手机", "手机号", "电话", "联系电话"),
+    "wechat": ("wechat", "微信", "微信号"),
+    "email": ("email", "邮箱"),
+    "remark": ("remark", "备注"),
+}
+REQUIRED_COLUMNS = ("name",)
+
+TYPES = {"个人": 0, "individual": 0, "0": 0, "企业": 1, "公司": 1, "enterprise": 1, "1": 1}
+STATUSES = {"线索": 0, "试用": 1, "成交": 2, "流失": 3, "拉黑": 9}
+TEXT_COLUMNS = ("source", "contact_person", "position", "phone", "wechat", "email", "remark")
+
+def _text(value) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+def validate(row: dict) -> dict:
+    """Client column values for one input row. Raises ValueError with a readable message."""
+    name = _text(row.get("name"))
+    if not name:
+        raise ValueError("缺少客户名称")
+
+    client_type = (_text(row.get("type")) or "0").lower()
+    if client_type not in TYPES:
+        raise ValueError(f"未知的客户类型: {client_type}")
+
+    status = _text(row.get("status")) or "0"
+    if status in STATUSES:
+        status = STATUSES[status]
+    elif status.isdigit() and int(status) in STATUSES.values():
+        status = int(status)
+    else:
+        raise ValueError(f"未知的客户状态: {status}")
+
+    level = _text(row.get("level")) or "1"
+    if not level.isdigit() or not 1 <= int(level) <= 5:
+        raise ValueError(f"客户等级应为 1-5: {level}")
+
+    return {
+        "name": name,
+        "type": TYPES[client_type],
+        "status": status,
+        "level": int(level),
+        **{column: _text(row.get(column)) for column in TEXT_COLUMNS},
+    }
+
+def _write_chunk(db: Session, chunk: List[Tuple[int, dict, list]], creator_id: Optional[str]) -> List[str]:
+    """Insert one chunk of (line, values, identity keys) in its own transaction. Returns the new ids."""
+    now = datetime.now()
+    rows, keys = [], []
+    for _, values, row_keys in chunk:
+        client_id = str(uuid.uuid4())
+        rows.append({
+            **values,
+            "id": client_id,
+            "extra_info": {},
+            "creator_id": creator_id,
+            "created_at": now,
+            "updated_at": now,
+        })
+        keys.extend({"kind": kind, "value": value, "client_id": client_id} for kind, value in row_keys)
+    ids = [row["id"] for row in rows]
+
+    db.execute(insert(Client.__table__), rows)
+    if keys:
+        db.execute(insert(ClientIdentity.__table__), keys)
+    search.refresh(db, clients=ids)
+    client_stats.refresh(db, ids)
+    rollup.refresh(db, clients=[now], trials=rollup.client_trial_days(db, [row["name"] for row in rows]))
+    version = analysis_cache.bump(db)
+    db.commit()
+    columnar.apply_changes(db, version, clients=ids)
+    return ids
+
+def import_clients(db: Session, rows: Iterable[Tuple[int, dict]], creator_id: Optional[str] = None) -> dict:
+    """
+    Import (line, row) pairs and return the result. Raises ValueError for
+    unreadable input (chunks already written stay committed).
+    """
+    result = {"processed": 0, "created": 0, "failed": 0, "errors": []}
+    seen: Dict[Tuple[str, str], int] = {} # identity key -> line that took it in this file
+
+    def fail(line: int, message: str) -> None:
+        result["failed"] += 1
+        if len(result["errors"]) < MAX_REPORTED_ERRORS:
+            result["errors"].append({"line": line, "message": message})
+
+    def write(pending: List[Tuple[int, dict, list]]) -> None:
+        taken = client_identity.owners(db, [key for _, _, row_keys in pending for key in row_keys])
+        chunk = []
+        for line, values, row_keys in pending:
+            duplicate = next((kind for kind, value in row_keys if (kind, value) in taken), None)
+            if duplicate:
+                fail(line, client_identity.CONFLICT_MESSAGES[duplicate])
+            else:
+                chunk.append((line, values, row_keys))
+        if not chunk:
+            return
+        try:
+            result["created"] += len(_write_chunk(db, chunk, creator_id))
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.error(f"Client import chunk failed: {e}")
+            message = "客户已存在 (并发导入)" if isinstance(e, IntegrityError) else f"写入失败: {e.__class__.__name__}"
+            for line, _, _ in chunk:
+                fail(line, message)
+
+    pending: List[Tuple[int, dict, list]] = []
+    for line, row in rows:
+        result["processed"] += 1
+        try:
+            values = validate(row)
+        except ValueError as e:
+            fail(line, str(e))
+            continue
+        row_keys = client_identity.identity_keys(values["type"], values["name"], values["phone"], values["wechat"])
+        repeated = next((key for key in row_keys if key in seen), None)
+        if repeated:
+            fail(line, f"与第 {seen[repeated]} 行重复: {client_identity.CONFLICT_MESSAGES[repeated[0]]}")
+            continue
+        seen.update((key, line) for key in row_keys)
+        pending.append((line, values, row_keys))
+        if len(pending) >= CHUNK_SIZE:
+            write(pending)
+            pending = []
+    if pending:
+        write(pending)
+    return result
+
+def csv_client_rows(rows: Iterable[List[str]]) -> Iterator[Tuple[int, dict]]:
+    """(line, row) pairs of a client spreadsheet exported as CSV."""
+    return data_rows(rows, COLUMN_ALIASES, REQUIRED_COLUMNS)
@@ -0,0 +1,169 @@
+"""
+Precomputed per-client figures for the client list and detail page.
+
+`sys_client_stats` holds, per client: order count, lifetime sales, net
+collected, outstanding balance, license count and the last follow-up time.
+Write paths call `refresh()` with the clients whose orders, payments,
+follow-ups or name changed, before committing; the refresh re-aggregates
+only those clients, each through its indexed rows. Licenses are written by
+the commercial plugin and refreshed from mapper events, matched to clients
+by name as before.
+
+Reading the figures is then one primary-key join instead of aggregate
+queries per request. `rebuild()` recomputes everything and is exposed
+through `scripts/rebuild.py client-stats`.
+"""
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from typing import Iterable, List, Optional
+import logging
+
+from sqlalchemy import case, delete, event, func, insert, select
+from sqlalchemy.orm import Session
+
+from app.models.client import Client, ClientStats, FollowUp
+from app.models.order import Order
+from app.services import analysis_cache
+from app.services.ledger import CLOSED_STATUSES
+
+try:
+    from app.modules.plugins.commercial_kit.models import LicenseRecord
+except ImportError:
+    LicenseRecord = None
+
+logger = logging.getLogger(__name__)
+
+EXCLUDED_STATUSES = ("VOID", "CANCELLED") # Not counted as sales
+CHUNK_SIZE = 500
+ZERO = Decimal("0.00")
+
+def _decimal(value) -> Decimal:
+    return Decimal(str(value)) if value is not None else ZERO
+
+def _compute(conn, client_ids: List[str]) -> List[dict]:
+    """Stats rows of the given existing clients."""
+    clients = conn.execute(select(Client.id, Client.name).where(Client.id.in_(client_ids))).all()
+    stats = {
+        client_id: {
+            "client_id": client_id, "order_count": 0, "sales_amount": ZERO, "collected_amount": ZERO,
+            "outstanding_amount": ZERO, "license_count": 0, "last_followup_at": None, "updated_at": datetime.now(),
+        }
+        for client_id, _ in clients
+    }
+    if not stats:
+        return []
+    ids = list(stats)
+
+    is_sale = Order.status.notin_(EXCLUDED_STATUSES)
+    paid = func.coalesce(Order.total_paid, 0)
+    order_rows = conn.execute(select(
+        Order.client_id,
+        func.sum(case((is_sale, 1), else_=0)),
+        func.sum(case((is_sale, Order.amount), else_=0)),
+        func.sum(paid),
+        func.sum(case((Order.status.notin_(CLOSED_STATUSES), Order.amount - paid), else_=0))
+    ).where(Order.client_id.in_(ids)).group_by(Order.client_id))
+    for client_id, count, sales, collected, outstanding in order_rows:
+        stats[client_id].update(
+            order_count=int(count or 0),
+            sales_amount=_decimal(sales),
+            collected_amount=_decimal(collected),
+            outstanding_amount=_decimal(outstanding)
+        )
+
+    followups = conn.execute(
+        select(FollowUp.client_id, func.max(FollowUp.created_at)).where(FollowUp.client_id.in_(ids)).group_by(FollowUp.client_id)
+    )
+    for client_id, last in followups:
+        stats[client_id]["last_followup_at"] = last
+
+    if LicenseRecord is not None:
+        ids_by_name = defaultdict(list)
+        for client_id, name in clients:
+            ids_by_name[name].append(client_id)
+        licenses = conn.execute(
+            select(LicenseRecord.customer_name, func.count(LicenseRecord.id))
+            .where(LicenseRecord.customer_name.in_(list(ids_by_name))).group_by(LicenseRecord.customer_name)
+        )
+        for name, count in licenses:
+            for client_id in ids_by_name[name]:
+                stats[client_id]["license_count"] = int(count or 0)
+    return list(stats.values())
+
+def as_dict(stats: Optional[ClientStats]) -> dict:
+    """Figures of a stats row, zero when the client has none yet."""
+    return {
+        "order_count": stats.order_count if stats else 0,
+        "sales_amount": _decimal(stats.sales_amount if stats else None),
+        "collected_amount": _decimal(stats.collected_amount if stats else None),
+        "outstanding_amount": _decimal(stats.outstanding_amount if stats else None),
+        "license_count": stats.license_count if stats else 0,
+        "last_followup_at": stats.last_followup_at if stats else None,
+    }
+
+def refresh(conn, client_ids: Iterable[str] = (), names: Iterable[str] = ()) -> None:
+    """
+    Recompute the stats of the given client ids and of the clients with the
+    given names (ids that no longer exist are dropped). `conn` may be a
+    Session or a Connection.
+    """
+    ids = {i for i in client_ids if i}
+    names = [n for n in set(names) if n]
+    if names:
+        ids.update(conn.execute(select(Client.id).where(Client.name.in_(names))).scalars())
+    ids = sorted(ids)
+    table = ClientStats.__table__
+    for i in range(0, len(ids), CHUNK_SIZE):
+        chunk = ids[i:i + CHUNK_SIZE]
+        conn.execute(delete(table).where(table.c.client_id.in_(chunk)))
+        rows = _compute(conn, chunk)
+        if rows:
+            conn.execute(insert(table), rows)
+
+def order_clients(conn, order_ids: Iterable[str]) -> List[str]:
+    """Client ids of the given orders."""
+    order_ids = [i for i in set(order_ids) if i]
+    if not order_ids:
+        return []
+    return list(conn.execute(select(Order.client_id).where(Order.id.in_(order_ids)).distinct()).scalars())
+
+def rebuild(db: Session) -> int:
+    """Recompute the stats of every client and commit. Returns the row count."""
+    table = ClientStats.__table__
+    db.execute(delete(table))
+    total = 0
+    last_id = None
+    while True:
+        stmt = select(Client.id).order_by(Client.id).limit(CHUNK_SIZE)
+        if last_id is not None:
+            stmt = stmt.where(Client.id > last_id)
+        ids = list(db.execute(stmt).scalars())
+        if not ids:
+            break
+        rows = _compute(db, ids)
+        db.execute(insert(table), rows)
+        total += len(rows)
+        last_id = ids[-1]
+    # Running workers drop cached results and the columnar snapshot built before the rebuild
+    analysis_cache.bump(db)
+    db.commit()
+    logger.info(f"Client stats rebuilt: {total} clients")
+    return total
+
+def ensure_built(db: Session) -> None:
+    """Build the stats on the first start after upgrading an existing database."""
+    if db.query(ClientStats.client_id).first() is not None:
+        return
+    if db.query(Client.id).first() is not None:
+        logger.info("Building client stats")
+        rebuild(db)
+
+# --- Plugin write paths ---
+# Licenses are written by the commercial plugin, keep the license counts current from mapper events.
+
+if LicenseRecord is not None:
+    @event.listens_for(LicenseRecord, "after_insert")
+    @event.listens_for(LicenseRecord, "after_delete")
+    def _license_changed(mapper, connection, target):
+        refresh(connection, names=[target.customer_name])
@@ -0,0 +1,445 @@
+"""
+Optional in-memory columnar analytics engine (requires NumPy).
+
+Enabled with ANALYTICS_ENGINE=numpy. Order, payment, cost, client and trial
+facts are held as compact NumPy columns (epoch days, integer cents, small
+integer codes) and the analysis panels are answered with vectorized masks,
+`searchsorted` bucketing and `bincount`, without querying the fact tables.
+
+Consistency follows the analysis data version (see analysis_cache):
+- write endpoints pass the version returned by `analysis_cache.bump()` to
+  `apply_changes()` after committing; the touched rows are re-read by primary
+  key and patched in place when the engine was current just before that write;
+- otherwise (another worker wrote, a plugin write, a failed delta) the engine
+  is marked stale and reloads on the next `get_engine()`.
+"""
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Sequence
+import logging
+import threading
+
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.models.order import Order
+from app.models.payment import PaymentRecord
+from app.models.cost import Cost
+from app.models.client import Client
+from app.services import analysis_cache
+# Try import Plugin Model
+try:
+    from app.modules.plugins.commercial_kit.models import LicenseRecord
+except ImportError:
+    LicenseRecord = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+EPOCH = date(1970, 1, 1)
+NO_DAY = -1
+LOAD_CHUNK_SIZE = 10000
+
+def to_day(value) -> int:
+    """Epoch day of a date/datetime, NO_DAY for None."""
+    if value is None:
+        return NO_DAY
+    if isinstance(value, datetime):
+        value = value.date()
+    return (value - EPOCH).days
+
+def to_cents(value) -> int:
+    return int(round(float(value or 0) * 100))
+
+class Codes:
+    """Dictionary encoding for short strings (order types, statuses, categories)."""
+
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def encode(self, value: Optional[str]) -> int:
+        value = value or ""
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    def lookup(self, values: Iterable[str]) -> List[int]:
+        """Codes of known values (unknown values cannot match any row)."""
+        return [self.codes[v] for v in values if v in self.codes]
+
+class ColumnTable:
+    """Growable set of equally sized NumPy columns with an id -> row index."""
+
+    def __init__(self, dtypes: Dict[str, str]):
+        self.dtypes = dtypes
+        self.size = 0
+        self.index: Dict[str, int] = {}
+        self._alloc(16)
+
+    def _alloc(self, capacity: int) -> None:
+        self.columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in self.dtypes.items()}
+        self.valid = np.zeros(capacity, dtype=bool)
+
+    def _grow(self, needed: int) -> None:
+        capacity = len(self.valid)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name, column in self.columns.items():
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            self.columns[name] = grown
+        valid = np.zeros(capacity, dtype=bool)
+        valid[:self.size] = self.valid[:self.size]
+        self.valid = valid
+
+    def load(self, ids: List[str], values: Dict[str, list]) -> None:
+        count = len(ids)
+        self.size = 0
+        self.index = {}
+        self._alloc(max(16, count))
+        for name, dtype in self.dtypes.items():
+            self.columns[name][:count] = np.asarray(values[name], dtype=dtype)
+        self.valid[:count] = True
+        self.index = {row_id: i for i, row_id in enumerate(ids)}
+        self.size = count
+
+    def upsert(self, row_id: str, values: Dict[str, int]) -> int:
+        row = self.reserve(row_id)
+        for name, value in values.items():
+            self.columns[name][row] = value
+        self.valid[row] = True
+        return row
+
+    def reserve(self, row_id: str) -> int:
+        """Row of `row_id`, adding an invalid placeholder row when unknown."""
+        row = self.index.get(row_id)
+        if row is None:
+            self._grow(self.size + 1)
+            row = self.size
+            self.size += 1
+            self.index[row_id] = row
+        return row
+
+    def delete(self, row_id: str) -> None:
+        row = self.index.get(row_id)
+        if row is not None:
+            self.valid[row] = False
+
+    def col(self, name: str):
+        return self.columns[name][:self.size]
+
+    def mask(self):
+        return self.valid[:self.size].copy()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(c.nbytes for c in self.columns.values()) + self.valid.nbytes
+
+class AnalyticsEngine:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.version: Optional[int] = None # None: not loaded or stale
+        self.order_types = Codes()
+        self.statuses = Codes()
+        self.categories = Codes()
+        self.orders = ColumnTable({
+            "day": "int32", "cents": "int64", "type": "int16", "status": "int16",
+            "client": "int32", "pay_day": "int32"
+        })
+        self.payments = ColumnTable({"day": "int32", "cents": "int64", "type": "int8", "order": "int32"})
+        self.costs = ColumnTable({"day": "int32", "cents": "int64", "category": "int16"})
+        self.clients = ColumnTable({"day": "int32", "type": "int8"})
+        self.trials = ColumnTable({"day": "int32", "client_type": "int8"})
+
+    # --- Loading ---
+
+    def _order_values(self, row) -> Dict[str, int]:
+        return {
+            "day": to_day(row.created_at),
+            "cents": to_cents(row.amount),
+            "type": self.order_types.encode(row.order_type),
+            "status": self.statuses.encode(row.status),
+            # Deleted clients keep a placeholder row so distinct client counts match SQL
+            "client": self.clients.reserve(row.client_id) if row.client_id else -1,
+            "pay_day": to_day(row.pay_time),
+        }
+
+    def _payment_values(self, row) -> Dict[str, int]:
+        return {
+            "day": to_day(row.pay_time),
+            "cents": to_cents(row.amount),
+            "type": row.type,
+            "order": self.orders.reserve(row.order_id) if row.order_id else -1,
+        }
+
+    def _cost_values(self, row) -> Dict[str, int]:
+        return {
+            "day": to_day(row.pay_time),
+            "cents": to_cents(row.amount),
+            "category": self.categories.encode(row.category),
+        }
+
+    def _client_values(self, row) -> Dict[str, int]:
+        return {"day": to_day(row.created_at), "type": row.type if row.type is not None else -1}
+
+    def _trial_values(self, row) -> Dict[str, int]:
+        return {"day": to_day(row.created_at), "client_type": row.client_type if row.client_type is not None else -1}
+
+    def _load_table(self, db, table: ColumnTable, stmt, to_values) -> None:
+        ids = []
+        values = {name: [] for name in table.dtypes}
+        result = db.execute(stmt.execution_options(yield_per=LOAD_CHUNK_SIZE))
+        for row in result:
+            ids.append(row.id)
+            for name, value in to_values(row).items():
+                values[name].append(value)
+        table.load(ids, values)
+
+    def load(self, db) -> None:
+        with self.lock:
+            version = analysis_cache.current_version(db)
+            # Clients first: orders reference client rows, payments reference order rows
+            self._load_table(db, self.clients, _client_select(), self._client_values)
+            self._load_table(db, self.orders, _order_select(), self._order_values)
+            self._load_table(db, self.payments, _payment_select(), self._payment_values)
+            self._load_table(db, self.costs, _cost_select(), self._cost_values)
+            if LicenseRecord is not None:
+                self._load_table(db, self.trials, _trial_select(), self._trial_values)
+            self.version = version
+            logger.info(
+                f"Analytics engine loaded at version {version}: "
+                f"{self.orders.size} orders, {self.payments.size} payments, "
+                f"{self.costs.size} costs, {self.clients.size} clients, {self.nbytes} bytes"
+            )
+
+    @property
+    def nbytes(self) -> int:
+        return sum(t.nbytes for t in (self.orders, self.payments, self.costs, self.clients, self.trials))
+
+    # --- Deltas ---
+
+    def _sync(self, db, table: ColumnTable, stmt_factory, to_values, ids: Sequence[str]) -> None:
+        if not ids:
+            return
+        found = set()
+        for row in db.execute(stmt_factory().where(stmt_factory.id_column.in_(ids))):
+            table.upsert(row.id, to_values(row))
+            found.add(row.id)
+        for row_id in ids:
+            if row_id not in found:
+                table.delete(row_id)
+
+    def apply(self, db, orders=(), payments=(), costs=(), clients=()) -> None:
+        self._sync(db, self.clients, _client_select, self._client_values, list(clients))
+        if clients and LicenseRecord is not None:
+            # Trials carry the client type matched by name, re-resolve them (small table)
+            self._load_table(db, self.trials, _trial_select(), self._trial_values)
+        self._sync(db, self.orders, _order_select, self._order_values, list(orders))
+        self._sync(db, self.payments, _payment_select, self._payment_values, list(payments))
+        self._sync(db, self.costs, _cost_select, self._cost_values, list(costs))
+
+    # --- Vectorized primitives ---
+
+    def _range_mask(self, table: ColumnTable, start: date, end: date, column: str = "day"):
+        days = table.col(column)
+        return table.mask() & (days >= to_day(start)) & (days <= to_day(end))
+
+    def _bucket_sums(self, days, weights, mask, edges: Sequence[date]):
+        """Sum weights per bucket; edges are the bucket start dates in ascending order."""
+        edge_days = np.asarray([to_day(e) for e in edges], dtype="int32")
+        idx = np.searchsorted(edge_days, days[mask], side="right") - 1
+        selected = weights[mask] if weights is not None else None
+        return np.bincount(idx, weights=selected, minlength=len(edges))[:len(edges)]
+
+    def _order_client_types(self):
+        """Client type per order row, -1 when the client is missing or deleted."""
+        client = self.orders.col("client")
+        types = np.full(self.orders.size, -1, dtype="int8")
+        linked = client >= 0
+        linked_rows = client[linked]
+        types[linked] = np.where(
+            self.clients.valid[linked_rows], self.clients.col("type")[linked_rows], -1
+        )
+        return types
+
+    def _order_type_mask(self, type_codes, order_types: Optional[List[str]]):
+        if order_types is None:
+            return np.ones(len(type_codes), dtype=bool)
+        return np.isin(type_codes, self.order_types.lookup(order_types))
+
+    def _sales_mask(self, start, end, order_types, exclude_statuses):
+        mask = self._range_mask(self.orders, start, end)
+        mask &= self._order_type_mask(self.orders.col("type"), order_types)
+        if exclude_statuses:
+            mask &= ~np.isin(self.orders.col("status"), self.statuses.lookup(exclude_statuses))
+        return mask
+
+    # --- Panel queries (amounts in yuan) ---
+
+    def sales_by_bucket(self, start, end, edges, order_types=None, exclude_statuses=(), split_client_type=False):
+        """Order amount per bucket; with split_client_type returns (enterprise, personal)."""
+        with self.lock:
+            mask = self._sales_mask(start, end, order_types, exclude_statuses)
+            days, cents = self.orders.col("day"), self.orders.col("cents")
+            if not split_client_type:
+                return self._bucket_sums(days, cents, mask, edges) / 100
+            client_types = self._order_client_types()
+            enterprise = self._bucket_sums(days, cents, mask & (client_types == 1), edges) / 100
+            personal = self._bucket_sums(days, cents, mask & (client_types >= 0) & (client_types != 1), edges) / 100
+            return enterprise, personal
+
+    def sales_by_type(self, start, end, order_types=None, exclude_statuses=()) -> Dict[str, float]:
+        with self.lock:
+            mask = self._sales_mask(start, end, order_types, exclude_statuses)
+            sums = np.bincount(
+                self.orders.col("type")[mask], weights=self.orders.col("cents")[mask],
+                minlength=len(self.order_types.values)
+            )
+            counts = np.bincount(self.orders.col("type")[mask], minlength=len(self.order_types.values))
+            return _by_key(self.order_types, sums / 100, counts)
+
+    def orders_by_status(self, start, end, order_types=None) -> Dict[str, int]:
+        with self.lock:
+            mask = self._sales_mask(start, end, order_types, ())
+            counts = np.bincount(self.orders.col("status")[mask], minlength=len(self.statuses.values))
+            return _by_key(self.statuses, counts.astype("int64"), counts)
+
+    def payments_by_bucket(self, start, end, edges, pay_type: int, order_types=None):
+        with self.lock:
+            mask = self._range_mask(self.payments, start, end) & (self.payments.col("type") == pay_type)
+            # Payments count through their order (for its type), orphans are skipped
+            order_rows = self.payments.col("order")
+            linked = order_rows >= 0
+            linked[linked] = self.orders.valid[order_rows[linked]]
+            mask &= linked
+            if order_types is not None:
+                type_codes = np.full(self.payments.size, -1, dtype="int16")
+                type_codes[linked] = self.orders.col("type")[order_rows[linked]]
+                mask &= self._order_type_mask(type_codes, order_types)
+            return self._bucket_sums(self.payments.col("day"), self.payments.col("cents"), mask, edges) / 100
+
+    def costs_by_bucket(self, start, end, edges):
+        with self.lock:
+            mask = self._range_mask(self.costs, start, end)
+            return self._bucket_sums(self.costs.col("day"), self.costs.col("cents"), mask, edges) / 100
+
+    def costs_by_category(self, start, end) -> Dict[str, float]:
+        with self.lock:
+            mask = self._range_mask(self.costs, start, end)
+            categories = self.costs.col("category")[mask]
+            sums = np.bincount(categories, weights=self.costs.col("cents")[mask], minlength=len(self.categories.values))
+            counts = np.bincount(categories, minlength=len(self.categories.values))
+            return _by_key(self.categories, sums / 100, counts)
+
+    def new_clients(self, start, end) -> int:
+        with self.lock:
+            return int(self._range_mask(self.clients, start, end).sum())
+
+    def deal_clients(self, start, end) -> int:
+        """Distinct clients with PAID orders paid within the range."""
+        with self.lock:
+            mask = self._range_mask(self.orders, start, end, column="pay_day")
+            mask &= np.isin(self.orders.col("status"), self.statuses.lookup(["PAID"]))
+            clients = self.orders.col("client")[mask]
+            return int(np.unique(clients[clients >= 0]).size)
+
+    def trials_by_bucket(self, start, end, edges, split_client_type=False):
+        with self.lock:
+            mask = self._range_mask(self.trials, start, end)
+            days = self.trials.col("day")
+            if not split_client_type:
+                return self._bucket_sums(days, None, mask, edges)
+            client_types = self.trials.col("client_type")
+            enterprise = self._bucket_sums(days, None, mask & (client_types == 1), edges)
+            personal = self._bucket_sums(days, None, mask & (client_types >= 0) & (client_types != 1), edges)
+            return enterprise, personal
+
+def _by_key(codes: Codes, values, counts) -> Dict[str, float]:
+    """{value: total} for codes present in the selection, ordered by value like GROUP BY."""
+    present = sorted((codes.values[i], values[i].item()) for i in np.nonzero(counts)[0])
+    return dict(present)
+
+# --- Source selects (Core, no ORM identity map) ---
+
+def _order_select():
+    return select(
+        Order.id, Order.created_at, Order.amount, Order.order_type, Order.status,
+        Order.client_id, Order.pay_time
+    )
+_order_select.id_column = Order.id
+
+def _payment_select():
+    return select(PaymentRecord.id, PaymentRecord.pay_time, PaymentRecord.amount, PaymentRecord.type, PaymentRecord.order_id)
+_payment_select.id_column = PaymentRecord.id
+
+def _cost_select():
+    return select(Cost.id, Cost.pay_time, Cost.amount, Cost.category)
+_cost_select.id_column = Cost.id
+
+def _client_select():
+    return select(Client.id, Client.created_at, Client.type)
+_client_select.id_column = Client.id
+
+def _trial_select():
+    client_type = select(Client.type).where(
+        Client.name == LicenseRecord.customer_name
+    ).limit(1).scalar_subquery()
+    return select(LicenseRecord.id, LicenseRecord.created_at, client_type.label("client_type"))
+
+# --- Module level engine ---
+
+_engine: Optional[AnalyticsEngine] = None
+_engine_lock = threading.Lock()
+
+def is_enabled() -> bool:
+    return settings.ANALYTICS_ENGINE == "numpy" and np is not None
+
+def get_engine(db) -> Optional[AnalyticsEngine]:
+    """The engine when enabled, reloaded first if the data version moved on."""
+    global _engine
+    if not is_enabled():
+        return None
+    with _engine_lock:
+        if _engine is None:
+            _engine = AnalyticsEngine()
+        engine = _engine
+    with engine.lock:
+        if engine.version is None or engine.version != analysis_cache.current_version(db):
+            engine.load(db)
+        return engine
+
+def init_engine(db) -> None:
+    """Load the engine at startup so the first dashboard request is fast."""
+    if settings.ANALYTICS_ENGINE == "numpy" and np is None:
+        logger.warning("ANALYTICS_ENGINE=numpy but NumPy is not installed, falling back to SQL")
+        return
+    get_engine(db)
+
+def apply_changes(db, version: int, orders=(), payments=(), costs=(), clients=()) -> None:
+    """
+    Patch the engine after a committed write. `version` is the data version
+    produced by that write's `analysis_cache.bump()`.
+    """
+    engine = _engine
+    if engine is None or not is_enabled():
+        return
+    with engine.lock:
+        if engine.version is None or engine.version != version - 1:
+            # Missed another write in between, reload lazily
+            engine.version = None
+            return
+        try:
+            engine.apply(db, orders=orders, payments=payments, costs=costs, clients=clients)
+            engine.version = version
+        except Exception as e:
+            logger.error(f"Failed to apply analytics delta, engine will reload: {e}")
+            engine.version = None
@@ -0,0 +1,302 @@
+"""
+Cost import from Alipay / WeChat bills and cloud or AI API vendor exports.
+
+The CSV is read as a stream and written in chunks of CHUNK_SIZE, one
+transaction per chunk, so memory stays bounded by the chunk whatever the
+file size:
+
+1. lines are parsed with the shared header detection (export preambles are
+   skipped); income, transfers, closed trades, zero and credit lines and
+   summary rows are ignored
+2. each expense line gets a category from the rules: configured rules
+   (sys_config `cost_import_rules`) first, then the built-in vendor
+   keywords, else the default category
+3. each line gets a content hash (its transaction id when the export has
+   one, else its date, amount and texts, numbered when the same content
+   repeats in the file), stored in Cost.import_hash; lines whose hash is
+   already stored are reported as duplicates, so re-importing a bill or an
+   overlapping export only adds the new lines
+4. costs are inserted with one executemany, rollups and analysis caches are
+   refreshed once per chunk
+
+A statement already uploaded as a cost attachment can be imported from its
+`invoice_url`; the imported costs then link to it.
+"""
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import hashlib
+import json
+import logging
+import uuid
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.models.cost import Cost
+from app.models.sys_config import SysConfig
+from app.services import analysis_cache, columnar, rollup
+from app.services.csv_import import data_rows, parse_amount, parse_time
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+CATEGORIES = ("CLOUD", "AI_API", "LABOR", "SAAS", "MARKETING", "OTHER")
+RULES_CONFIG_KEY = "cost_import_rules"
+TITLE_MAX_LENGTH = 255
+
+# Bill column -> accepted header names (compared lowercased, spaces removed)
+COLUMN_ALIASES = {
+    "amount": (
+        "amount", "金额", "金额(元)", "金额（元）", "交易金额", "支出金额", "应付金额", "实付金额", "消费金额",
+        "cost", "lineitem/unblendedcost", "unblendedcost", "totalcost", "cost(usd)"
+    ),
+    "direction": ("direction", "收/支", "收支", "收支方向"),
+    "status": ("status", "当前状态", "交易状态"),
+    "pay_time": (
+        "pay_time", "date", "交易时间", "交易创建时间", "付款时间", "账单日期", "账期", "日期", "消费时间",
+        "billingdate", "lineitem/usagestartdate", "usagestartdate"
+    ),
+    "vendor": ("vendor", "交易对方", "服务商", "供应商", "lineitem/productcode", "productcode", "provider"),
+    "title": ("title", "商品", "商品名称", "商品说明", "产品", "产品名称", "产品明细", "项目", "description", "lineitem/lineitemdescription", "product", "model"),
+    "transaction_id": ("transaction_id", "交易单号", "交易号", "交易订单号", "账单id", "账单号", "流水号", "invoiceid", "billid", "identity/lineitemid"),
+    "remark": ("remark", "备注", "摘要"),
+}
+REQUIRED_COLUMNS = ("amount",)
+
+INCOME_WORDS = ("收入", "income", "in")
+NEUTRAL_WORDS = ("不计收支", "/", "neutral")
+CLOSED_STATUS_WORDS = ("关闭", "失败", "全额退款")
+SUMMARY_WORDS = ("合计", "总计", "小计", "total", "subtotal")
+
+# Built-in vendor keywords, checked (lowercased) against vendor, title and remark in this order
+DEFAULT_RULES = (
+    ("AI_API", (
+        "openai", "anthropic", "claude", "chatgpt", "gemini", "deepseek", "moonshot", "kimi", "智谱", "通义",
+        "文心", "百炼", "bedrock", "token", "api调用"
+    )),
+    ("CLOUD", (
+        "阿里云", "aliyun", "alibaba cloud", "腾讯云", "tencent cloud", "华为云", "火山引擎", "aws", "amazon web services",
+        "ec2", "amazons3", "amazonrds", "amazoncloudfront", "azure", "google cloud", "gcp", "cloudflare", "vercel", "digitalocean", "服务器", "云服务", "ecs", "cdn", "域名"
+    )),
+    ("SAAS", (
+        "github", "gitlab", "jetbrains", "notion", "figma", "slack", "zoom", "飞书", "钉钉", "企业微信", "subscription", "订阅", "会员"
+    )),
+    ("MARKETING", ("推广", "广告", "投放", "google ads", "巨量引擎", "小红书", "百度推广")),
+    ("LABOR", ("工资", "薪资", "外包", "劳务", "社保", "公积金")),
+)
+
+@dataclass
+class BillLine:
+    line: int
+    status: str = "invalid" # pending, ignored or invalid
+    amount: Optional[Decimal] = None
+    pay_time: Optional[date] = None
+    vendor: Optional[str] = None
+    title: Optional[str] = None
+    transaction_id: Optional[str] = None
+    remark: Optional[str] = None
+    message: Optional[str] = None
+
+# --- Parsing ---
+
+def _parse_day(value: str) -> date:
+    try:
+        return parse_time(value).date()
+    except ValueError:
+        pass
+    for parse in (
+        lambda v: datetime.fromisoformat(v.replace("Z", "+00:00")), # 2024-03-01T00:00:00Z usage exports
+        lambda v: datetime.strptime(v, "%Y-%m"), # Monthly bills
+        lambda v: datetime.strptime(v, "%Y/%m")
+    ):
+        try:
+            return parse(value).date()
+        except ValueError:
+            continue
+    raise ValueError(f"无法识别的日期: {value}")
+
+def parse_bill(rows: Iterable[List[str]]) -> Iterator[BillLine]:
+    """Yield a BillLine per data row. Raises ValueError when no header row is found."""
+    for number, cells in data_rows(rows, COLUMN_ALIASES, REQUIRED_COLUMNS):
+        line = BillLine(
+            line=number,
+            vendor=cells.get("vendor") or None,
+            title=cells.get("title") or None,
+            transaction_id=cells.get("transaction_id") or None,
+            remark=cells.get("remark") or None
+        )
+        direction = (cells.get("direction") or "").lower()
+        status = cells.get("status") or ""
+        first = (cells.get("pay_time") or cells.get("vendor") or cells.get("title") or "").lower()
+        summary = not cells["amount"] or first in SUMMARY_WORDS
+        if summary or direction in INCOME_WORDS or direction in NEUTRAL_WORDS or any(w in status for w in CLOSED_STATUS_WORDS):
+            # Footer and total rows; only money going out is a cost
+            line.status = "ignored"
+            yield line
+            continue
+        try:
+            # Only finite amounts get past parse_amount, NaN / Infinity lines are invalid
+            amount = parse_amount(cells["amount"])
+            line.pay_time = _parse_day(cells["pay_time"]) if cells.get("pay_time") else date.today()
+            if direction:
+                amount = abs(amount) # Alipay/WeChat show expenses as positive or negative amounts
+            free = amount <= 0 # Free usage, credits and discounts
+        except ValueError as e:
+            line.message = str(e)
+            yield line
+            continue
+        if free:
+            line.status = "ignored"
+            yield line
+            continue
+        line.amount = amount
+        line.status = "pending"
+        yield line
+
+# --- Categories ---
+
+def load_rules(db: Session) -> List[Tuple[str, str]]:
+    """
+    (keyword, category) rules: the configured ones, then the built-in ones.
+    The `cost_import_rules` config holds a JSON list of
+    {"keyword": "...", "category": "CLOUD"}.
+    """
+    rules = []
+    value = db.execute(select(SysConfig.config_value).where(SysConfig.config_key == RULES_CONFIG_KEY)).scalar()
+    if value:
+        try:
+            configured = json.loads(value)
+            for rule in configured:
+                keyword, category = str(rule["keyword"]).strip().lower(), rule["category"]
+                if category not in CATEGORIES:
+                    raise ValueError(category)
+                if keyword:
+                    rules.append((keyword, category))
+        except (TypeError, KeyError, ValueError):
+            raise ValueError(f"支出分类规则配置 {RULES_CONFIG_KEY} 格式错误，应为 [{{\"keyword\": \"...\", \"category\": \"CLOUD\"}}]")
+    rules.extend((keyword, category) for category, keywords in DEFAULT_RULES for keyword in keywords)
+    return rules
+
+def categorize(line: BillLine, rules: List[Tuple[str, str]], default: str = "OTHER") -> str:
+    text = " ".join(part for part in (line.vendor, line.title, line.remark) if part).lower()
+    return next((category for keyword, category in rules if keyword in text), default)
+
+# --- Hashing ---
+
+def content_key(line: BillLine, pay_account: str) -> str:
+    """What identifies a line across imports of the same account's bills."""
+    if line.transaction_id:
+        return "\n".join((pay_account, "id", line.transaction_id))
+    return "\n".join((
+        pay_account, line.pay_time.isoformat(), str(line.amount.quantize(Decimal("0.01"))),
+        line.vendor or "", line.title or "", line.remark or ""
+    ))
+
+def _digest(key: str, occurrence: int) -> str:
+    # Identical lines in one bill (e.g. two equal API top-ups on a day) stay distinct by their number
+    return hashlib.sha256(f"{key}\n#{occurrence}".encode()).hexdigest()
+
+# --- Writing ---
+
+def _write_chunk(db: Session, rows: List[dict]) -> List[str]:
+    """Insert one chunk in its own transaction. Returns the new ids."""
+    db.execute(insert(Cost.__table__), rows)
+    rollup.refresh(db, costs=[row["pay_time"] for row in rows])
+    version = analysis_cache.bump(db)
+    db.commit()
+    ids = [row["id"] for row in rows]
+    columnar.apply_changes(db, version, costs=ids)
+    return ids
+
+def iter_import(
+    db: Session,
+    lines: Iterable[BillLine],
+    pay_account: str = "ALIPAY",
+    default_category: str = "OTHER",
+    creator_id: Optional[str] = None,
+    invoice_url: Optional[str] = None
+) -> Iterator[dict]:
+    """
+    Import parsed bill lines. Yields the running result after every chunk;
+    the last one yielded is final. Raises ValueError for unreadable input or
+    rules (chunks already written stay committed).
+    """
+    if default_category not in CATEGORIES:
+        raise ValueError(f"未知的支出类别: {default_category}")
+    rules = load_rules(db)
+    result = {"processed": 0, "created": 0, "duplicates": 0, "ignored": 0, "failed": 0, "errors": []}
+    occurrences: Dict[str, int] = {} # content key digest -> times seen in this file
+
+    def fail(line: int, message: str) -> None:
+        result["failed"] += 1
+        if len(result["errors"]) < MAX_REPORTED_ERRORS:
+            result["errors"].append({"line": line, "message": message})
+
+    def write(pending: List[Tuple[int, dict]]) -> None:
+        stored = set(db.execute(
+            select(Cost.import_hash).where(Cost.import_hash.in_([row["import_hash"] for _, row in pending]))
+        ).scalars())
+        rows = [row for _, row in pending if row["import_hash"] not in stored]
+        result["duplicates"] += len(pending) - len(rows)
+        if not rows:
+            return
+        try:
+            result["created"] += len(_write_chunk(db, rows))
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.error(f"Cost import chunk failed: {e}")
+            message = "该行已导入 (并发导入)" if isinstance(e, IntegrityError) else f"写入失败: {e.__class__.__name__}"
+            for line, row in pending:
+                if row["import_hash"] not in stored:
+                    fail(line, message)
+
+    now = datetime.now()
+    pending: List[Tuple[int, dict]] = []
+    for line in lines:
+        result["processed"] += 1
+        if line.status == "ignored":
+            result["ignored"] += 1
+            continue
+        if line.status != "pending":
+            fail(line.line, line.message or "无法识别的行")
+            continue
+
+        key = hashlib.sha256(content_key(line, pay_account).encode()).hexdigest()
+        occurrence = occurrences.get(key, 0)
+        occurrences[key] = occurrence + 1
+        if line.transaction_id and occurrence:
+            # Same transaction listed twice in the file
+            result["duplicates"] += 1
+            continue
+        title = " ".join(part for part in (line.vendor, line.title) if part) or line.remark or "账单导入"
+        pending.append((line.line, {
+            "id": str(uuid.uuid4()),
+            "title": title[:TITLE_MAX_LENGTH],
+            "amount": line.amount,
+            "category": categorize(line, rules, default_category),
+            "pay_time": line.pay_time,
+            "pay_account": pay_account,
+            "invoice_url": invoice_url,
+            "remark": line.remark,
+            "import_hash": _digest(key, occurrence),
+            "creator_id": creator_id,
+            "created_at": now,
+        }))
+        if len(pending) >= CHUNK_SIZE:
+            write(pending)
+            pending = []
+            yield result
+    if pending:
+        write(pending)
+    yield result
+
+def import_costs(db: Session, lines: Iterable[BillLine], **options) -> dict:
+    """Run `iter_import` to the end and return the final result."""
+    result = None
+    for result in iter_import(db, lines, **options):
+        pass
+    return result
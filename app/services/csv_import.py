@@ -0,0 +1,77 @@
+"""
+Shared helpers for the CSV importers (statements, orders).
+
+Files are decoded and parsed incrementally; the header row is located by
+its column names, so export preambles before it are skipped.
+"""
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterator, List, Optional, Sequence
+import codecs
+import csv
+
+HEADER_SCAN_ROWS = 30
+TIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y/%m/%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y/%m/%d %H:%M", "%Y-%m-%d", "%Y/%m/%d", "%Y%m%d")
+
+def csv_rows(binary_file, encoding: str = "utf-8-sig") -> Iterator[List[str]]:
+    """Decode an uploaded file incrementally and yield its CSV rows."""
+    reader = csv.reader(codecs.getreader(encoding)(binary_file, errors="replace"))
+    try:
+        yield from reader
+    except csv.Error as e:
+        raise ValueError(f"CSV 格式错误 (第 {reader.line_num} 行): {e}")
+
+def _normalize_header(value: str) -> str:
+    return value.strip().lower().replace(" ", "")
+
+def header_map(row: List[str], aliases: Dict[str, Sequence[str]], required: Sequence[str]) -> Optional[Dict[str, int]]:
+    """{column: index} when `row` is a header holding all `required` columns, else None."""
+    names = [_normalize_header(cell) for cell in row]
+    columns = {}
+    for column, accepted in aliases.items():
+        for i, name in enumerate(names):
+            if name in accepted:
+                columns[column] = i
+                break
+    return columns if all(column in columns for column in required) else None
+
+def data_rows(rows, aliases: Dict[str, Sequence[str]], required: Sequence[str]) -> Iterator[tuple]:
+    """
+    Yield (line number, {column: stripped value}) for every non-empty row
+    after the header. Raises ValueError when no header is found.
+    """
+    columns = None
+    for number, row in enumerate(rows, start=1):
+        if columns is None:
+            columns = header_map(row, aliases, required)
+            if columns is None and number >= HEADER_SCAN_ROWS:
+                break
+            continue
+        if not any(cell.strip() for cell in row):
+            continue
+        yield number, {
+            column: row[index].strip() if index < len(row) else ""
+            for column, index in columns.items()
+        }
+    if columns is None:
+        raise ValueError(f"未找到表头，需要包含列: {', '.join(' / '.join(aliases[c][:2]) for c in required)}")
+
+def parse_amount(value: str) -> Decimal:
+    """Amount of a cell. Raises ValueError for text that is not a finite number (NaN, Infinity)."""
+    cleaned = value.strip().replace(",", "").replace("¥", "").replace("￥", "")
+    try:
+        amount = Decimal(cleaned)
+    except InvalidOperation:
+        amount = None
+    if amount is None or not amount.is_finite():
+        raise ValueError(f"无法识别的金额: {value}")
+    return amount
+
+def parse_time(value: str) -> datetime:
+    value = value.strip()
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"无法识别的时间: {value}")
@@ -0,0 +1,171 @@
+"""
+Idempotency-Key storage.
+
+A write request carrying an `Idempotency-Key` header first claims the key by
+inserting its row into `sys_idempotency_key` (status_code NULL while the
+request runs), then stores the response it produced. A retry with the same
+key gets that stored response back without running the write again; the
+same key with a different body is refused, as is a retry arriving while the
+first request is still running.
+
+Completed responses are also kept in a per-worker LRU, so most retries are
+answered without a database round trip. Keys expire after
+IDEMPOTENCY_TTL_HOURS; expired rows are swept by the claim path at most once
+per SWEEP_INTERVAL. A claim whose request died without completing (worker
+killed) can be taken over after STALE_CLAIM_TIMEOUT.
+
+Claims run on their own connection and transaction, independent of the
+request's session (see app.api.idempotency for the middleware).
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+import hashlib
+import threading
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+from app.db.session import engine
+from app.models.idempotency import IdempotencyRecord
+
+SWEEP_INTERVAL = timedelta(minutes=10)
+STALE_CLAIM_TIMEOUT = timedelta(minutes=5)
+
+class StoredResponse(NamedTuple):
+    request_hash: str
+    status_code: int
+    content_type: Optional[str]
+    body: str
+
+class KeyInProgress(Exception):
+    """The first request with this key has not finished yet."""
+
+class KeyMismatch(Exception):
+    """The key was used before with a different request body."""
+
+def record_key(key: str, method: str, path: str, caller: Optional[str]) -> str:
+    """Row key of a header value, scoped to the endpoint and the caller's credentials."""
+    return hashlib.sha256("\n".join((key, method, path, caller or "")).encode()).hexdigest()
+
+def request_hash(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+class ResponseCache:
+    """LRU of completed responses by record key."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict() # key -> (StoredResponse, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[StoredResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= datetime.now():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: str, response: StoredResponse, expires_at: datetime) -> None:
+        with self._lock:
+            self._entries[key] = (response, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+class IdempotencyStore:
+    def __init__(self, bind, ttl: timedelta, cache_size: int):
+        self.bind = bind
+        self.ttl = ttl
+        self.cache = ResponseCache(cache_size)
+        self._last_sweep = datetime.min
+        self._sweep_lock = threading.Lock()
+
+    def _check(self, response: StoredResponse, request_hash: str) -> StoredResponse:
+        if response.request_hash != request_hash:
+            raise KeyMismatch()
+        return response
+
+    def claim(self, key: str, request_hash: str) -> Optional[StoredResponse]:
+        """
+        Claim `key` for a new request and return None, or return the stored
+        response of an earlier request with it. Raises KeyInProgress or
+        KeyMismatch.
+        """
+        cached = self.cache.get(key)
+        if cached is not None:
+            return self._check(cached, request_hash)
+        self.sweep()
+
+        table = IdempotencyRecord.__table__
+        now = datetime.now()
+        try:
+            with self.bind.begin() as conn:
+                conn.execute(insert(table).values(key=key, request_hash=request_hash, created_at=now))
+            return None
+        except IntegrityError:
+            pass
+
+        with self.bind.begin() as conn:
+            row = conn.execute(select(table).where(table.c.key == key)).first()
+            if row is None:
+                # Swept in between, claim it again
+                conn.execute(insert(table).values(key=key, request_hash=request_hash, created_at=now))
+                return None
+            expired = row.created_at <= now - self.ttl
+            stale = row.status_code is None and row.created_at <= now - STALE_CLAIM_TIMEOUT
+            if expired or stale:
+                # Take the row over; the created_at check makes sure only one retry wins it
+                result = conn.execute(update(table).where(
+                    table.c.key == key, table.c.created_at == row.created_at
+                ).values(request_hash=request_hash, status_code=None, content_type=None, response_body=None, created_at=now))
+                if result.rowcount:
+                    return None
+                raise KeyInProgress()
+
+        if row.request_hash != request_hash:
+            raise KeyMismatch()
+        if row.status_code is None:
+            raise KeyInProgress()
+        response = StoredResponse(row.request_hash, row.status_code, row.content_type, row.response_body)
+        self.cache.put(key, response, row.created_at + self.ttl)
+        return response
+
+    def complete(self, key: str, response: StoredResponse) -> None:
+        """Store the response of the request that claimed `key`."""
+        table = IdempotencyRecord.__table__
+        with self.bind.begin() as conn:
+            conn.execute(update(table).where(table.c.key == key).values(
+                status_code=response.status_code,
+                content_type=response.content_type,
+                response_body=response.body
+            ))
+        self.cache.put(key, response, datetime.now() + self.ttl)
+
+    def release(self, key: str) -> None:
+        """Drop a claim whose request failed, so a retry runs it again."""
+        table = IdempotencyRecord.__table__
+        with self.bind.begin() as conn:
+            conn.execute(delete(table).where(table.c.key == key, table.c.status_code.is_(None)))
+
+    def sweep(self, force: bool = False) -> int:
+        """Delete expired keys, at most once per SWEEP_INTERVAL unless forced. Returns the rows deleted."""
+        now = datetime.now()
+        with self._sweep_lock:
+            if not force and now - self._last_sweep < SWEEP_INTERVAL:
+                return 0
+            self._last_sweep = now
+        table = IdempotencyRecord.__table__
+        with self.bind.begin() as conn:
+            return conn.execute(delete(table).where(table.c.created_at <= now - self.ttl)).rowcount
+
+store = IdempotencyStore(engine, timedelta(hours=settings.IDEMPOTENCY_TTL_HOURS), settings.IDEMPOTENCY_CACHE_SIZE)
@@ -0,0 +1,253 @@
+"""
+Running receivables ledger.
+
+Keeps one checkpoint per (day, order_type) with that day's activity and the
+cumulative balances through the day (see app.models.ledger). The balance as
+of any date is then a single indexed lookup of the latest checkpoint on or
+before it, instead of summing the whole order and payment history:
+
+- balance: orders created minus collections received (analysis "pending")
+- open_balance: amount - total_paid of orders not VOID/REFUNDED (order stats)
+
+`rollup.refresh()` calls `refresh_days()` for every sales/payment day it
+refreshes, inside the same transaction; the day's activity is re-read and the
+difference is added to the checkpoints after it. The data version row is
+locked before the reads (see `analysis_cache.lock`), so concurrent writes
+apply their differences one after the other. `rebuild()` recomputes
+everything and is exposed through `scripts/rebuild.py ledger`.
+"""
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+
+from sqlalchemy import bindparam, case, delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.db.dates import as_date, day_spans
+from app.models.ledger import ReceivableLedger, ALL_ORDER_TYPES
+from app.models.order import Order
+from app.models.rollup import SalesDailyRollup, PaymentDailyRollup
+from app.services import analysis_cache
+
+logger = logging.getLogger(__name__)
+
+ZERO = Decimal("0.00")
+CLOSED_STATUSES = ("VOID", "REFUNDED")
+ACTIVITY_FIELDS = ("sales_amount", "collected_amount", "open_amount")
+REBUILD_CHUNK_SIZE = 1000
+
+def _decimal(value) -> Decimal:
+    return Decimal(str(value)) if value is not None else ZERO
+
+def _empty_activity() -> Dict[str, Decimal]:
+    return {field: ZERO for field in ACTIVITY_FIELDS}
+
+def _open_amount():
+    return func.sum(case(
+        (Order.status.notin_(CLOSED_STATUSES), Order.amount - func.coalesce(Order.total_paid, 0)),
+        else_=0
+    ))
+
+def _collect(activity, key_rows, field: str) -> None:
+    """Add (key, amount) rows to `activity[key][field]` and to the all-types total."""
+    for key, amount in key_rows:
+        amount = _decimal(amount)
+        day, order_type = key
+        activity[(day, order_type)][field] += amount
+        activity[(day, ALL_ORDER_TYPES)][field] += amount
+
+def _activity(conn, lower: Optional[date] = None, upper: Optional[date] = None):
+    """{(day, order_type): activity} for days in [lower, upper) (all when unbounded)."""
+    activity = defaultdict(_empty_activity)
+
+    def bounded(stmt, column, as_datetime=False):
+        if lower is not None:
+            stmt = stmt.where(column >= (datetime.combine(lower, time.min) if as_datetime else lower))
+        if upper is not None:
+            stmt = stmt.where(column < (datetime.combine(upper, time.min) if as_datetime else upper))
+        return stmt
+
+    sales = bounded(select(
+        SalesDailyRollup.day, SalesDailyRollup.order_type, func.sum(SalesDailyRollup.amount)
+    ), SalesDailyRollup.day).group_by(SalesDailyRollup.day, SalesDailyRollup.order_type)
+    _collect(activity, (((as_date(d), t), a) for d, t, a in conn.execute(sales)), "sales_amount")
+
+    collected = bounded(select(
+        PaymentDailyRollup.day, PaymentDailyRollup.order_type, func.sum(PaymentDailyRollup.amount)
+    ).where(PaymentDailyRollup.type == 1), PaymentDailyRollup.day).group_by(
+        PaymentDailyRollup.day, PaymentDailyRollup.order_type
+    )
+    _collect(activity, (((as_date(d), t), a) for d, t, a in conn.execute(collected)), "collected_amount")
+
+    # total_paid is not rolled up, read the orders of the day
+    created_day = func.date(Order.created_at)
+    open_rows = bounded(select(
+        created_day, Order.order_type, _open_amount()
+    ), Order.created_at, as_datetime=True).group_by(created_day, Order.order_type)
+    _collect(
+        activity,
+        (((as_date(d), t), a) for d, t, a in conn.execute(open_rows) if d is not None),
+        "open_amount"
+    )
+    return activity
+
+def _previous_balances(conn, order_type: str, day: date) -> Tuple[Decimal, Decimal]:
+    table = ReceivableLedger.__table__
+    row = conn.execute(
+        select(table.c.balance, table.c.open_balance)
+        .where(table.c.order_type == order_type, table.c.day < day)
+        .order_by(table.c.day.desc()).limit(1)
+    ).first()
+    return (_decimal(row.balance), _decimal(row.open_balance)) if row else (ZERO, ZERO)
+
+def _shift(order_type: str, diffs: List[Tuple[date, Decimal, Decimal]]):
+    """
+    One UPDATE adding to every checkpoint of `order_type` the sum of the
+    (day, balance diff, open diff) entries dated on or before it.
+    """
+    table = ReceivableLedger.__table__
+    steps = []
+    balance_total, open_total = ZERO, ZERO
+    for day, balance_diff, open_diff in sorted(diffs):
+        balance_total += balance_diff
+        open_total += open_diff
+        steps.append((day, balance_total, open_total))
+    # Latest step first: a checkpoint takes the running sum of the last step on or before it
+    steps.reverse()
+    return update(table).where(
+        table.c.order_type == order_type, table.c.day >= steps[-1][0]
+    ).values(
+        balance=table.c.balance + case(*[(table.c.day >= day, total) for day, total, _ in steps], else_=0),
+        open_balance=table.c.open_balance + case(*[(table.c.day >= day, total) for day, _, total in steps], else_=0)
+    )
+
+def refresh_days(conn, values: Iterable) -> None:
+    """
+    Re-read the activity of the given days and move the running balances by
+    the difference. Call after the sales/payment rollups of those days are
+    refreshed. `conn` may be a Session or a Connection.
+
+    Activity is read per span of nearby days, and the balances of each order
+    type are shifted with a single UPDATE, so refreshing many days (bulk
+    imports) costs a handful of statements.
+    """
+    table = ReceivableLedger.__table__
+    days = {as_date(v) for v in values if v is not None}
+    if not days:
+        return
+
+    # Held until commit: a concurrent write cannot move the balances between
+    # the reads below and the shift (taken already when called from rollup.refresh)
+    analysis_cache.lock(conn)
+    activity, existing = {}, {}
+    for first, last in day_spans(days):
+        for key, amounts in _activity(conn, first, last + timedelta(days=1)).items():
+            if key[0] in days:
+                activity[key] = amounts
+        for row in conn.execute(select(table).where(table.c.day >= first, table.c.day <= last)):
+            existing[(row.day, row.order_type)] = row
+
+    inserts, updates, deletes = [], [], []
+    diffs = defaultdict(list)
+    for day, order_type in sorted(set(activity) | set(key for key in existing if key[0] in days)):
+        new = activity.get((day, order_type)) or _empty_activity()
+        old = existing.get((day, order_type))
+        old_values = {f: _decimal(getattr(old, f)) for f in ACTIVITY_FIELDS} if old else _empty_activity()
+
+        balance_diff = (new["sales_amount"] - new["collected_amount"]) - (old_values["sales_amount"] - old_values["collected_amount"])
+        open_diff = new["open_amount"] - old_values["open_amount"]
+        is_empty = not any(new.values())
+
+        if old is None:
+            if is_empty:
+                continue
+            # Start from the balances as of the previous checkpoint, the shift below adds the diffs
+            balance, open_balance = _previous_balances(conn, order_type, day)
+            inserts.append(dict(day=day, order_type=order_type, **new, balance=balance, open_balance=open_balance))
+        elif is_empty:
+            # The previous checkpoint already carries the balance
+            deletes.append(old.id)
+        elif new != old_values:
+            updates.append(dict(_id=old.id, **new))
+
+        if balance_diff or open_diff:
+            diffs[order_type].append((day, balance_diff, open_diff))
+
+    # Statements run only after every previous balance was read
+    if inserts:
+        conn.execute(insert(table), inserts)
+    if updates:
+        conn.execute(
+            update(table).where(table.c.id == bindparam("_id")).values({f: bindparam(f) for f in ACTIVITY_FIELDS}),
+            updates
+        )
+    if deletes:
+        conn.execute(delete(table).where(table.c.id.in_(deletes)))
+    for order_type, type_diffs in diffs.items():
+        conn.execute(_shift(order_type, type_diffs))
+
+# --- Lookups ---
+
+def balances_as_of(conn, day, order_types: Optional[List[str]] = None) -> Tuple[Decimal, Decimal]:
+    """
+    (balance, open_balance) at the end of `day` for the given order types
+    (all types when None). One indexed lookup per type.
+    """
+    table = ReceivableLedger.__table__
+    day = as_date(day)
+    balance, open_balance = ZERO, ZERO
+    for order_type in (order_types if order_types is not None else [ALL_ORDER_TYPES]):
+        row = conn.execute(
+            select(table.c.balance, table.c.open_balance)
+            .where(table.c.order_type == order_type, table.c.day <= day)
+            .order_by(table.c.day.desc()).limit(1)
+        ).first()
+        if row:
+            balance += _decimal(row.balance)
+            open_balance += _decimal(row.open_balance)
+    return balance, open_balance
+
+def current_open_balance(conn) -> Decimal:
+    """Outstanding amount on all non-void orders right now."""
+    table = ReceivableLedger.__table__
+    row = conn.execute(
+        select(table.c.open_balance)
+        .where(table.c.order_type == ALL_ORDER_TYPES)
+        .order_by(table.c.day.desc()).limit(1)
+    ).first()
+    return _decimal(row.open_balance) if row else ZERO
+
+# --- Full rebuild ---
+
+def rebuild(db: Session) -> int:
+    """Recompute every checkpoint from the rollups and orders, and commit. Returns row count."""
+    table = ReceivableLedger.__table__
+    db.execute(delete(table))
+
+    activity = _activity(db)
+    running = defaultdict(lambda: [ZERO, ZERO])
+    rows = []
+    for (day, order_type) in sorted(activity, key=lambda key: (key[1], key[0])):
+        values = activity[(day, order_type)]
+        if not any(values.values()):
+            continue
+        totals = running[order_type]
+        totals[0] += values["sales_amount"] - values["collected_amount"]
+        totals[1] += values["open_amount"]
+        rows.append(dict(day=day, order_type=order_type, **values, balance=totals[0], open_balance=totals[1]))
+
+    for i in range(0, len(rows), REBUILD_CHUNK_SIZE):
+        db.execute(insert(table), rows[i:i + REBUILD_CHUNK_SIZE])
+    # Running workers drop cached results computed from the old checkpoints
+    analysis_cache.bump(db)
+    db.commit()
+    logger.info(f"Receivables ledger rebuilt: {len(rows)} checkpoints")
+    return len(rows)
+
+def ensure_built(db: Session) -> None:
+    """Build the ledger on the first start after upgrading an existing database."""
+    if db.query(ReceivableLedger.id).first() is None and db.query(Order.id).first() is not None:
+        logger.info("Building receivables ledger")
+        rebuild(db)
@@ -0,0 +1,192 @@
+"""
+Order payment counters.
+
+`Order.total_paid` (collections - refunds), `total_refunded` and
+`refund_count` are kept current by applying each payment record as a delta
+in one atomic UPDATE of the order row, and the order status is derived from
+those counters. Posting a payment is O(1) however long the order's
+installment history is. Concurrent payments on one order serialize on the
+row lock instead of overwriting each other's re-summed totals.
+
+`verify()` re-sums the payment records and is only used to check (and
+optionally repair) the counters, see `scripts/rebuild.py balances`.
+"""
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+import datetime
+import logging
+
+from sqlalchemy import case, func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models.data_version import DataVersion
+from app.models.order import Order
+from app.models.payment import PaymentRecord
+from app.models.rollup import SalesDailyRollup
+from app.services import analysis_cache, client_stats, columnar, ledger, rollup
+
+logger = logging.getLogger(__name__)
+
+ZERO = Decimal("0.00")
+COLLECTION, REFUND = 1, 2
+VERIFY_CHUNK_SIZE = 1000
+COUNTERS_SCOPE = "order_counters" # sys_data_version marker: counters filled
+
+def _decimal(value) -> Decimal:
+    return Decimal(str(value)) if value is not None else ZERO
+
+def update_status(order: Order) -> None:
+    """Derive status, pay_time and the legacy actual_amount from the counters."""
+    net_paid = _decimal(order.total_paid)
+    has_refund = (order.refund_count or 0) > 0
+    order.actual_amount = net_paid # Sync legacy field
+
+    if net_paid >= order.amount:
+        order.status = "PAID"
+        if not order.pay_time:
+            order.pay_time = datetime.datetime.now()
+    elif net_paid > 0:
+        order.status = "REFUND_PART" if has_refund else "PARTIAL"
+    else:
+        # Net paid == 0 (or less, though shouldn't happen if validation is correct)
+        if has_refund:
+            order.status = "REFUNDED"
+        else:
+            order.status = "PENDING"
+            order.pay_time = None # Reset pay time
+
+def payment_deltas(payment_type: int, amount, sign: int = 1) -> Tuple[Decimal, Decimal, int]:
+    """(total_paid, total_refunded, refund_count) changes of adding (sign=1) or removing (sign=-1) a record."""
+    amount = _decimal(amount)
+    if payment_type == REFUND:
+        return -amount * sign, amount * sign, sign
+    return amount * sign, ZERO, 0
+
+def apply_deltas(
+    db: Session,
+    order: Order,
+    paid_delta,
+    refunded_delta=ZERO,
+    refund_count_delta: int = 0,
+    min_paid=None
+) -> bool:
+    """
+    Move the order's counters by the given deltas in one atomic UPDATE and
+    re-derive its status. With `min_paid`, the update only applies while
+    total_paid is at least that much at that moment; returns False otherwise.
+    """
+    stmt = update(Order).where(Order.id == order.id).values(
+        total_paid=func.coalesce(Order.total_paid, 0) + paid_delta,
+        total_refunded=Order.total_refunded + refunded_delta,
+        refund_count=Order.refund_count + refund_count_delta
+    )
+    if min_paid is not None:
+        stmt = stmt.where(func.coalesce(Order.total_paid, 0) >= min_paid)
+    if db.execute(stmt.execution_options(synchronize_session=False)).rowcount == 0:
+        return False
+
+    # The row stays locked by the UPDATE until commit, the values read back are ours
+    db.refresh(order, ["total_paid", "total_refunded", "refund_count"])
+    update_status(order)
+    db.add(order)
+    db.flush()
+    return True
+
+def apply_payment(db: Session, order: Order, payment_type: int, amount, sign: int = 1) -> bool:
+    """
+    Add (sign=1) or remove (sign=-1) one payment record on the order's
+    counters. A new refund is only applied while it does not exceed
+    total_paid at that moment; returns False when it does.
+    """
+    min_paid = _decimal(amount) if payment_type == REFUND and sign > 0 else None
+    return apply_deltas(db, order, *payment_deltas(payment_type, amount, sign), min_paid=min_paid)
+
+# --- Verification ---
+
+def _record_totals(db: Session, order_ids: List[str]) -> Dict[str, Tuple[Decimal, Decimal, int]]:
+    """{order_id: (net paid, refunded, refund count)} re-summed from the payment records."""
+    is_refund = PaymentRecord.type == REFUND
+    rows = db.execute(
+        select(
+            PaymentRecord.order_id,
+            func.sum(case((is_refund, -PaymentRecord.amount), else_=PaymentRecord.amount)),
+            func.sum(case((is_refund, PaymentRecord.amount), else_=0)),
+            func.sum(case((is_refund, 1), else_=0))
+        ).where(PaymentRecord.order_id.in_(order_ids)).group_by(PaymentRecord.order_id)
+    )
+    return {order_id: (_decimal(paid), _decimal(refunded), int(count or 0)) for order_id, paid, refunded, count in rows}
+
+def _commit_fixes(db: Session, fixed: List[Order]) -> None:
+    """Commit fixed counters with what is derived from them: sales rollups, ledger, client stats."""
+    db.flush()
+    rollup.refresh(db, sales=[order.created_at for order in fixed])
+    client_stats.refresh(db, {order.client_id for order in fixed})
+    order_ids = [order.id for order in fixed]
+    version = analysis_cache.bump(db)
+    db.commit()
+    columnar.apply_changes(db, version, orders=order_ids)
+
+def verify(db: Session, fix: bool = False, refresh: bool = True) -> List[dict]:
+    """
+    Compare every order's counters with its payment records. With `fix`,
+    mismatching counters are overwritten, statuses re-derived (VOID orders
+    keep their status) and committed per chunk, together with the rollup
+    days, ledger and client stats depending on them (unless `refresh` is
+    off). Returns the mismatches found.
+    """
+    mismatches = []
+    last_id: Optional[str] = None
+    while True:
+        query = db.query(Order)
+        if last_id is not None:
+            query = query.filter(Order.id > last_id)
+        orders = query.order_by(Order.id).limit(VERIFY_CHUNK_SIZE).all()
+        if not orders:
+            break
+        totals = _record_totals(db, [order.id for order in orders])
+        fixed = []
+        for order in orders:
+            expected = totals.get(order.id, (ZERO, ZERO, 0))
+            actual = (_decimal(order.total_paid), _decimal(order.total_refunded), order.refund_count or 0)
+            if actual == expected:
+                continue
+            mismatches.append({"order_id": order.id, "order_no": order.order_no, "actual": actual, "expected": expected})
+            if fix:
+                order.total_paid, order.total_refunded, order.refund_count = expected
+                if order.status != "VOID":
+                    update_status(order)
+                fixed.append(order)
+        last_id = orders[-1].id
+        if fixed and refresh:
+            _commit_fixes(db, fixed)
+        elif fix:
+            db.commit()
+    if mismatches:
+        logger.warning(f"Order payment counters: {len(mismatches)} mismatches{' fixed' if fix else ''}")
+    return mismatches
+
+def ensure_counters(db: Session) -> None:
+    """
+    Fill the counters from the payment records once per database (the
+    columns were added to orders that already had payments). Completion is
+    recorded in `sys_data_version`, so a fill that failed or was interrupted
+    runs again on the next start.
+
+    Runs before the derived data is built. Refreshing single days would make
+    empty derived tables look built, so when the fill changes anything and
+    they already exist, they are rebuilt instead.
+    """
+    if db.get(DataVersion, COUNTERS_SCOPE) is not None:
+        return
+    logger.info("Filling order payment counters")
+    if verify(db, fix=True, refresh=False) and db.query(SalesDailyRollup.id).first() is not None:
+        rollup.rebuild(db, ["sales"])
+        ledger.rebuild(db)
+        client_stats.rebuild(db)
+    try:
+        db.add(DataVersion(scope=COUNTERS_SCOPE, version=1))
+        db.commit()
+    except IntegrityError:
+        # Another worker filled them at the same time
+        db.rollback()
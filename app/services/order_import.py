@@ -0,0 +1,204 @@
+"""
+Bulk order creation and spreadsheet import.
+
+Rows are validated as they stream in and written in chunks of CHUNK_SIZE,
+one transaction per chunk:
+
+- clients are resolved through one id/name map of all clients, loaded once
+- the chunk's order numbers come from one allocator block (app.services.order_no)
+- orders are inserted with one executemany, and the search index, rollups
+  and analysis caches are refreshed once per chunk
+
+Invalid rows are skipped and reported with their line number. Imported
+orders start as PENDING; collections are posted afterwards, e.g. through the
+statement import.
+"""
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import logging
+import uuid
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.models.client import Client
+from app.models.order import Order
+from app.services import analysis_cache, client_stats, columnar, order_no, rollup, search
+from app.services.csv_import import data_rows, parse_amount, parse_time
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+ORDER_TYPES = ("NEW", "RENEW", "UPSELL", "SERVICE", "IMPLEMENTATION")
+
+# Spreadsheet column -> accepted header names (compared lowercased, spaces removed)
+COLUMN_ALIASES = {
+    "client_id": ("client_id", "客户id", "客户编号"),
+    "client_name": ("client_name", "客户", "客户名称", "客户名"),
+    "order_type": ("order_type", "订单类型", "类型"),
+    "product_info": ("product_info", "产品信息", "产品", "产品名称", "商品"),
+    "amount": ("amount", "金额", "订单金额", "合同金额"),
+    "contract_no": ("contract_no", "合同号", "合同编号"),
+    "remark": ("remark", "备注"),
+    "created_at": ("created_at", "下单时间", "创建时间", "日期"),
+}
+REQUIRED_COLUMNS = ("product_info", "amount")
+
+class ClientLookup:
+    """Every client's id and name, loaded in one query."""
+
+    def __init__(self, db: Session):
+        self.names: Dict[str, str] = {}
+        self.ids_by_name: Dict[str, List[str]] = defaultdict(list)
+        for client_id, name in db.execute(select(Client.id, Client.name)):
+            self.names[client_id] = name
+            self.ids_by_name[name].append(client_id)
+
+    def resolve(self, client_id: Optional[str], client_name: Optional[str]) -> Tuple[str, str]:
+        if client_id:
+            if client_id not in self.names:
+                raise ValueError(f"客户不存在: {client_id}")
+            return client_id, self.names[client_id]
+        if not client_name:
+            raise ValueError("缺少客户 ID 或客户名称")
+        ids = self.ids_by_name.get(client_name, [])
+        if not ids:
+            raise ValueError(f"客户不存在: {client_name}")
+        if len(ids) > 1:
+            raise ValueError(f"客户名称不唯一，请使用客户 ID: {client_name}")
+        return ids[0], client_name
+
+def _text(value) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+def validate(row: dict, clients: ClientLookup) -> dict:
+    """Order column values for one input row. Raises ValueError with a readable message."""
+    client_id, client_name = clients.resolve(_text(row.get("client_id")), _text(row.get("client_name")))
+
+    product_info = _text(row.get("product_info"))
+    if not product_info:
+        raise ValueError("缺少产品信息")
+    amount = row.get("amount")
+    amount = amount if isinstance(amount, Decimal) else parse_amount(str(amount or ""))
+    if not amount.is_finite():
+        raise ValueError(f"无法识别的金额: {row.get('amount')}")
+    if amount < 0:
+        raise ValueError("金额不能为负数")
+
+    order_type = (_text(row.get("order_type")) or "NEW").upper()
+    if order_type not in ORDER_TYPES:
+        raise ValueError(f"未知的订单类型: {order_type}")
+
+    created_at = row.get("created_at")
+    if created_at is not None and not isinstance(created_at, datetime):
+        created_at = parse_time(str(created_at)) if _text(created_at) else None
+
+    return {
+        "client_id": client_id,
+        "client_name": client_name,
+        "product_info": product_info,
+        "amount": amount,
+        "order_type": order_type,
+        "contract_no": _text(row.get("contract_no")),
+        "remark": _text(row.get("remark")),
+        "attachments": row.get("attachments") or "[]",
+        "created_at": created_at,
+    }
+
+def _write_chunk(db: Session, chunk: List[Tuple[int, dict]], creator_id: Optional[str]) -> List[Tuple[int, str, str]]:
+    """Insert one chunk in its own transaction. Returns (line, id, order_no) per order."""
+    # Lease numbers before writing: the allocator uses its own connection
+    numbers = order_no.allocate(len(chunk))
+    now = datetime.now()
+    rows = []
+    for (line, values), number in zip(chunk, numbers):
+        rows.append({
+            **values,
+            "id": str(uuid.uuid4()),
+            "order_no": number,
+            "status": "PENDING",
+            "pay_method": "BANK",
+            "actual_amount": 0,
+            "total_paid": 0,
+            "total_refunded": 0,
+            "refund_count": 0,
+            "is_invoiced": False,
+            "creator_id": creator_id,
+            "created_at": values["created_at"] or now,
+            "updated_at": now,
+        })
+    ids = [row["id"] for row in rows]
+
+    db.execute(insert(Order.__table__), rows)
+    search.refresh(db, orders=ids)
+    rollup.refresh(db, sales=[row["created_at"] for row in rows])
+    client_stats.refresh(db, {row["client_id"] for row in rows})
+    version = analysis_cache.bump(db)
+    db.commit()
+    columnar.apply_changes(db, version, orders=ids)
+    return [(line, row["id"], row["order_no"]) for (line, _), row in zip(chunk, rows)]
+
+def iter_import(
+    db: Session,
+    rows: Iterable[Tuple[int, dict]],
+    creator_id: Optional[str] = None,
+    keep_items: bool = False
+) -> Iterator[dict]:
+    """
+    Import (line, row) pairs. Yields the running result after every chunk;
+    the last one yielded is final. Raises ValueError for unreadable input
+    (chunks already written stay committed).
+    """
+    clients = ClientLookup(db)
+    result = {"processed": 0, "created": 0, "failed": 0, "errors": [], "items": [] if keep_items else None}
+
+    def fail(line: int, message: str) -> None:
+        result["failed"] += 1
+        if len(result["errors"]) < MAX_REPORTED_ERRORS:
+            result["errors"].append({"line": line, "message": message})
+
+    def write(chunk: List[Tuple[int, dict]]) -> None:
+        try:
+            created = _write_chunk(db, chunk, creator_id)
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.error(f"Order import chunk failed: {e}")
+            for line, _ in chunk:
+                fail(line, f"写入失败: {e.__class__.__name__}")
+            return
+        result["created"] += len(created)
+        if keep_items:
+            result["items"].extend({"line": line, "id": id, "order_no": number} for line, id, number in created)
+
+    chunk: List[Tuple[int, dict]] = []
+    for line, row in rows:
+        result["processed"] += 1
+        try:
+            chunk.append((line, validate(row, clients)))
+        except ValueError as e:
+            fail(line, str(e))
+        if len(chunk) >= CHUNK_SIZE:
+            write(chunk)
+            chunk = []
+            yield result
+    if chunk:
+        write(chunk)
+    yield result
+
+def import_orders(db: Session, rows: Iterable[Tuple[int, dict]], creator_id: Optional[str] = None, keep_items: bool = False) -> dict:
+    """Run `iter_import` to the end and return the final result."""
+    result = None
+    for result in iter_import(db, rows, creator_id, keep_items):
+        pass
+    return result
+
+def csv_order_rows(rows: Iterable[List[str]]) -> Iterator[Tuple[int, dict]]:
+    """(line, row) pairs of an order spreadsheet exported as CSV."""
+    return data_rows(rows, COLUMN_ALIASES, REQUIRED_COLUMNS)
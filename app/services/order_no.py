@@ -0,0 +1,106 @@
+"""
+Order number allocator.
+
+Order numbers keep the ORD-YYYYMMDD-HHMM-NNNN format, where NNNN now counts
+up within the minute instead of being random. The counter of each minute lives
+in `sys_sequence`; a worker leases a block of ORDER_NO_BLOCK_SIZE numbers with
+one atomic UPDATE in its own short transaction and hands them out from memory.
+Order creation therefore needs no uniqueness probe, and blocks never overlap
+across workers.
+
+Numbers left in a block when the minute rolls over are skipped, so numbers
+increase but are not gap-free. The first lease of a minute starts after the
+highest number already used by orders of that minute (legacy random numbers
+included). Past 9999 orders in one minute the suffix grows to 5 digits.
+"""
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+import threading
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+from app.db.session import engine
+from app.models.order import Order
+from app.models.sequence import SequenceCounter
+
+PREFIX = "ORD"
+SEQUENCE_PREFIX = "order_no:"
+LEASE_ATTEMPTS = 3
+
+def format_order_no(minute: str, number: int) -> str:
+    return f"{PREFIX}-{minute}-{number:04d}"
+
+def _last_used(conn, minute: str) -> int:
+    """Highest NNNN among existing orders of the minute (0 when none)."""
+    lower = f"{PREFIX}-{minute}-"
+    rows = conn.execute(
+        select(Order.order_no).where(Order.order_no >= lower, Order.order_no < f"{PREFIX}-{minute}.")
+    ).scalars()
+    numbers = [int(no[len(lower):]) for no in rows if no[len(lower):].isdigit()]
+    return max(numbers, default=0)
+
+class OrderNoAllocator:
+    def __init__(self, bind, block_size: int):
+        self.bind = bind
+        self.block_size = max(1, block_size)
+        self._lock = threading.Lock()
+        self._minute: Optional[str] = None
+        self._next = 0
+        self._end = 0 # Exclusive
+        self.leases = 0
+
+    def _lease(self, minute: str, size: int) -> Tuple[int, int]:
+        """Reserve [start, end) of the minute's counter in a transaction of its own."""
+        table = SequenceCounter.__table__
+        name = SEQUENCE_PREFIX + minute
+        for attempt in range(LEASE_ATTEMPTS):
+            try:
+                with self.bind.begin() as conn:
+                    result = conn.execute(
+                        update(table).where(table.c.name == name).values(next_value=table.c.next_value + size)
+                    )
+                    if result.rowcount:
+                        end = conn.execute(select(table.c.next_value).where(table.c.name == name)).scalar()
+                        return end - size, end
+
+                    start = _last_used(conn, minute) + 1
+                    conn.execute(insert(table).values(name=name, next_value=start + size))
+                    # Counters of earlier days can no longer be reached, even by a worker with a late clock
+                    yesterday = (datetime.strptime(minute, "%Y%m%d-%H%M") - timedelta(days=1)).strftime("%Y%m%d")
+                    conn.execute(delete(table).where(
+                        table.c.name >= SEQUENCE_PREFIX, table.c.name < SEQUENCE_PREFIX + yesterday
+                    ))
+                    return start, start + size
+            except IntegrityError:
+                # Another worker created the minute's counter first, lease from it
+                if attempt == LEASE_ATTEMPTS - 1:
+                    raise
+
+    def allocate(self, count: int = 1) -> List[str]:
+        """
+        `count` new order numbers, in increasing order. Leases run on their
+        own connection: on SQLite call this before the request's own writes,
+        which would otherwise hold the database lock.
+        """
+        numbers = []
+        with self._lock:
+            while len(numbers) < count:
+                minute = datetime.now().strftime("%Y%m%d-%H%M")
+                if minute != self._minute or self._next >= self._end:
+                    self._minute = minute
+                    self._next, self._end = self._lease(minute, max(self.block_size, count - len(numbers)))
+                    self.leases += 1
+                take = min(count - len(numbers), self._end - self._next)
+                numbers.extend(format_order_no(minute, n) for n in range(self._next, self._next + take))
+                self._next += take
+        return numbers
+
+allocator = OrderNoAllocator(engine, settings.ORDER_NO_BLOCK_SIZE)
+
+def next_order_no() -> str:
+    return allocator.allocate(1)[0]
+
+def allocate(count: int) -> List[str]:
+    return allocator.allocate(count)
@@ -0,0 +1,258 @@
+"""
+Daily rollups backing the analysis endpoints.
+
+Each fact (sales, payments, costs, clients, trials) is aggregated per day into
+its own table (see app.models.rollup). Write paths call `refresh()` with the
+dates they touched before committing; every affected day is re-aggregated from
+the source rows inside the same transaction, so a day is always either fully
+old or fully new. Refreshes lock the data version row first (see
+`analysis_cache.lock`), so two writes of the same day cannot each rewrite it
+without the other's rows. `rebuild()` recomputes everything and is exposed through
+`scripts/rebuild.py rollups`.
+"""
+from datetime import datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional
+import logging
+
+from sqlalchemy import event, func, select, delete, insert
+from sqlalchemy.orm import Session
+
+from app.models.order import Order
+from app.models.payment import PaymentRecord
+from app.models.cost import Cost
+from app.models.client import Client
+from app.db.dates import as_date, day_spans
+from app.services import analysis_cache, ledger
+from app.models.rollup import (
+    SalesDailyRollup, PaymentDailyRollup, CostDailyRollup, ClientDailyRollup, TrialDailyRollup
+)
+# Try import Plugin Model
+try:
+    from app.modules.plugins.commercial_kit.models import LicenseRecord
+except ImportError:
+    LicenseRecord = None
+
+logger = logging.getLogger(__name__)
+
+REBUILD_CHUNK_SIZE = 1000
+
+# --- Fact definitions ---
+# Each builder returns the aggregate select for source rows dated within
+# [lower, upper) (unbounded when None). Columns are labelled after the rollup
+# table columns, with the day as "day".
+
+def _in_range(stmt, column, lower, upper):
+    if lower is not None:
+        stmt = stmt.where(column >= lower)
+    if upper is not None:
+        stmt = stmt.where(column < upper)
+    return stmt
+
+def _sales_source(lower=None, upper=None):
+    day = func.date(Order.created_at)
+    stmt = select(
+        day.label("day"),
+        Order.order_type.label("order_type"),
+        Order.status.label("status"),
+        Client.type.label("client_type"),
+        func.count(Order.id).label("order_count"),
+        func.coalesce(func.sum(Order.amount), 0).label("amount")
+    ).outerjoin(Client, Client.id == Order.client_id)
+    stmt = _in_range(stmt, Order.created_at, lower, upper)
+    return stmt.group_by(day, Order.order_type, Order.status, Client.type)
+
+def _payment_source(lower=None, upper=None):
+    day = func.date(PaymentRecord.pay_time)
+    stmt = select(
+        day.label("day"),
+        Order.order_type.label("order_type"),
+        PaymentRecord.type.label("type"),
+        func.count(PaymentRecord.id).label("record_count"),
+        func.coalesce(func.sum(PaymentRecord.amount), 0).label("amount")
+    ).join(Order, Order.id == PaymentRecord.order_id)
+    stmt = _in_range(stmt, PaymentRecord.pay_time, lower, upper)
+    return stmt.group_by(day, Order.order_type, PaymentRecord.type)
+
+def _cost_source(lower=None, upper=None):
+    # Cost.pay_time is a DATE column, compare with dates
+    day = func.date(Cost.pay_time)
+    stmt = select(
+        day.label("day"),
+        Cost.category.label("category"),
+        func.count(Cost.id).label("record_count"),
+        func.coalesce(func.sum(Cost.amount), 0).label("amount")
+    )
+    stmt = _in_range(stmt, Cost.pay_time, as_date(lower), as_date(upper))
+    return stmt.group_by(day, Cost.category)
+
+def _client_source(lower=None, upper=None):
+    day = func.date(Client.created_at)
+    stmt = select(
+        day.label("day"),
+        Client.type.label("client_type"),
+        func.count(Client.id).label("new_count")
+    )
+    stmt = _in_range(stmt, Client.created_at, lower, upper)
+    return stmt.group_by(day, Client.type)
+
+def _trial_source(lower=None, upper=None):
+    # Licenses only carry the customer name; resolve the client type per
+    # license first so a duplicated client name cannot double count a trial.
+    client_type = select(Client.type).where(
+        Client.name == LicenseRecord.customer_name
+    ).limit(1).scalar_subquery()
+    per_license = select(
+        func.date(LicenseRecord.created_at).label("day"),
+        client_type.label("client_type")
+    )
+    per_license = _in_range(per_license, LicenseRecord.created_at, lower, upper).subquery()
+    return select(
+        per_license.c.day,
+        per_license.c.client_type,
+        func.count().label("trial_count")
+    ).group_by(per_license.c.day, per_license.c.client_type)
+
+FACTS = {
+    "sales": (SalesDailyRollup, _sales_source, Order),
+    "payments": (PaymentDailyRollup, _payment_source, PaymentRecord),
+    "costs": (CostDailyRollup, _cost_source, Cost),
+    "clients": (ClientDailyRollup, _client_source, Client),
+    "trials": (TrialDailyRollup, _trial_source, LicenseRecord),
+}
+
+def _rows_to_dicts(rows) -> List[Dict]:
+    result = []
+    for row in rows:
+        item = dict(row._mapping)
+        item["day"] = as_date(item["day"])
+        if item["day"] is None:
+            continue
+        result.append(item)
+    return result
+
+def refresh_days(conn, fact: str, values: Iterable) -> None:
+    """
+    Re-aggregate the given days of one fact, reading one range per span of
+    nearby days. `conn` may be a Session or a Connection (used from mapper events).
+    """
+    model, source, source_model = FACTS[fact]
+    if source_model is None:
+        return
+    days = {as_date(v) for v in values if v is not None}
+    if not days:
+        return
+
+    # Serialize with concurrent writes of the same days until commit
+    analysis_cache.lock(conn)
+    table = model.__table__
+    for first, last in day_spans(days):
+        lower = datetime.combine(first, time.min)
+        upper = datetime.combine(last + timedelta(days=1), time.min)
+        rows = [row for row in _rows_to_dicts(conn.execute(source(lower, upper)).all()) if row["day"] in days]
+        span_days = [day for day in days if first <= day <= last]
+
+        conn.execute(delete(table).where(table.c.day.in_(span_days)))
+        for i in range(0, len(rows), REBUILD_CHUNK_SIZE):
+            conn.execute(insert(table), rows[i:i + REBUILD_CHUNK_SIZE])
+
+def refresh(
+    db: Session,
+    *,
+    sales: Iterable = (),
+    payments: Iterable = (),
+    costs: Iterable = (),
+    clients: Iterable = (),
+    trials: Iterable = ()
+) -> None:
+    """
+    Refresh the rollup days touched by a write. Call after `db.flush()` and
+    before `db.commit()` so the refresh sees (and commits with) the change.
+    The receivables ledger follows the refreshed sales and payment days.
+    """
+    sales, payments = list(sales), list(payments)
+    refresh_days(db, "sales", sales)
+    refresh_days(db, "payments", payments)
+    refresh_days(db, "costs", costs)
+    refresh_days(db, "clients", clients)
+    refresh_days(db, "trials", trials)
+    ledger.refresh_days(db, sales + payments)
+
+# --- Lookup helpers for write paths ---
+
+def order_payment_days(db: Session, order_id: str) -> List[datetime]:
+    """Payment dates of an order (needed when its order_type changes)."""
+    rows = db.query(func.date(PaymentRecord.pay_time)).filter(PaymentRecord.order_id == order_id).distinct().all()
+    return [r[0] for r in rows]
+
+def client_order_days(db: Session, client_id: str) -> List[datetime]:
+    """Creation dates of a client's orders (needed when the client type changes)."""
+    rows = db.query(func.date(Order.created_at)).filter(Order.client_id == client_id).distinct().all()
+    return [r[0] for r in rows]
+
+def client_trial_days(db: Session, names: Iterable[str]) -> List[datetime]:
+    """Creation dates of licenses issued to the given customer names."""
+    names = [n for n in names if n]
+    if LicenseRecord is None or not names:
+        return []
+    rows = db.query(func.date(LicenseRecord.created_at)).filter(
+        LicenseRecord.customer_name.in_(names)
+    ).distinct().all()
+    return [r[0] for r in rows]
+
+# --- Full rebuild ---
+
+def rebuild_fact(db: Session, fact: str) -> int:
+    model, source, source_model = FACTS[fact]
+    table = model.__table__
+    db.execute(delete(table))
+    if source_model is None:
+        return 0
+
+    total = 0
+    result = db.execute(source().execution_options(yield_per=REBUILD_CHUNK_SIZE))
+    while True:
+        chunk = result.fetchmany(REBUILD_CHUNK_SIZE)
+        if not chunk:
+            break
+        rows = _rows_to_dicts(chunk)
+        if rows:
+            db.execute(insert(table), rows)
+        total += len(rows)
+    return total
+
+def rebuild(db: Session, facts: Optional[Iterable[str]] = None) -> Dict[str, int]:
+    """Rebuild the given facts (all by default) and commit. Returns row counts."""
+    counts = {}
+    for fact in (facts or FACTS.keys()):
+        counts[fact] = rebuild_fact(db, fact)
+        logger.info(f"Rollup '{fact}' rebuilt: {counts[fact]} rows")
+    # Running workers drop cached results and the columnar snapshot built from the old rows
+    analysis_cache.bump(db)
+    db.commit()
+    return counts
+
+def ensure_built(db: Session) -> None:
+    """
+    Rebuild facts whose rollup table is empty while the source table is not,
+    e.g. the first start after upgrading an existing database.
+    """
+    missing = []
+    for fact, (model, _, source_model) in FACTS.items():
+        if source_model is None:
+            continue
+        if db.query(model.id).first() is None and db.query(source_model.id).first() is not None:
+            missing.append(fact)
+    if missing:
+        logger.info(f"Building missing rollups: {missing}")
+        rebuild(db, missing)
+
+# --- Plugin write paths ---
+# Licenses are written by the commercial plugin, so keep their rollup current
+# from mapper events instead of touching plugin code.
+
+if LicenseRecord is not None:
+    @event.listens_for(LicenseRecord, "after_insert")
+    @event.listens_for(LicenseRecord, "after_delete")
+    def _license_changed(mapper, connection, target):
+        refresh_days(connection, "trials", [target.created_at or datetime.now()])
+        analysis_cache.bump(connection)
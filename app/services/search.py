@@ -0,0 +1,172 @@
+"""
+N-gram search index for the order and client list filters.
+
+Substring filters (`ILIKE '%x%'`) cannot use a B-tree index, so every search
+was a full table scan. Each indexed field value is split into its 1, 2 and 3
+character grams (see app.models.search); a search term then becomes:
+
+- up to 3 characters: one equality lookup on (field, gram)
+- longer: the ids holding a covering set of its trigrams, intersected with
+  GROUP BY / HAVING
+
+Grams shared by too many rows (SELECTIVE_POSTINGS) are left out of the
+intersection; when no selective gram is left the term matches a large share
+of the table and the plain scan, which stops at the page limit, is cheaper.
+
+The candidates are re-checked with the original ILIKE, so results are exactly
+the same as before. Grams are plain characters, which
+keeps Chinese names searchable on every backend without FTS tokenizers.
+
+Write paths call `refresh()` with the order/client ids they inserted or
+renamed before committing. `rebuild()` recomputes everything and is exposed
+through `scripts/rebuild.py search`.
+"""
+from typing import Iterable, List, Set
+import logging
+
+from sqlalchemy import and_, delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from app.models.client import Client
+from app.models.order import Order
+from app.models.search import SearchGram
+
+logger = logging.getLogger(__name__)
+
+MAX_GRAM = 3
+# Grams with more postings than this are skipped when matching, see contains()
+SELECTIVE_POSTINGS = 5000
+REBUILD_CHUNK_SIZE = 1000
+
+# field name -> indexed column; the name prefix is the entity
+FIELDS = {
+    "order.client_name": Order.client_name,
+    "order.order_no": Order.order_no,
+    "client.name": Client.name,
+    "client.phone": Client.phone,
+}
+ENTITIES = {"order": Order, "client": Client}
+
+def _entity_fields(entity: str) -> List[str]:
+    return [field for field in FIELDS if field.split(".", 1)[0] == entity]
+
+def normalize(value) -> str:
+    return str(value).lower()
+
+def grams(value) -> Set[str]:
+    """All 1..MAX_GRAM character grams of a field value."""
+    if value is None:
+        return set()
+    text = normalize(value)
+    return {
+        text[i:i + n]
+        for i in range(len(text))
+        for n in range(1, MAX_GRAM + 1)
+        if i + n <= len(text)
+    }
+
+def _query_grams(text: str) -> List[str]:
+    """Grams a match must contain: the term itself when short, else trigrams covering it."""
+    if len(text) <= MAX_GRAM:
+        return [text]
+    starts = list(range(0, len(text) - MAX_GRAM + 1, MAX_GRAM))
+    if starts[-1] != len(text) - MAX_GRAM:
+        starts.append(len(text) - MAX_GRAM)
+    return sorted({text[i:i + MAX_GRAM] for i in starts})
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _is_selective(db, field: str, gram: str) -> bool:
+    """Whether `gram` has at most SELECTIVE_POSTINGS postings; reads no more than that."""
+    table = SearchGram.__table__
+    capped = select(table.c.ref_id).where(
+        table.c.field == field, table.c.gram == gram
+    ).limit(SELECTIVE_POSTINGS + 1).subquery()
+    return db.scalar(select(func.count()).select_from(capped)) <= SELECTIVE_POSTINGS
+
+def contains(db, field: str, term: str):
+    """
+    Case-insensitive substring predicate on an indexed field, e.g.
+    `query.filter(search.contains(db, "order.client_name", client_name))`.
+    """
+    column = FIELDS[field]
+    pattern = column.ilike(f"%{_escape_like(term)}%", escape="\\")
+    keys = [key for key in _query_grams(normalize(term)) if _is_selective(db, field, key)]
+    if not keys:
+        # Every gram is very common, so the term matches a large share of the
+        # rows and a paged scan stops early; intersecting would cost more
+        return pattern
+    table = SearchGram.__table__
+    candidates = select(table.c.ref_id).where(table.c.field == field, table.c.gram.in_(keys))
+    if len(keys) > 1:
+        candidates = candidates.group_by(table.c.ref_id).having(func.count() == len(keys))
+    return and_(column.class_.id.in_(candidates), pattern)
+
+# --- Maintenance ---
+
+def _postings(entity: str, rows) -> List[dict]:
+    fields = _entity_fields(entity)
+    postings = []
+    for row in rows:
+        for field in fields:
+            value = getattr(row, FIELDS[field].key)
+            postings.extend({"field": field, "gram": gram, "ref_id": row.id} for gram in grams(value))
+    return postings
+
+def _insert(conn, postings: List[dict]) -> None:
+    table = SearchGram.__table__
+    for i in range(0, len(postings), REBUILD_CHUNK_SIZE):
+        conn.execute(insert(table), postings[i:i + REBUILD_CHUNK_SIZE])
+
+def _select_rows(entity: str):
+    model = ENTITIES[entity]
+    return select(model.id, *[FIELDS[field] for field in _entity_fields(entity)])
+
+def refresh(conn, orders: Iterable[str] = (), clients: Iterable[str] = ()) -> None:
+    """
+    Re-index the given order/client ids from their current rows (ids that no
+    longer exist are dropped). `conn` may be a Session or a Connection.
+    """
+    table = SearchGram.__table__
+    for entity, ids in (("order", orders), ("client", clients)):
+        ids = [i for i in set(ids) if i]
+        if not ids:
+            continue
+        model = ENTITIES[entity]
+        conn.execute(delete(table).where(
+            table.c.ref_id.in_(ids), table.c.field.in_(_entity_fields(entity))
+        ))
+        rows = conn.execute(_select_rows(entity).where(model.id.in_(ids))).all()
+        _insert(conn, _postings(entity, rows))
+
+def rebuild(db: Session) -> int:
+    """Re-index every order and client, and commit. Returns posting count."""
+    table = SearchGram.__table__
+    db.execute(delete(table))
+    total = 0
+    for entity, model in ENTITIES.items():
+        # Walk by id instead of streaming, the same connection keeps inserting
+        last_id = None
+        while True:
+            stmt = _select_rows(entity).order_by(model.id).limit(REBUILD_CHUNK_SIZE)
+            if last_id is not None:
+                stmt = stmt.where(model.id > last_id)
+            rows = db.execute(stmt).all()
+            if not rows:
+                break
+            postings = _postings(entity, rows)
+            _insert(db, postings)
+            total += len(postings)
+            last_id = rows[-1].id
+    db.commit()
+    logger.info(f"Search index rebuilt: {total} postings")
+    return total
+
+def ensure_built(db: Session) -> None:
+    """Build the index on the first start after upgrading an existing database."""
+    if db.query(SearchGram.ref_id).first() is not None:
+        return
+    if db.query(Order.id).first() is not None or db.query(Client.id).first() is not None:
+        logger.info("Building search index")
+        rebuild(db)
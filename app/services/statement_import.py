@@ -0,0 +1,270 @@
+"""
+Bank / WeChat / Alipay statement import.
+
+The CSV is read as a stream and posted in batches of BATCH_SIZE lines, one
+transaction per batch:
+
+1. lines are parsed (header row detected by its column names, preamble
+   lines before it are skipped)
+2. the orders and existing payment records referenced by the batch are
+   loaded with a few IN queries into dicts keyed by external_transaction_no,
+   order_no and transaction_id
+3. each line is matched in memory: transaction id first, then order number
+   (column, or an ORD-... number found in the remark)
+4. payment records are inserted with one executemany, each affected order's
+   counters move once (app.services.order_balance), and rollups are
+   refreshed once for the batch
+
+Every line gets a report entry: matched, duplicate (transaction id already
+imported), unmatched, rejected (void order, refund above the paid amount)
+or invalid (unparseable).
+"""
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Iterable, Iterator, List, Optional
+import re
+import uuid
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from app.models.order import Order
+from app.models.payment import PaymentRecord
+from app.services import analysis_cache, client_stats, columnar, order_balance, rollup
+from app.services.csv_import import data_rows, parse_amount, parse_time
+
+BATCH_SIZE = 500
+LOOKUP_CHUNK_SIZE = 500
+
+# Statement column -> accepted header names (compared lowercased, spaces removed)
+COLUMN_ALIASES = {
+    "amount": ("amount", "金额", "金额(元)", "金额（元）", "交易金额", "收入金额"),
+    "direction": ("direction", "收/支", "收支", "收支方向"),
+    "type": ("type", "类型"),
+    "pay_time": ("pay_time", "time", "交易时间", "交易创建时间", "付款时间", "记账日期", "日期"),
+    "transaction_id": ("transaction_id", "external_transaction_no", "交易单号", "交易号", "交易流水号", "流水号"),
+    "order_no": ("order_no", "订单号", "商户单号", "商户订单号"),
+    "remark": ("remark", "备注", "摘要", "商品", "商品名称", "附言", "用途"),
+}
+INCOME_WORDS = ("收入", "收款", "income", "in", "1")
+OUTGO_WORDS = ("支出", "退款", "expense", "out", "2")
+ORDER_NO_PATTERN = re.compile(r"ORD-\d{8}-\d{4}-\d{4,}")
+
+@dataclass
+class StatementLine:
+    line: int
+    status: str = "invalid"
+    amount: Optional[Decimal] = None
+    type: int = order_balance.COLLECTION
+    pay_time: Optional[datetime] = None
+    transaction_id: Optional[str] = None
+    order_nos: List[str] = field(default_factory=list)
+    remark: Optional[str] = None
+    order_id: Optional[str] = None # Matched order
+    order_no: Optional[str] = None
+    payment_id: Optional[str] = None
+    message: Optional[str] = None
+
+    def report(self) -> dict:
+        return {
+            "line": self.line,
+            "status": self.status,
+            "amount": self.amount,
+            "type": self.type,
+            "transaction_id": self.transaction_id,
+            "order_no": self.order_no or (self.order_nos[0] if self.order_nos else None),
+            "payment_id": self.payment_id,
+            "message": self.message,
+        }
+
+# --- Parsing ---
+
+def parse_statement(rows: Iterable[List[str]]) -> Iterator[StatementLine]:
+    """Yield a StatementLine per data row. Raises ValueError when no header row is found."""
+    for number, cells in data_rows(rows, COLUMN_ALIASES, ("amount",)):
+        line = StatementLine(line=number, transaction_id=cells.get("transaction_id") or None, remark=cells.get("remark") or None)
+        try:
+            amount = parse_amount(cells["amount"])
+            direction = (cells.get("direction") or cells.get("type") or "").lower()
+            if direction in OUTGO_WORDS or amount < 0:
+                line.type = order_balance.REFUND
+            elif direction and direction not in INCOME_WORDS:
+                raise ValueError(f"无法识别的收支方向: {direction}")
+            line.amount = abs(amount)
+            if not line.amount:
+                raise ValueError("金额为 0")
+            line.pay_time = parse_time(cells["pay_time"]) if cells.get("pay_time") else datetime.now()
+        except ValueError as e:
+            line.message = str(e)
+            yield line
+            continue
+
+        order_no = cells.get("order_no", "")
+        if order_no:
+            line.order_nos.append(order_no)
+        for text in (order_no, line.remark or ""):
+            line.order_nos.extend(no for no in ORDER_NO_PATTERN.findall(text) if no not in line.order_nos)
+        line.status = "pending"
+        yield line
+
+# --- Posting ---
+
+def _chunks(values: List[str]) -> Iterator[List[str]]:
+    for i in range(0, len(values), LOOKUP_CHUNK_SIZE):
+        yield values[i:i + LOOKUP_CHUNK_SIZE]
+
+def _load_orders(db: Session, transaction_ids: List[str], order_nos: List[str]):
+    """Orders referenced by the batch, as (by external_transaction_no, by order_no). Rows are locked where supported."""
+    by_transaction, by_no = {}, {}
+    for ids in _chunks(transaction_ids):
+        for order in db.query(Order).filter(Order.external_transaction_no.in_(ids)).with_for_update():
+            by_transaction[order.external_transaction_no] = order
+    for nos in _chunks(order_nos):
+        for order in db.query(Order).filter(Order.order_no.in_(nos)).with_for_update():
+            by_no[order.order_no] = order
+    return by_transaction, by_no
+
+def _imported_transactions(db: Session, transaction_ids: List[str]) -> set:
+    imported = set()
+    for ids in _chunks(transaction_ids):
+        imported.update(db.execute(
+            select(PaymentRecord.transaction_id).where(PaymentRecord.transaction_id.in_(ids))
+        ).scalars())
+    return imported
+
+def _post_batch(db: Session, lines: List[StatementLine], pay_method: str, seen_transactions: set, creator_id: Optional[str]) -> bool:
+    """Match and post one batch without committing. Returns whether anything was posted."""
+    pending = [line for line in lines if line.status == "pending"]
+    if not pending:
+        return False
+    transaction_ids = sorted({line.transaction_id for line in pending if line.transaction_id})
+    order_nos = sorted({no for line in pending for no in line.order_nos})
+    by_transaction, by_no = _load_orders(db, transaction_ids, order_nos)
+    imported = _imported_transactions(db, transaction_ids)
+
+    # Match in file order, tracking each order's running net paid for the refund check
+    running: Dict[str, Decimal] = {}
+    required: Dict[str, Decimal] = {}
+    deltas = defaultdict(lambda: [order_balance.ZERO, order_balance.ZERO, 0])
+    records, matched_orders = [], {}
+    for line in pending:
+        if line.transaction_id and (line.transaction_id in imported or line.transaction_id in seen_transactions):
+            line.status, line.message = "duplicate", "该交易单号已导入"
+            continue
+        order = by_transaction.get(line.transaction_id) if line.transaction_id else None
+        if order is None:
+            order = next((by_no[no] for no in line.order_nos if no in by_no), None)
+        if order is None:
+            line.status, line.message = "unmatched", "未找到对应订单"
+            continue
+        line.order_id, line.order_no = order.id, order.order_no
+        if order.status == "VOID":
+            line.status, line.message = "rejected", "订单已作废"
+            continue
+
+        start = order_balance._decimal(order.total_paid)
+        net = running.get(order.id, start)
+        if line.type == order_balance.REFUND:
+            if net < line.amount:
+                line.status, line.message = "rejected", "退款金额不能大于已收金额"
+                continue
+            # Lowest starting total_paid for which this refund still passes
+            need = line.amount + start - net
+            required[order.id] = max(required.get(order.id, need), need)
+
+        paid_delta, refunded_delta, count_delta = order_balance.payment_deltas(line.type, line.amount)
+        running[order.id] = net + paid_delta
+        totals = deltas[order.id]
+        totals[0] += paid_delta
+        totals[1] += refunded_delta
+        totals[2] += count_delta
+
+        line.status, line.payment_id = "matched", str(uuid.uuid4())
+        if line.transaction_id:
+            seen_transactions.add(line.transaction_id)
+        matched_orders[order.id] = order
+        records.append({
+            "id": line.payment_id,
+            "order_id": order.id,
+            "amount": line.amount,
+            "type": line.type,
+            "pay_method": pay_method,
+            "transaction_id": line.transaction_id,
+            "pay_time": line.pay_time,
+            "remark": line.remark,
+            "creator_id": creator_id,
+        })
+
+    if not records:
+        return False
+    db.execute(insert(PaymentRecord.__table__), records)
+    for order_id, (paid_delta, refunded_delta, count_delta) in deltas.items():
+        order = matched_orders[order_id]
+        if not order_balance.apply_deltas(db, order, paid_delta, refunded_delta, count_delta, min_paid=required.get(order_id)):
+            raise ConcurrentPaymentError(order.order_no)
+
+    rollup.refresh(
+        db,
+        sales=[order.created_at for order in matched_orders.values()],
+        payments=[record["pay_time"] for record in records]
+    )
+    client_stats.refresh(db, {order.client_id for order in matched_orders.values()})
+    return True
+
+class ConcurrentPaymentError(Exception):
+    """An order's paid amount changed between loading and posting the batch."""
+
+def import_statement(db: Session, rows: Iterable[List[str]], pay_method: str, creator_id: Optional[str] = None) -> dict:
+    """
+    Post a statement given as CSV rows. Commits once per batch; a batch that
+    hits a concurrent change on one of its orders is rolled back and its lines
+    are reported as rejected (re-importing the file posts them, the rest are
+    recognized as duplicates by transaction id).
+    """
+    report: List[dict] = []
+    counts = defaultdict(int)
+    seen_transactions: set = set()
+
+    def flush(batch: List[StatementLine]) -> None:
+        seen_before = set(seen_transactions)
+        try:
+            if _post_batch(db, batch, pay_method, seen_transactions, creator_id):
+                version = analysis_cache.bump(db)
+                db.commit()
+                posted = [line for line in batch if line.status == "matched"]
+                columnar.apply_changes(
+                    db, version,
+                    orders=list({line.order_id for line in posted}),
+                    payments=[line.payment_id for line in posted]
+                )
+        except ConcurrentPaymentError as e:
+            db.rollback()
+            seen_transactions.intersection_update(seen_before)
+            for line in batch:
+                if line.status == "matched":
+                    line.status, line.payment_id = "rejected", None
+                    line.message = f"订单 {e} 的收款在导入期间被修改，请重新导入"
+        for line in batch:
+            counts[line.status] += 1
+            report.append(line.report())
+
+    batch: List[StatementLine] = []
+    for line in parse_statement(rows):
+        batch.append(line)
+        if len(batch) >= BATCH_SIZE:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    return {
+        "total": len(report),
+        "matched": counts["matched"],
+        "duplicate": counts["duplicate"],
+        "unmatched": counts["unmatched"],
+        "rejected": counts["rejected"],
+        "invalid": counts["invalid"],
+        "lines": report,
+    }
@@ -0,0 +1,214 @@
+"""
+Downscaled previews of uploaded images and PDFs.
+
+After an upload, `submit()` queues the file to a per-worker process pool
+(THUMBNAIL_WORKERS processes) that writes one JPEG per THUMBNAIL_SIZES entry
+next to the original: `<name>.<size>.jpg`, the longest edge at most `size`
+pixels. PDFs get a preview of their first page. Lists then load
+`/uploads/...?size=200` instead of the full file (see app.api.upload_files).
+
+Rendering needs Pillow, and PyMuPDF for PDF previews (`pip install Pillow
+PyMuPDF`); without them nothing is generated and `?size=` serves the
+original. Files uploaded earlier get their previews from
+`scripts/rebuild.py thumbnails`.
+"""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, List, Optional, Sequence, Tuple
+import logging
+import multiprocessing
+import os
+import re
+import threading
+
+from app.core.config import settings
+from app.services import uploads
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    import pymupdf as fitz
+except ImportError:
+    try:
+        import fitz # PyMuPDF < 1.24.3
+    except ImportError:
+        fitz = None
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp")
+MAX_PENDING = 64 # Queued renders, past that new uploads are left to the backfill
+PDF_RENDER_DPI = 72
+THUMBNAIL_PATTERN = re.compile(r"\.\d+\.jpg$")
+
+def path_for(original: str, size: int) -> str:
+    return f"{original}.{size}.jpg"
+
+def is_thumbnail(name: str) -> bool:
+    return bool(THUMBNAIL_PATTERN.search(name))
+
+def supported(name: str) -> bool:
+    ext = os.path.splitext(name)[1].lower()
+    if ext in IMAGE_EXTENSIONS:
+        return Image is not None
+    return ext == ".pdf" and Image is not None and fitz is not None
+
+def missing_sizes(original: str, sizes: Sequence[int]) -> List[int]:
+    return [size for size in sizes if not os.path.exists(path_for(original, size))]
+
+# --- Rendering (runs in the pool processes) ---
+
+def _open(original: str, size: int):
+    if original.lower().endswith(".pdf"):
+        with fitz.open(original) as document:
+            pixmap = document[0].get_pixmap(dpi=PDF_RENDER_DPI)
+            return Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+    image = Image.open(original)
+    image.draft("RGB", (size, size)) # JPEG: decode at a reduced scale
+    return image
+
+def render(original: str, sizes: Sequence[int]) -> int:
+    """Write the missing previews of one file. Returns how many were written."""
+    sizes = missing_sizes(original, sizes)
+    if not sizes:
+        return 0
+    with _open(original, max(sizes)) as image:
+        if image.mode in ("RGBA", "LA", "P"):
+            # Transparent areas on white, JPEG has no alpha
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        for size in sorted(sizes, reverse=True):
+            preview = image.copy()
+            preview.thumbnail((size, size))
+            target = path_for(original, size)
+            tmp = f"{target}.{os.getpid()}.part"
+            try:
+                preview.save(tmp, "JPEG", quality=80, optimize=True)
+                os.replace(tmp, target)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+    return len(sizes)
+
+# --- Pool ---
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+_pending = threading.BoundedSemaphore(MAX_PENDING)
+_queued = set() # Originals being rendered, guarded by _executor_lock
+
+def _new_executor(workers: int) -> ProcessPoolExecutor:
+    # spawn: the web worker has threads and open connections that must not be forked
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = _new_executor(settings.THUMBNAIL_WORKERS)
+        return _executor
+
+def _drop_executor(executor: ProcessPoolExecutor) -> None:
+    """Forget a broken pool (a worker died), the next submit starts a new one."""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+def _done(future, executor: ProcessPoolExecutor, original: str) -> None:
+    with _executor_lock:
+        _queued.discard(original)
+    _pending.release()
+    error = future.exception()
+    if isinstance(error, BrokenProcessPool):
+        _drop_executor(executor)
+    if error is not None:
+        logger.warning(f"Thumbnail generation failed for {original}: {error}")
+
+def submit(original: Optional[str]) -> bool:
+    """
+    Queue the previews of a stored file. Returns False when there is nothing
+    to render (previews themselves get none), it is already queued or the
+    queue is full.
+    """
+    if not original or is_thumbnail(original) or not supported(original):
+        return False
+    if not missing_sizes(original, settings.THUMBNAIL_SIZES):
+        return False
+    with _executor_lock:
+        if original in _queued:
+            return False
+        _queued.add(original)
+    if not _pending.acquire(blocking=False):
+        with _executor_lock:
+            _queued.discard(original)
+        return False
+    executor = _get_executor()
+    try:
+        future = executor.submit(render, original, tuple(settings.THUMBNAIL_SIZES))
+    except Exception as e:
+        with _executor_lock:
+            _queued.discard(original)
+        _pending.release()
+        if isinstance(e, BrokenProcessPool):
+            _drop_executor(executor) # Queued again on the next request for the preview
+        else:
+            logger.warning(f"Cannot queue thumbnail generation: {e}")
+        return False
+    future.add_done_callback(lambda f: _done(f, executor, original))
+    return True
+
+# --- Backfill ---
+
+def _originals(root: str) -> Iterator[str]:
+    for directory, subdirectories, names in os.walk(root):
+        subdirectories[:] = [name for name in subdirectories if not name.startswith(".")]
+        for name in names:
+            if not name.startswith(".") and not is_thumbnail(name) and supported(name):
+                yield os.path.join(directory, name)
+
+def backfill(workers: Optional[int] = None) -> Tuple[int, int, int]:
+    """
+    Generate the missing previews of every stored file, at most a few renders
+    in flight per process. Returns (files rendered, previews written, failures).
+    """
+    if Image is None:
+        raise RuntimeError("Pillow is not installed")
+    sizes = tuple(settings.THUMBNAIL_SIZES)
+    workers = workers or settings.THUMBNAIL_WORKERS
+    files = written = failed = 0
+    in_flight = {}
+
+    def collect(done) -> None:
+        nonlocal files, written, failed
+        for future in done:
+            original = in_flight.pop(future)
+            try:
+                count = future.result()
+            except Exception as e:
+                failed += 1
+                logger.warning(f"Thumbnail generation failed for {original}: {e}")
+                continue
+            if count:
+                files += 1
+                written += count
+
+    with _new_executor(workers) as executor:
+        for original in _originals(uploads.upload_dir()):
+            if not missing_sizes(original, sizes):
+                continue
+            if len(in_flight) >= workers * 4:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            in_flight[executor.submit(render, original, sizes)] = original
+        collect(wait(in_flight).done)
+    return files, written, failed
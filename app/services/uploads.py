@@ -0,0 +1,171 @@
+"""
+Uploaded files.
+
+Files are stored content-addressed: the name is the SHA-256 of the content
+plus the extension, so an invoice or contract uploaded twice is stored once
+and both records point to the same URL. Files are sharded by the first two
+character pairs of their name (`ab/cd/abcd....png`), so no directory grows
+past a few thousand entries.
+
+`UploadWriter` receives the content in chunks (hashing, size and type checks
+as it goes) into a temporary file in UPLOAD_DIR, then moves it to its final
+path, or drops it when that file already exists. Its methods block, async
+callers run them in a thread.
+
+`local_path` maps the public `/uploads/...` URLs stored on records
+(Cost.invoice_url, Order.attachments) back to files under UPLOAD_DIR. Flat
+URLs from before the sharded layout (`/uploads/<uuid>.png`) keep resolving
+once `scripts/migrate_uploads.py` has moved their files into shards.
+"""
+from typing import NamedTuple, Optional
+import hashlib
+import os
+import tempfile
+
+from app.core.config import settings
+
+URL_PREFIX = "/uploads/"
+SNIFF_BYTES = 16
+
+# Extension fallback for files uploaded without one
+MIME_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+    "application/pdf": ".pdf",
+}
+
+# Leading bytes of binary types, a renamed executable is not accepted as a .png
+SIGNATURES = {
+    ".png": (b"\x89PNG\r\n\x1a\n",),
+    ".jpg": (b"\xff\xd8\xff",),
+    ".jpeg": (b"\xff\xd8\xff",),
+    ".gif": (b"GIF87a", b"GIF89a"),
+    ".webp": (b"RIFF",),
+    ".pdf": (b"%PDF-",),
+}
+
+class UploadRejected(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+class StoredFile(NamedTuple):
+    name: str
+    url: str
+    ext: str
+    size: int
+    sha256: str
+    created: bool # False when identical content was already stored
+
+def upload_dir() -> str:
+    return os.path.abspath(settings.UPLOAD_DIR)
+
+def shard_path(name: str) -> str:
+    """Relative path of a stored name in the sharded layout: ab/cd/<name>."""
+    if len(name) < 4:
+        return name
+    return "/".join((name[:2], name[2:4], name))
+
+def url_for(name: str) -> str:
+    return URL_PREFIX + shard_path(name)
+
+def extension(filename: Optional[str], content_type: Optional[str]) -> str:
+    """Checked extension of an upload. Raises UploadRejected (415) for types not allowed."""
+    ext = os.path.splitext(filename or "")[1].lower() or MIME_EXTENSIONS.get(content_type or "", "")
+    if ext not in settings.UPLOAD_ALLOWED_EXTENSIONS:
+        raise UploadRejected(415, f"File type not allowed: {ext or content_type or 'unknown'}")
+    return ext
+
+class UploadWriter:
+    def __init__(self, ext: str, max_bytes: Optional[int] = None):
+        self.ext = ext
+        self.max_bytes = max_bytes if max_bytes is not None else settings.UPLOAD_MAX_BYTES
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._head = b""
+        root = upload_dir()
+        os.makedirs(root, exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(dir=root, prefix=".upload-", suffix=".part")
+        self._file = os.fdopen(fd, "wb")
+
+    def _sniff(self) -> None:
+        signatures = SIGNATURES.get(self.ext)
+        if signatures and not self._head.startswith(signatures):
+            raise UploadRejected(415, f"File content does not match its type {self.ext}")
+
+    def write(self, data: bytes) -> None:
+        if not data:
+            return
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadRejected(413, f"File too large, the limit is {self.max_bytes // (1024 * 1024)} MB")
+        if len(self._head) < SNIFF_BYTES:
+            self._head += data[:SNIFF_BYTES - len(self._head)]
+            if len(self._head) >= SNIFF_BYTES:
+                self._sniff()
+        self._hash.update(data)
+        self._file.write(data)
+
+    def finish(self) -> StoredFile:
+        """Move the content to its content-addressed name and return it."""
+        self._file.close()
+        try:
+            if not self.size:
+                raise UploadRejected(400, "Empty file")
+            self._sniff()
+            digest = self._hash.hexdigest()
+            name = digest + self.ext
+            path = os.path.join(upload_dir(), shard_path(name))
+            if os.path.exists(path):
+                os.remove(self._tmp_path)
+                return StoredFile(name, url_for(name), self.ext, self.size, digest, False)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Atomic; two concurrent uploads of the same content write the same bytes
+            os.replace(self._tmp_path, path)
+            return StoredFile(name, url_for(name), self.ext, self.size, digest, True)
+        except BaseException:
+            self.abort()
+            raise
+
+    def abort(self) -> None:
+        """Drop the partial file."""
+        self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except FileNotFoundError:
+            pass
+
+def _file_in(root: str, relative: str) -> Optional[str]:
+    path = os.path.realpath(os.path.join(root, relative))
+    # Refuse anything resolving outside the upload directory ("../")
+    if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+        return None
+    return path
+
+def resolve(relative: str) -> Optional[str]:
+    """Path of a file given relative to UPLOAD_DIR, flat names also found in their shard."""
+    root = upload_dir()
+    path = _file_in(root, relative)
+    if path is None and relative and "/" not in relative:
+        path = _file_in(root, shard_path(relative))
+    return path
+
+def local_path(url: Optional[str]) -> Optional[str]:
+    """Path of the file behind an upload URL, None when it is not one or does not exist."""
+    if not url or not url.startswith(URL_PREFIX):
+        return None
+    return resolve(url[len(URL_PREFIX):])
+
+def sharded_url(url: Optional[str]) -> Optional[str]:
+    """The sharded URL of a flat upload URL whose file now lives in its shard, else None."""
+    if not url or not url.startswith(URL_PREFIX):
+        return None
+    name = url[len(URL_PREFIX):]
+    if not name or "/" in name or shard_path(name) == name:
+        return None
+    if _file_in(upload_dir(), shard_path(name)) is None:
+        return None
+    return url_for(name)
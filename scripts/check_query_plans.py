@@ -0,0 +1,138 @@
+"""
+检查热点查询的执行计划: 对订单/客户/支出/分析接口实际使用的查询运行 EXPLAIN，
+任何一个退化为全表扫描时以非 0 退出。
+
+用法: python scripts/check_query_plans.py [-v]
+
+支持 SQLite (EXPLAIN QUERY PLAN)、MySQL 和 PostgreSQL (EXPLAIN)。MySQL 和
+PostgreSQL 会按数据量选择计划，数据很少的表走全表扫描是正常的，请在有真实数据的库上运行。
+"""
+import sys
+import os
+import argparse
+import re
+from datetime import date, datetime, timedelta
+
+# 将后端目录添加到 sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from sqlmodel import select
+
+from app.api.v1.endpoints.cost import cost_stats_query
+from app.db.session import engine
+from app.db.base import Base
+from app.db.dates import day_range
+from app.models.client import Client, ClientIdentity, FollowUp
+from app.models.cost import Cost
+from app.models.order import Order
+from app.models.payment import PaymentRecord
+from app.models.rollup import SalesDailyRollup, PaymentDailyRollup, CostDailyRollup
+
+class Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+@compiles(Explain)
+def _compile_explain(element, compiler, **kw):
+    prefix = "EXPLAIN QUERY PLAN " if compiler.dialect.name == "sqlite" else "EXPLAIN "
+    return prefix + compiler.process(element.statement, **kw)
+
+def hot_queries():
+    """(name, statement) of the filters the list/stats/analysis endpoints run."""
+    now = datetime.now()
+    month_start = datetime(now.year, now.month, 1)
+    year_start, year_end = date(now.year, 1, 1), date(now.year, 12, 31)
+    some_id = "00000000-0000-0000-0000-000000000000"
+
+    order_page = select(Order).order_by(Order.created_at.desc(), Order.id.desc()).limit(20)
+    client_page = select(Client).order_by(Client.created_at.desc(), Client.id.desc()).limit(20)
+    cost_page = select(Cost).order_by(Cost.pay_time.desc(), Cost.id.desc()).limit(20)
+    return [
+        # order.py
+        ("orders.list", order_page),
+        ("orders.list.status", order_page.where(Order.status == "PAID")),
+        ("orders.list.creator", order_page.where(Order.creator_id == some_id)),
+        ("orders.by_no", select(Order).where(Order.order_no == "ORD-20240101-0000-0001")),
+        ("orders.stats.month_count", select(func.count(Order.id)).where(Order.created_at >= month_start)),
+        ("orders.stats.month_collection", select(func.sum(PaymentRecord.amount)).where(
+            PaymentRecord.type == 1, PaymentRecord.pay_time >= month_start
+        )),
+        ("orders.payments", select(PaymentRecord).where(PaymentRecord.order_id == some_id).order_by(PaymentRecord.pay_time.desc())),
+        ("orders.sales_by_type", select(func.sum(Order.amount)).where(
+            Order.order_type == "NEW", *day_range(Order.created_at, year_start, year_end)
+        )),
+        # client.py
+        ("clients.list", client_page),
+        ("clients.list.status", client_page.where(Client.status == 2)),
+        ("clients.list.creator", client_page.where(Client.creator_id == some_id)),
+        ("clients.duplicates", select(ClientIdentity.kind, ClientIdentity.client_id).where(or_(
+            and_(ClientIdentity.kind == "enterprise_name", ClientIdentity.value.in_(["x"])),
+            and_(ClientIdentity.kind == "phone", ClientIdentity.value.in_(["13800000000"])),
+            and_(ClientIdentity.kind == "wechat", ClientIdentity.value.in_(["x"]))
+        ))),
+        ("clients.followups", select(FollowUp).where(FollowUp.client_id == some_id).order_by(FollowUp.created_at.desc())),
+        # cost.py
+        ("costs.list", cost_page),
+        ("costs.list.range", cost_page.where(*day_range(Cost.pay_time, year_start, year_end))),
+        ("costs.list.creator", cost_page.where(Cost.creator_id == some_id)),
+        ("costs.stats", cost_stats_query(now.year, now.month)),
+        ("costs.stats.creator", cost_stats_query(now.year, now.month, some_id)),
+        # analysis.py
+        ("analysis.deal_clients", select(func.count(func.distinct(Order.client_id))).where(
+            Order.status == "PAID", *day_range(Order.pay_time, year_start, year_end)
+        )),
+        ("analysis.sales_trend", select(SalesDailyRollup.day, func.sum(SalesDailyRollup.amount)).where(
+            *day_range(SalesDailyRollup.day, year_start, year_end)
+        ).group_by(SalesDailyRollup.day)),
+        ("analysis.payment_trend", select(PaymentDailyRollup.day, func.sum(PaymentDailyRollup.amount)).where(
+            *day_range(PaymentDailyRollup.day, year_start - timedelta(days=365), year_end)
+        ).group_by(PaymentDailyRollup.day)),
+        ("analysis.cost_trend", select(CostDailyRollup.day, func.sum(CostDailyRollup.amount)).where(
+            *day_range(CostDailyRollup.day, year_start, year_end)
+        ).group_by(CostDailyRollup.day)),
+    ]
+
+def full_scans(conn, statement):
+    """(plan lines, tables read with a full scan)."""
+    tables = set(Base.metadata.tables)
+    rows = conn.execute(Explain(statement)).mappings().all()
+    if engine.dialect.name == "sqlite":
+        lines = [row["detail"] for row in rows]
+        # "SCAN t" reads the whole table; "SCAN t USING [COVERING] INDEX i" walks an index in order
+        scanned = [m.group(1) for m in (re.match(r"SCAN (?:TABLE )?(\w+)$", line) for line in lines) if m]
+    elif engine.dialect.name == "mysql":
+        lines = [f"{row['table']}: type={row['type']} key={row['key']}" for row in rows]
+        scanned = [row["table"] for row in rows if row["type"] == "ALL"]
+    else:
+        lines = [list(row.values())[0] for row in rows]
+        scanned = [m.group(1) for m in (re.search(r"Seq Scan on (\w+)", line) for line in lines) if m]
+    return lines, [table for table in scanned if table in tables]
+
+def main():
+    parser = argparse.ArgumentParser(description="检查热点查询是否走索引")
+    parser.add_argument("-v", "--verbose", action="store_true", help="打印每个查询的执行计划")
+    args = parser.parse_args()
+
+    failed = []
+    with engine.connect() as conn:
+        for name, statement in hot_queries():
+            lines, scanned = full_scans(conn, statement)
+            if scanned:
+                failed.append(name)
+            print(f"{'全表扫描' if scanned else 'OK':<8} {name}" + (f"  ({', '.join(scanned)})" if scanned else ""))
+            if args.verbose or scanned:
+                for line in lines:
+                    print(f"           {line}")
+    if failed:
+        print(f"{len(failed)} 个查询退化为全表扫描: {failed}")
+        return 1
+    print("全部热点查询均使用索引！")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+把上传目录从平铺结构迁移到分片结构 (ab/cd/<文件名>)，并批量改写
+Cost.invoice_url 和 Order.attachments 中的旧链接。
+
+用法: python scripts/migrate_uploads.py [--dry-run] [--batch-size N]
+
+1. 上传目录根下的文件按文件名前缀移入分片子目录
+2. 指向已迁移文件的 /uploads/<文件名> 链接按批改写为 /uploads/ab/cd/<文件名>，每批一个事务
+
+可重复运行、可中断后继续。未改写的旧链接在迁移后仍可访问 (按文件名回退到分片目录)。
+"""
+import sys
+import os
+import argparse
+import filecmp
+import json
+
+# 将后端目录添加到 sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import bindparam, select, update
+
+from app.db.session import SessionLocal
+from app.models.cost import Cost
+from app.models.order import Order
+from app.services import uploads
+
+def move_files(dry_run: bool):
+    """Move the files at the top of UPLOAD_DIR into their shards. Returns (moved, duplicates removed, skipped)."""
+    root = uploads.upload_dir()
+    moved = removed = skipped = 0
+    while True:
+        moved_in_pass = 0
+        # scandir streams the entries, the directory is never listed whole
+        with os.scandir(root) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") or not entry.is_file(follow_symlinks=False):
+                    continue
+                relative = uploads.shard_path(entry.name)
+                if relative == entry.name:
+                    continue
+                target = os.path.join(root, relative)
+                if dry_run:
+                    moved += 1
+                    continue
+                if os.path.exists(target):
+                    # Only an identical copy is dropped, a same-sized file may still differ
+                    if filecmp.cmp(entry.path, target, shallow=False):
+                        os.remove(entry.path)
+                        removed += 1
+                    else:
+                        print(f"跳过 {entry.name}: 分片目录中已有同名但内容不同的文件")
+                        skipped += 1
+                    continue
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(entry.path, target)
+                moved += 1
+                moved_in_pass += 1
+        # Entries moved while scanning may hide others, scan again until nothing moves
+        if dry_run or not moved_in_pass:
+            return moved, removed, skipped
+
+def _rewrite_attachments(value):
+    """New attachments JSON, None when nothing changed or it cannot be parsed."""
+    try:
+        items = json.loads(value)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(items, list):
+        return None
+    changed = False
+    for i, item in enumerate(items):
+        url = item.get("url") if isinstance(item, dict) else item
+        new_url = uploads.sharded_url(url) if isinstance(url, str) else None
+        if new_url:
+            changed = True
+            if isinstance(item, dict):
+                item["url"] = new_url
+            else:
+                items[i] = new_url
+    return json.dumps(items, ensure_ascii=False) if changed else None
+
+def _batches(db, columns, id_column, condition, batch_size: int):
+    last_id = None
+    while True:
+        stmt = select(id_column, *columns).where(condition).order_by(id_column).limit(batch_size)
+        if last_id is not None:
+            stmt = stmt.where(id_column > last_id)
+        rows = db.execute(stmt).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+def rewrite_costs(db, batch_size: int, dry_run: bool) -> int:
+    table = Cost.__table__
+    total = 0
+    for rows in _batches(db, [table.c.invoice_url], table.c.id, table.c.invoice_url.like(uploads.URL_PREFIX + "%"), batch_size):
+        changes = [{"_id": id, "_url": uploads.sharded_url(url)} for id, url in rows]
+        changes = [change for change in changes if change["_url"]]
+        if changes and not dry_run:
+            db.execute(
+                update(table).where(table.c.id == bindparam("_id")).values(invoice_url=bindparam("_url")),
+                changes
+            )
+            db.commit()
+        total += len(changes)
+    return total
+
+def rewrite_orders(db, batch_size: int, dry_run: bool) -> int:
+    table = Order.__table__
+    total = 0
+    for rows in _batches(db, [table.c.attachments], table.c.id, table.c.attachments.like(f"%{uploads.URL_PREFIX}%"), batch_size):
+        changes = [{"_id": id, "_attachments": _rewrite_attachments(value)} for id, value in rows]
+        changes = [change for change in changes if change["_attachments"]]
+        if changes and not dry_run:
+            # updated_at is kept: the orders did not change for their users
+            db.execute(
+                update(table).where(table.c.id == bindparam("_id")).values(
+                    attachments=bindparam("_attachments"), updated_at=table.c.updated_at
+                ),
+                changes
+            )
+            db.commit()
+        total += len(changes)
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description="上传文件迁移到分片目录结构")
+    parser.add_argument("--dry-run", action="store_true", help="只统计，不移动文件也不改写链接")
+    parser.add_argument("--batch-size", type=int, default=1000, help="每个事务改写的记录数")
+    args = parser.parse_args()
+
+    print(f"上传目录: {uploads.upload_dir()}")
+    moved, removed, skipped = move_files(args.dry_run)
+    print(f"{'待迁移' if args.dry_run else '已迁移'}文件 {moved} 个" + (f"，删除重复 {removed} 个" if removed else "") + (f"，跳过 {skipped} 个" if skipped else ""))
+    if args.dry_run:
+        print("(dry run: 链接只会统计指向已在分片目录中的文件的部分)")
+
+    db = SessionLocal()
+    try:
+        costs = rewrite_costs(db, args.batch_size, args.dry_run)
+        print(f"{'待改写' if args.dry_run else '已改写'}支出凭证链接 {costs} 条")
+        orders = rewrite_orders(db, args.batch_size, args.dry_run)
+        print(f"{'待改写' if args.dry_run else '已改写'}订单附件 {orders} 条")
+    except Exception as e:
+        print(f"迁移过程中发生错误: {e}")
+        db.rollback()
+        return 1
+    finally:
+        db.close()
+    print("迁移完成！")
+    return 0 if not skipped else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+import sys
+import os
+import argparse
+
+# 将后端目录添加到 sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.session import SessionLocal, engine
+from app.db.base import Base
+from app.core.config import settings
+
+# Try to import plugin models so they are registered with Base
+try:
+    from app.modules.plugins.commercial_kit import models
+    print("Loaded commercial_kit models for rebuild")
+except ImportError:
+    pass
+
+def rebuild_rollups(db, args):
+    from app.services import rollup
+    facts = args.facts or list(rollup.FACTS.keys())
+    unknown = [f for f in facts if f not in rollup.FACTS]
+    if unknown:
+        print(f"未知的汇总类型: {unknown}，可选: {list(rollup.FACTS.keys())}")
+        return 1
+    print(f"正在重建分析汇总表: {facts} ...")
+    counts = rollup.rebuild(db, facts)
+    for fact, count in counts.items():
+        print(f"  {fact}: {count} 行")
+    print("分析汇总表重建完成！")
+    return 0
+
+def rebuild_ledger(db, args):
+    from app.services import ledger
+    print("正在重建应收账款台账 ...")
+    count = ledger.rebuild(db)
+    print(f"应收账款台账重建完成，共 {count} 个结余检查点！")
+    return 0
+
+def rebuild_search(db, args):
+    from app.services import search
+    print("正在重建订单/客户搜索索引 ...")
+    count = search.rebuild(db)
+    print(f"搜索索引重建完成，共 {count} 条记录！")
+    return 0
+
+def rebuild_identities(db, args):
+    from app.services import client_identity
+    print("正在重建客户查重键 (企业名称/手机号/微信号) ...")
+    count, skipped = client_identity.rebuild(db)
+    print(f"客户查重键重建完成，共 {count} 个！")
+    if skipped:
+        print(f"有 {skipped} 个键被多个客户共用 (历史重复数据)，已保留给最早创建的客户。")
+    return 0
+
+def rebuild_client_stats(db, args):
+    from app.services import client_stats
+    print("正在重建客户统计 (订单数/销售额/已收/待收/授权数/最近跟进) ...")
+    count = client_stats.rebuild(db)
+    print(f"客户统计重建完成，共 {count} 个客户！")
+    return 0
+
+def rebuild_balances(db, args):
+    from app.services import order_balance
+    print("正在核对订单收款计数 (按收款记录全量重算) ...")
+    mismatches = order_balance.verify(db, fix=args.fix)
+    for m in mismatches[:50]:
+        print(f"  {m['order_no']}: 当前 {m['actual']} 应为 {m['expected']}")
+    if len(mismatches) > 50:
+        print(f"  ... 另有 {len(mismatches) - 50} 条")
+    if not mismatches:
+        print("核对完成，全部一致！")
+    elif args.fix:
+        print(f"已修复 {len(mismatches)} 个订单。")
+    else:
+        print(f"发现 {len(mismatches)} 个不一致的订单，使用 --fix 修复。")
+    return 0 if args.fix or not mismatches else 1
+
+def rebuild_thumbnails(db, args):
+    from app.services import thumbnails
+    if thumbnails.Image is None:
+        print("未安装 Pillow，无法生成缩略图 (pip install Pillow，PDF 预览另需 PyMuPDF)")
+        return 1
+    if thumbnails.fitz is None:
+        print("未安装 PyMuPDF，跳过 PDF 首页预览")
+    print(f"正在为已上传的图片/PDF 生成缺失的缩略图 {settings.THUMBNAIL_SIZES} ...")
+    files, written, failed = thumbnails.backfill(args.workers)
+    print(f"缩略图生成完成，{files} 个文件共 {written} 张！")
+    if failed:
+        print(f"有 {failed} 个文件无法生成缩略图 (文件损坏或格式不支持)，详见日志。")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="重建派生数据 (汇总表等)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p_rollups = subparsers.add_parser("rollups", help="全量重建分析日汇总表")
+    p_rollups.add_argument("facts", nargs="*", help="只重建指定类型: sales payments costs clients trials")
+    p_rollups.set_defaults(func=rebuild_rollups)
+
+    p_ledger = subparsers.add_parser("ledger", help="全量重建应收账款台账 (依赖销售/收款汇总表)")
+    p_ledger.set_defaults(func=rebuild_ledger)
+
+    p_search = subparsers.add_parser("search", help="全量重建订单/客户搜索索引")
+    p_search.set_defaults(func=rebuild_search)
+
+    p_identities = subparsers.add_parser("identities", help="全量重建客户查重键")
+    p_identities.set_defaults(func=rebuild_identities)
+
+    p_client_stats = subparsers.add_parser("client-stats", help="全量重建客户统计 (依赖订单收款计数)")
+    p_client_stats.set_defaults(func=rebuild_client_stats)
+
+    p_thumbnails = subparsers.add_parser("thumbnails", help="为已上传的图片/PDF 补生成缩略图")
+    p_thumbnails.add_argument("--workers", type=int, help="并行进程数，默认 THUMBNAIL_WORKERS")
+    p_thumbnails.set_defaults(func=rebuild_thumbnails)
+
+    p_balances = subparsers.add_parser("balances", help="按收款记录核对订单已收/退款计数")
+    p_balances.add_argument("--fix", action="store_true", help="修复不一致的订单")
+    p_balances.set_defaults(func=rebuild_balances)
+
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        return args.func(db, args)
+    except Exception as e:
+        print(f"重建过程中发生错误: {e}")
+        db.rollback()
+        return 1
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    sys.exit(main())